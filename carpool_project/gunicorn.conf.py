@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for production: the ASGI application on Uvicorn workers.
+
+    gunicorn -c carpool_project/gunicorn.conf.py
+
+Requires the serving packages in requirements.txt (gunicorn, uvicorn-worker).
+Every setting can be overridden from the environment or on the command line;
+``loadtest_servers`` runs the WSGI app with ``--worker-class gthread`` on the
+same config for comparison.
+"""
+import multiprocessing
+import os
+
+wsgi_app = os.getenv('GUNICORN_APP', 'carpool_project.asgi:application')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker')
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+# Each async worker multiplexes many connections (SSE streams included), so
+# one per core is enough; more only adds SQLite writer contention.
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+# Only used by the gthread worker class.
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+
+# Behind a proxy: keep idle client connections briefly, and give streams
+# time to end cleanly on reload.
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers now and then so slow leaks never accumulate; the jitter
+# keeps them from restarting all at once.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+# Workers import the app themselves, so none inherits a forked DB connection.
+preload_app = False
+
+forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '127.0.0.1')
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -26,6 +29,9 @@ SECRET_KEY = 'django-insecure-6(z4%b1x*4!xr^xj=(erf61$_h@26=vrf)jrin@x8t-gy5z+)m
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = os.getenv('DEBUG', 'True').lower() in ('true', '1', 'on')
 
+# Running under ``manage.py test``, which turns DEBUG off.
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = ['*']  # Allow all hosts for Docker development
 
 
@@ -42,15 +48,31 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'events.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'events.staticfiles.StaticFilesMiddleware',
+    # Profiles requests carrying a staff token, or sampled ones (events/profiling.py).
+    'events.profiling.ProfilingMiddleware',
+    # Picks the event's shard database; off with a single shard (events/sharding.py).
+    'events.sharding.ShardMiddleware',
+    # Rate limits and a concurrency cap for public writes (events/throttling.py).
+    'events.throttling.AdmissionMiddleware',
+    # Sessions and users exist for /admin/ only (see events/sessionless.py).
+    'events.sessionless.AdminSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'events.sessionless.AdminAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Flash messages in a signed cookie and the CSRF token in its own cookie, so
+# public pages never touch the session table. The session cookie is only
+# sent to the admin (keep this in step with its URL in urls.py).
+MESSAGE_STORAGE = 'events.sessionless.MessageCookieStorage'
+CSRF_USE_SESSIONS = False
+SESSION_COOKIE_PATH = '/admin/'
+
 ROOT_URLCONF = 'carpool_project.urls'
 
 TEMPLATES = [
@@ -73,14 +95,175 @@ WSGI_APPLICATION = 'carpool_project.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# DATABASE_ENGINE picks the backend:
+#
+# * 'sqlite' (default): WAL journaling so readers never block the writer,
+#   synchronous=NORMAL (durable at checkpoints, safe with WAL), a busy timeout
+#   instead of immediate "database is locked" errors, and BEGIN IMMEDIATE so
+#   writers queue up front rather than failing on lock upgrade. The backend in
+#   events/db_backends retries statements that still hit a lock.
+# * 'postgresql': uses psycopg, installed from requirements.txt.
+#   With DATABASE_POOL=1 connections come from a psycopg_pool pool per
+#   process; otherwise they are kept open for DATABASE_CONN_MAX_AGE seconds.
+#   Either way they are health-checked before reuse.
+
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASE_POOL = os.getenv('DATABASE_POOL', '0').lower() in ('true', '1', 'on')
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POSTGRES_DB', 'carpool'),
+            'USER': os.getenv('POSTGRES_USER', 'carpool'),
+            'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
+            'HOST': os.getenv('POSTGRES_HOST', 'localhost'),
+            'PORT': os.getenv('POSTGRES_PORT', '5432'),
+            # Pooled connections are returned to the pool, not kept per thread.
+            'CONN_MAX_AGE': 0 if DATABASE_POOL else int(os.getenv('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', 10)),
+                    'timeout': int(os.getenv('DATABASE_POOL_TIMEOUT', 10)),
+                },
+            } if DATABASE_POOL else {},
+        }
     }
+elif DATABASE_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'events.db_backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+                'transaction_mode': 'IMMEDIATE',
+                'lock_retries': int(os.getenv('SQLITE_LOCK_RETRIES', 3)),
+                'init_command': ';'.join([
+                    'PRAGMA journal_mode=WAL',
+                    'PRAGMA synchronous=NORMAL',
+                    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))}",
+                    # Negative values are in KiB.
+                    f"PRAGMA cache_size={-int(os.getenv('SQLITE_CACHE_SIZE_KB', 32 * 1024))}",
+                    'PRAGMA temp_store=MEMORY',
+                ]),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DATABASE_ENGINE must be 'sqlite' or 'postgresql', not {DATABASE_ENGINE!r}.")
+
+# EVENT_SHARD_COUNT > 1 spreads events over that many databases: 'default'
+# plus shard1, shard2, ... (SQLite: db.shard1.sqlite3 next to the default
+# file; PostgreSQL: <POSTGRES_DB>_shard1 on the same server). Each event with
+# its cars and members lives on one of them, so independent events never wait
+# for the same write lock. Run `manage.py migrate_shards` after changing the
+# count and `manage.py rebalance_shards` to move events onto new shards (see
+# events/sharding.py).
+
+EVENT_SHARD_COUNT = int(os.getenv('EVENT_SHARD_COUNT', 1))
+
+for _n in range(1, EVENT_SHARD_COUNT):
+    _shard = dict(DATABASES['default'])
+    if DATABASE_ENGINE == 'sqlite':
+        _path = Path(_shard['NAME'])
+        _shard['NAME'] = _path.with_name(f'{_path.stem}.shard{_n}{_path.suffix}')
+    else:
+        _shard['NAME'] = f"{_shard['NAME']}_shard{_n}"
+    DATABASES[f'shard{_n}'] = _shard
+
+EVENT_SHARDS = list(DATABASES)
+
+DATABASE_ROUTERS = ['events.sharding.EventShardRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# The 'dashboard' cache holds rendered event pages keyed by slug + version. It
+# must be shared by every worker process, so it defaults to a local SQLite file
+# with LRU eviction; point DASHBOARD_CACHE_BACKEND/LOCATION at e.g. Redis or
+# Memcached to share it across hosts.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'dashboard': {
+        'BACKEND': os.getenv('DASHBOARD_CACHE_BACKEND', 'events.cache_backends.SQLiteLRUCache'),
+        'LOCATION': os.getenv('DASHBOARD_CACHE_LOCATION', str(BASE_DIR / 'data' / 'cache.sqlite3')),
+        'TIMEOUT': int(os.getenv('DASHBOARD_CACHE_TIMEOUT', 24 * 60 * 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('DASHBOARD_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
 }
 
+DASHBOARD_CACHE_ALIAS = 'dashboard'
+
+# Rendered QR images: a per-process LRU in front of a content-addressed
+# directory shared by all workers (see events/qr.py).
+QR_CACHE_DIR = Path(os.getenv('QR_CACHE_DIR', BASE_DIR / 'data' / 'qr'))
+
+QR_MEMORY_CACHE_SIZE = int(os.getenv('QR_MEMORY_CACHE_SIZE', 256))
+
+# Threads per process that encode QR images for async views (0 = min(4, CPUs)).
+QR_RENDER_WORKERS = int(os.getenv('QR_RENDER_WORKERS', 0))
+
+# Old events are moved to compressed files here by `manage.py archive_events`
+# (default: older than EVENT_RETENTION_DAYS) and brought back with restore_event.
+EVENT_ARCHIVE_DIR = Path(os.getenv('EVENT_ARCHIVE_DIR', BASE_DIR / 'data' / 'archive'))
+
+EVENT_RETENTION_DAYS = int(os.getenv('EVENT_RETENTION_DAYS', 365))
+
+# /api/search/?q= lists matching events to anyone. Turn it off to keep event
+# links unlisted; per-event search (/api/events/<slug>/search/) stays on.
+PUBLIC_EVENT_SEARCH = os.getenv('PUBLIC_EVENT_SEARCH', '1').lower() in ('true', '1', 'on')
+
+# Request profiling (see events/profiling.py): a cProfile dump, the SQL and
+# template timings of requests carrying a staff token from the admin's
+# "Profiles" page, plus a random PROFILE_SAMPLE_RATE fraction of all others
+# (e.g. 0.001). The newest PROFILE_MAX_CAPTURES are kept in PROFILE_DIR.
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', BASE_DIR / 'data' / 'profiles'))
+
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+
+PROFILE_MAX_CAPTURES = int(os.getenv('PROFILE_MAX_CAPTURES', 200))
+
+PROFILE_MAX_QUERIES = int(os.getenv('PROFILE_MAX_QUERIES', 1000))
+
+PROFILE_TOKEN_MAX_AGE = int(os.getenv('PROFILE_TOKEN_MAX_AGE', 60 * 60))
+
+# Per-view request metrics are served at /metrics (see events/metrics.py).
+# When set, scrapers must send "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Admission control for public writes (see events/throttling.py). Token
+# buckets of (requests per minute, burst) per client address, per event and
+# for creating events per client, shared by all workers through
+# RATE_LIMIT_DB; a rate of 0 turns one off. Refused writes get a 429.
+RATE_LIMIT_DB = Path(os.getenv('RATE_LIMIT_DB', BASE_DIR / 'data' / 'ratelimit.sqlite3'))
+
+RATE_LIMITS = {
+    'client': (float(os.getenv('RATE_LIMIT_CLIENT_PER_MINUTE', 60)), int(os.getenv('RATE_LIMIT_CLIENT_BURST', 30))),
+    'event': (float(os.getenv('RATE_LIMIT_EVENT_PER_MINUTE', 600)), int(os.getenv('RATE_LIMIT_EVENT_BURST', 200))),
+    'create': (float(os.getenv('RATE_LIMIT_CREATE_PER_MINUTE', 5)), int(os.getenv('RATE_LIMIT_CREATE_BURST', 10))),
+}
+
+# Proxies in front of the app that append to X-Forwarded-For (0: use the
+# connection's address).
+RATE_LIMIT_PROXIES = int(os.getenv('RATE_LIMIT_PROXIES', 0))
+
+# Writes handled at once per process and database; the rest wait up to
+# WRITE_QUEUE_TIMEOUT seconds for a turn, then get a 503.
+WRITE_CONCURRENCY = int(os.getenv('WRITE_CONCURRENCY', 4))
+
+WRITE_QUEUE_TIMEOUT = float(os.getenv('WRITE_QUEUE_TIMEOUT', 1))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -118,6 +301,26 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# The stylesheet is built from assets/ (make css) and committed; in
+# production collectstatic fingerprints and precompresses everything into
+# STATIC_ROOT, which events.staticfiles.StaticFilesMiddleware serves. With
+# DEBUG and in tests nothing is collected, so the plain storage is used.
+STATICFILES_DIRS = [BASE_DIR / 'assets' / 'dist']
+
+STATIC_ROOT = Path(os.getenv('STATIC_ROOT', BASE_DIR / 'staticfiles'))
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG or TESTING
+            else 'events.staticfiles.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -17,7 +17,15 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from events.admin import choose_shard, profile_detail, profile_download, profiles
+from events.metrics import metrics_view
+
 urlpatterns = [
+    path('admin/shard/', choose_shard, name='admin_shard'),
+    path('admin/profiles/', profiles, name='admin_profiles'),
+    path('admin/profiles/<slug:capture_id>/', profile_detail, name='admin_profile'),
+    path('admin/profiles/<slug:capture_id>/download/', profile_download, name='admin_profile_download'),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('events.urls')),
 ]
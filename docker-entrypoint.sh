@@ -5,7 +5,7 @@ echo "Starting Django development server..."
 
 # Run migrations
 python manage.py makemigrations
-python manage.py migrate
+python manage.py migrate_shards
 
 # Start server
 exec python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
@@ -1,32 +1,386 @@
-from django.contrib import admin
-from .models import Event, Car, Member
+from collections import Counter, defaultdict
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.views.decorators.http import require_POST
+from .changes import car_payload, record_change
+from .exporting import CSV, NDJSON, roster_response
+from .forms import MoveMembersForm
+from .models import Event, EventShard, Car, CarFull, Member
+from .profiling import HEADER, PARAM, captures, load, profile_path, profile_token, stats_text
+from .search import filter_search
+from .sessionless import admin_prefix
+from .sharding import ADMIN_COOKIE, event_atomic, shards
+from .signals import changes_deferred
+
+
+def _export_action(fmt, compress, description):
+    def action(modeladmin, request, queryset):
+        # Cross-event report: one streamed file for every selected event.
+        filename = f"rosters-{timezone.now():%Y%m%d-%H%M%S}"
+        return roster_response(queryset.order_by().values('pk'), filename, fmt, compress)
+    action.__name__ = f"export_{fmt}{'_gz' if compress else ''}"
+    return admin.action(description=description)(action)
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Foreign key filter picked through the admin's autocomplete view instead
+    of listing every related object in the sidebar. Use as
+    ``list_filter = [('event', AutocompleteFilter)]``; the related model's
+    admin needs ``search_fields``.
+    """
+    template = 'admin/events/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_kwarg_isnull = f'{field_path}__isnull'
+        value = params.get(self.lookup_kwarg)
+        self.lookup_val = value[-1] if isinstance(value, list) else value
+        self.lookup_val_isnull = params.get(self.lookup_kwarg_isnull)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        # Bound to a form field so the widget can look up just the selected object.
+        self.widget = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(), required=False,
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+        ).widget
+        self.empty_value_display = model_admin.get_empty_value_display()
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg, self.lookup_kwarg_isnull]
+
+    def choices(self, changelist):
+        self.clear_url = changelist.get_query_string(remove=self.expected_parameters())
+        yield {
+            'selected': self.lookup_val is None and not self.lookup_val_isnull,
+            'query_string': self.clear_url,
+            'display': 'All',
+        }
+        if self.field.null:
+            yield {
+                'selected': bool(self.lookup_val_isnull),
+                'query_string': changelist.get_query_string({self.lookup_kwarg_isnull: 'True'}, [self.lookup_kwarg]),
+                'display': self.empty_value_display,
+            }
+
+    def rendered_widget(self):
+        # Only the selected object is loaded; the rest come from the autocomplete view.
+        return self.widget.render(self.lookup_kwarg, self.lookup_val, attrs={
+            'id': f'filter-{self.field_path}',
+            'data-filter-param': self.lookup_kwarg,
+            'data-filter-clear-url': self.clear_url,
+        })
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts exactly up to ``exact_limit`` rows, with a bounded subquery. Past
+    that, unfiltered lists use the row count from the planner statistics
+    (ANALYZE) and filtered ones stop at the limit. Without statistics, or
+    with ones older than the table's growth past the limit, it counts
+    exactly rather than guess.
+    """
+    exact_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        capped = queryset[:self.exact_limit + 1].count()
+        if capped <= self.exact_limit or queryset.query.where:
+            return capped
+        estimate = _estimated_rows(queryset)
+        if estimate is None or estimate <= self.exact_limit:
+            return queryset.count()
+        return estimate
+
+
+def _estimated_rows(queryset):
+    """The table's row count as of its last ANALYZE, or None if it has never been analyzed."""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # -1 until the first (auto)vacuum or ANALYZE.
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # Every index's statistics start with the table's row count.
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class _ChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        return queryset.only(*self.model_admin.list_only) if self.model_admin.list_only else queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelists that stay fast on tables with millions of rows: joined
+    related rows, only the ``list_only`` columns, estimated counts, no
+    facet counts, and searches (including autocompletes) answered from the
+    full-text index rather than ``LIKE`` scans over ``search_fields``.
+    """
+    list_only = ()
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    def get_changelist(self, request, **kwargs):
+        return _ChangeList
+    
+    def get_search_results(self, request, queryset, search_term):
+        return filter_search(queryset, search_term), False
+
+    @property
+    def media(self):
+        media = super().media
+        autocomplete = [
+            field for field, filter_class in (f for f in self.list_filter if isinstance(f, tuple))
+            if issubclass(filter_class, AutocompleteFilter)
+        ]
+        if autocomplete:
+            field = self.model._meta.get_field(autocomplete[0])
+            media += AutocompleteSelect(field, self.admin_site).media
+            media += forms.Media(js=['events/admin_filters.js'])
+        return media
 
 
 @admin.register(Event)
-class EventAdmin(admin.ModelAdmin):
+class EventAdmin(LargeTableAdmin):
     list_display = ['name', 'date', 'location', 'slug', 'created_at']
+    list_only = ['name', 'date', 'location', 'slug', 'created_at']
     list_filter = ['date', 'created_at']
     search_fields = ['name', 'location', 'slug']
     readonly_fields = ['slug', 'created_at']
     ordering = ['-created_at']
+    actions = [
+        _export_action(CSV, False, "Export rosters (CSV)"),
+        _export_action(CSV, True, "Export rosters (CSV, gzip)"),
+        _export_action(NDJSON, True, "Export rosters (NDJSON, gzip)"),
+    ]
+
+
+def _record_batches(changes_by_event):
+    for event_id, changes in changes_by_event.items():
+        if changes:
+            record_change(event_id, 'batch', {'changes': changes})
 
 
 @admin.register(Car)
-class CarAdmin(admin.ModelAdmin):
-    list_display = ['__str__', 'event', 'driver_name', 'capacity', 'created_at']
-    list_filter = ['event', 'created_at']
+class CarAdmin(LargeTableAdmin):
+    list_display = ['__str__', 'event', 'driver_name', 'capacity', 'seats_taken', 'created_at']
+    list_select_related = ['event']
+    list_only = ['driver_name', 'car_name', 'capacity', 'seats_taken', 'created_at', 'event', 'event__name']
+    list_filter = [('event', AutocompleteFilter), 'created_at']
     search_fields = ['driver_name', 'car_name', 'event__name']
+    autocomplete_fields = ['event']
     readonly_fields = ['created_at']
     ordering = ['-created_at']
+    actions = ['delete_empty_cars', 'recount_seats']
+
+    @admin.action(description="Delete selected cars that have no members", permissions=['delete'])
+    def delete_empty_cars(self, request, queryset):
+        empty = (
+            Car.objects.filter(pk__in=queryset.order_by().values('pk'), seats_taken=0)
+            .exclude(Exists(Member.objects.filter(car=OuterRef('pk'))))
+        )
+        with event_atomic():
+            deleted = list(empty.values_list('pk', 'event_id'))
+            with changes_deferred():
+                Car.objects.filter(pk__in=[pk for pk, _ in deleted]).delete()
+            changes = defaultdict(list)
+            for pk, event_id in deleted:
+                changes[event_id].append({'kind': 'car_deleted', 'payload': {'car': {'id': pk}}})
+            _record_batches(changes)
+        skipped = queryset.count() - len(deleted)
+        self.message_user(request, f"Deleted {len(deleted)} empty car(s)."
+                          + (f" Skipped {skipped} with members." if skipped else ""))
+
+    @admin.action(description="Recount seats taken in selected cars", permissions=['change'])
+    def recount_seats(self, request, queryset):
+        cars = Car.objects.filter(pk__in=queryset.order_by().values('pk'))
+        with event_atomic():
+            before = dict(cars.select_for_update().values_list('pk', 'seats_taken'))
+            updated = cars.recount_seats()
+            changes = defaultdict(list)
+            # Viewers and the cached dashboard only need to hear about the cars that changed.
+            for car in Car.objects.filter(pk__in=before):
+                if car.seats_taken != before[car.pk]:
+                    changes[car.event_id].append({'kind': 'car_saved', 'payload': {'car': car_payload(car)}})
+            _record_batches(changes)
+        self.message_user(request, f"Recounted seats in {updated} car(s).")
 
 
 @admin.register(Member)
-class MemberAdmin(admin.ModelAdmin):
+class MemberAdmin(LargeTableAdmin):
     list_display = ['name', 'event', 'car', 'contact', 'created_at']
-    list_filter = ['event', 'car', 'created_at']
+    list_select_related = ['event', 'car']
+    list_only = [
+        'name', 'contact', 'created_at', 'event', 'event__name',
+        'car', 'car__driver_name', 'car__car_name',
+    ]
+    list_filter = [('event', AutocompleteFilter), ('car', AutocompleteFilter), 'created_at']
     search_fields = ['name', 'contact', 'event__name']
+    autocomplete_fields = ['event', 'car']
     readonly_fields = ['created_at']
     ordering = ['-created_at']
+    actions = ['move_to_car', 'unassign']
+
+    @admin.action(description="Move selected members to a car…", permissions=['change'])
+    def move_to_car(self, request, queryset):
+        form = MoveMembersForm(request.POST if 'apply' in request.POST else None, admin_site=self.admin_site)
+        if not form.is_valid():
+            return TemplateResponse(request, 'admin/events/member/move_to_car.html', {
+                **self.admin_site.each_context(request),
+                'title': "Move members to a car",
+                'opts': self.model._meta,
+                'form': form,
+                'media': self.media + form.media,
+                'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+                'select_across': request.POST.get('select_across', '0'),
+                'count': queryset.count(),
+                'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+            })
+        car = form.cleaned_data['car']
+        members = (
+            Member.objects.filter(pk__in=queryset.order_by().values('pk'), event_id=car.event_id)
+            .exclude(car=car)
+        )
+        try:
+            with event_atomic():
+                moving = list(members.select_for_update().values('id', 'name', 'contact', 'car_id'))
+                deltas = Counter(row['car_id'] for row in moving if row['car_id'] is not None)
+                deltas = {car_id: -count for car_id, count in deltas.items()}
+                deltas[car.pk] = deltas.get(car.pk, 0) + len(moving)
+                Car.objects.apply_seat_deltas(deltas)
+                Member.objects.filter(pk__in=[row['id'] for row in moving]).update(car=car)
+                _record_batches({car.event_id: [
+                    {'kind': 'member_saved', 'payload': {'member': {**row, 'car_id': car.pk}}}
+                    for row in moving
+                ]})
+        except CarFull:
+            self.message_user(request, f"{car} does not have {len(moving)} free seat(s).", messages.ERROR)
+            return None
+        skipped = queryset.count() - len(moving)
+        self.message_user(request, f"Moved {len(moving)} member(s) to {car}."
+                          + (f" Skipped {skipped} already in it or from another event." if skipped else ""))
+        return None
+
+    @admin.action(description="Unassign selected members from their cars", permissions=['change'])
+    def unassign(self, request, queryset):
+        members = Member.objects.filter(pk__in=queryset.order_by().values('pk'), car__isnull=False)
+        with event_atomic():
+            moving = list(members.select_for_update().values('id', 'name', 'contact', 'car_id', 'event_id'))
+            Car.objects.apply_seat_deltas({
+                car_id: -count for car_id, count in Counter(row['car_id'] for row in moving).items()
+            })
+            Member.objects.filter(pk__in=[row['id'] for row in moving]).update(car=None)
+            changes = defaultdict(list)
+            for row in moving:
+                member = {'id': row['id'], 'name': row['name'], 'contact': row['contact'], 'car_id': None}
+                changes[row['event_id']].append({'kind': 'member_saved', 'payload': {'member': member}})
+            _record_batches(changes)
+        self.message_user(request, f"Unassigned {len(moving)} member(s).")
+
+
+@admin.register(EventShard)
+class EventShardAdmin(admin.ModelAdmin):
+    """The slug-to-shard directory; change it with the rebalance_shards command."""
+    list_display = ['slug', 'shard', 'pinned', 'moving']
+    list_filter = ['shard', 'pinned', 'moving']
+    search_fields = ['^slug']
+    
+    def has_add_permission(self, request):
+        return False
     
-    def get_queryset(self, request):
-        return super().get_queryset(request).select_related('event', 'car')
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@staff_member_required
+@require_POST
+def choose_shard(request):
+    """Switch the shard database the admin browses; the choice is kept in a cookie."""
+    response = redirect('admin:index')
+    alias = request.POST.get('shard')
+    if alias in shards():
+        response.set_cookie(ADMIN_COOKIE, alias, path=admin_prefix(), httponly=True, samesite='Lax')
+    return response
+
+
+PROFILE_SORTS = ('cumulative', 'tottime', 'ncalls')
+
+
+@staff_member_required
+def profiles(request):
+    """The slowest profiled requests, optionally of one view, and a token to profile pages by hand."""
+    records = captures()
+    views = sorted({record['view'] for record in records if record['view']})
+    view = request.GET.get('view')
+    if view:
+        records = [record for record in records if record['view'] == view]
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Profiled requests',
+        'captures': sorted(records, key=lambda record: record['ms'], reverse=True)[:100],
+        'views': views,
+        'view': view,
+        'token': profile_token(request.user),
+        'param': PARAM,
+        'header': HEADER,
+    }
+    return TemplateResponse(request, 'admin/events/profiles.html', context)
+
+
+@staff_member_required
+def profile_detail(request, capture_id):
+    """One profiled request: its SQL in order, its templates and its hottest functions."""
+    record = load(capture_id)
+    if record is None:
+        raise Http404
+    sort = request.GET.get('sort') if request.GET.get('sort') in PROFILE_SORTS else PROFILE_SORTS[0]
+    try:
+        stats = stats_text(capture_id, sort)
+    except (OSError, EOFError, ValueError):
+        stats = None    # rotated away meanwhile
+    context = {
+        **admin.site.each_context(request),
+        'title': f"{record['method']} {record['path']}",
+        'capture': record,
+        'stats': stats,
+        'sort': sort,
+        'sorts': PROFILE_SORTS,
+    }
+    return TemplateResponse(request, 'admin/events/profile_detail.html', context)
+
+
+@staff_member_required
+def profile_download(request, capture_id):
+    """The raw cProfile dump, for pstats or snakeviz."""
+    try:
+        dump = open(profile_path(capture_id), 'rb')
+    except OSError:
+        raise Http404
+    return FileResponse(dump, as_attachment=True, filename=f'{capture_id}.prof')
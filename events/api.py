@@ -0,0 +1,391 @@
+"""JSON API for events, cars and members.
+
+Besides one-object endpoints, ``batch`` applies a whole list of operations
+in one transaction with set-based queries, so reorganising an event is a
+single round trip instead of one form POST per change:
+
+    POST /api/events/<slug>/batch/
+    {"operations": [
+        {"op": "add_car", "ref": "van", "driver_name": "Ana", "capacity": 6},
+        {"op": "add_member", "name": "Ben", "car": "@van"},
+        {"op": "move_member", "member": 12, "car": 3},
+        {"op": "delete_member", "member": 14},
+        {"op": "delete_car", "car": 5}
+    ]}
+
+``car`` may be a car id, ``"@<ref>"`` for a car added in the same batch, or
+null for unassigned. Operations are validated with the same forms as the
+HTML views; if any fails, nothing is applied. Like the HTML forms, writes
+need the CSRF token, sent here in the ``X-CSRFToken`` header.
+"""
+import json
+from itertools import zip_longest
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+
+from .changes import car_payload, member_payload, record_change
+from .dashboard import build_dashboard
+from .forms import CarCreateForm, MemberCreateForm, MemberUpdateForm
+from .models import Car, CarFull, Event, Member
+from .search import search
+from .sharding import event_atomic, shards
+from .signals import changes_deferred, seats_released
+
+OPERATIONS = ('add_car', 'add_member', 'move_member', 'delete_member', 'delete_car')
+MAX_OPERATIONS = 1000
+MAX_SEARCH_RESULTS = 50
+
+
+class BatchError(Exception):
+    """Raised with per-operation errors when a batch cannot be applied."""
+
+    def __init__(self, errors, status=400):
+        super().__init__(errors)
+        self.errors = errors
+        self.status = status
+
+
+def serialize_event(dashboard):
+    """The full state of an event dashboard snapshot as JSON-ready data."""
+    def member(m):
+        return {'id': m.id, 'name': m.name, 'contact': m.contact, 'car_id': m.car_id}
+
+    return {
+        'event': {
+            'name': dashboard.name,
+            'slug': dashboard.slug,
+            'date': dashboard.date.isoformat() if dashboard.date else None,
+            'location': dashboard.location,
+            'car_count': dashboard.car_count,
+            'motorcycle_count': dashboard.motorcycle_count,
+        },
+        'cars': [
+            {
+                'id': car.id,
+                'driver_name': car.driver_name,
+                'car_name': car.car_name,
+                'capacity': car.capacity,
+                'notes': car.notes,
+                'is_motorcycle': car.is_motorcycle,
+                'member_count': car.member_count,
+                'available_spots': car.available_spots,
+                'members': [member(m) for m in car.members],
+            }
+            for car in dashboard.cars
+        ],
+        'unassigned_members': [member(m) for m in dashboard.unassigned_members],
+    }
+
+
+def _event_state(slug, status=200):
+    return JsonResponse(serialize_event(build_dashboard(slug)), status=status)
+
+
+def _json_body(request):
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        raise BatchError({'body': _messages('Request body must be valid JSON.')})
+    if not isinstance(body, dict):
+        raise BatchError({'body': _messages('Request body must be a JSON object.')})
+    return body
+
+
+def _messages(message, code='invalid'):
+    """An error list shaped like ``ErrorDict.get_json_data()`` entries."""
+    return [{'message': message, 'code': code}]
+
+
+def _error_response(error):
+    return JsonResponse({'errors': error.errors}, status=error.status)
+
+
+def _form_data(op, fields):
+    return {field: '' if op.get(field) is None else op[field] for field in fields if field in op}
+
+
+class Batch:
+    """Validates a list of operations, then applies them phase by phase."""
+
+    def __init__(self, event, operations):
+        self.event = event
+        self.operations = operations
+        self.errors = []
+        self.new_cars = []        # [(ref, Car)]
+        self.new_members = []     # [(Member, car ref or id)]
+        self.moves = {}           # member id -> car ref or id
+        self.deleted_members = set()
+        self.deleted_cars = set()
+
+    def _fail(self, index, errors):
+        self.errors.append({'index': index, 'errors': errors})
+
+    def _car_target(self, value, existing_cars, refs):
+        if value in (None, ''):
+            return None
+        if isinstance(value, str) and value.startswith('@'):
+            if value[1:] not in refs:
+                raise ValueError(f'Unknown car reference "{value}".')
+            return value
+        try:
+            car_id = int(value)
+        except (TypeError, ValueError):
+            raise ValueError('Select a valid car.')
+        if car_id not in existing_cars:
+            raise ValueError('Select a valid car. That choice is not one of the available choices.')
+        return car_id
+
+    def validate(self):
+        if not isinstance(self.operations, list) or not self.operations:
+            raise BatchError({'operations': _messages('Provide a non-empty list of operations.')})
+        if len(self.operations) > MAX_OPERATIONS:
+            raise BatchError({'operations': _messages(f'At most {MAX_OPERATIONS} operations per batch.')})
+
+        existing_cars = set(Car.objects.filter(event=self.event).values_list('pk', flat=True))
+        members = {
+            pk: (name, car_id)
+            for pk, name, car_id in Member.objects.filter(event=self.event).values_list('pk', 'name', 'car_id')
+        }
+        self.current_cars = {pk: car_id for pk, (_, car_id) in members.items()}
+        names = {name for name, _ in members.values()}
+        refs = {op.get('ref') for op in self.operations if isinstance(op, dict) and op.get('op') == 'add_car'}
+
+        for index, op in enumerate(self.operations):
+            kind = op.get('op') if isinstance(op, dict) else None
+            if kind not in OPERATIONS:
+                self._fail(index, {'op': _messages(f'Must be one of: {", ".join(OPERATIONS)}.')})
+                continue
+            try:
+                if kind == 'add_car':
+                    form = CarCreateForm(_form_data(op, CarCreateForm.Meta.fields))
+                    if not form.is_valid():
+                        self._fail(index, form.errors.get_json_data())
+                        continue
+                    car = form.save(commit=False)
+                    car.event = self.event
+                    self.new_cars.append((op.get('ref'), car))
+
+                elif kind == 'add_member':
+                    form = MemberCreateForm(_form_data(op, ('name', 'contact', 'pickup_lat', 'pickup_lng')), event=self.event)
+                    if not form.is_valid():
+                        self._fail(index, form.errors.get_json_data())
+                        continue
+                    member = form.save(commit=False)
+                    member.event = self.event
+                    if member.name in names:
+                        self._fail(index, {'name': _messages(f'A member named "{member.name}" already exists in this event.', 'unique')})
+                        continue
+                    names.add(member.name)
+                    self.new_members.append((member, self._car_target(op.get('car'), existing_cars, refs)))
+
+                elif kind == 'move_member':
+                    member_id = op.get('member')
+                    if member_id not in members:
+                        raise ValueError('Unknown member.')
+                    self.moves[member_id] = self._car_target(op.get('car'), existing_cars, refs)
+
+                elif kind == 'delete_member':
+                    if op.get('member') not in members:
+                        raise ValueError('Unknown member.')
+                    self.deleted_members.add(op['member'])
+
+                elif kind == 'delete_car':
+                    if op.get('car') not in existing_cars:
+                        raise ValueError('Unknown car.')
+                    self.deleted_cars.add(op['car'])
+            except ValueError as exc:
+                self._fail(index, {'__all__': _messages(str(exc))})
+
+        targets = [target for _, target in self.new_members] + list(self.moves.values())
+        if any(target in self.deleted_cars for target in targets):
+            self.errors.append({'index': None, 'errors': {'car': _messages('Cannot assign members to a car deleted in the same batch.')}})
+        if self.errors:
+            raise BatchError(self.errors)
+
+    def apply(self):
+        """Apply the validated batch; returns the change records for viewers."""
+        changes = []
+        with changes_deferred():
+            if self.new_cars:
+                created = Car.objects.bulk_create([car for _, car in self.new_cars])
+                changes += [{'kind': 'car_saved', 'payload': {'car': car_payload(car)}} for car in created]
+            cars_by_ref = {ref: car.pk for ref, car in self.new_cars if ref}
+
+            def resolve(target):
+                return cars_by_ref[target[1:]] if isinstance(target, str) else target
+
+            if self.new_members:
+                for member, target in self.new_members:
+                    member.car_id = resolve(target)
+                created = Member.objects.bulk_create([member for member, _ in self.new_members])
+                changes += [{'kind': 'member_saved', 'payload': {'member': member_payload(m)}} for m in created]
+
+            moves = {pk: target for pk, target in self.moves.items() if pk not in self.deleted_members}
+            moved = []
+            if moves:
+                moved = list(Member.objects.filter(event=self.event, pk__in=moves))
+                for member in moved:
+                    member.car_id = resolve(moves[member.pk])
+                Member.objects.bulk_update(moved, ['car'])
+                changes += [{'kind': 'member_saved', 'payload': {'member': member_payload(m)}} for m in moved]
+
+            # Seats for joins, moves and deletions, all in one update.
+            deltas = {}
+            for member, _ in self.new_members:
+                if member.car_id is not None:
+                    deltas[member.car_id] = deltas.get(member.car_id, 0) + 1
+            for member in moved:
+                previous = self.current_cars[member.pk]
+                if previous != member.car_id:
+                    if previous is not None:
+                        deltas[previous] = deltas.get(previous, 0) - 1
+                    if member.car_id is not None:
+                        deltas[member.car_id] = deltas.get(member.car_id, 0) + 1
+            for pk in self.deleted_members:
+                previous = self.current_cars[pk]
+                if previous is not None:
+                    deltas[previous] = deltas.get(previous, 0) - 1
+            Car.objects.apply_seat_deltas(deltas)
+
+            if self.deleted_members:
+                with seats_released():
+                    Member.objects.filter(event=self.event, pk__in=self.deleted_members).delete()
+                changes += [{'kind': 'member_deleted', 'payload': {'member': {'id': pk}}} for pk in self.deleted_members]
+
+            if self.deleted_cars:
+                Car.objects.filter(event=self.event, pk__in=self.deleted_cars).delete()
+                changes += [{'kind': 'car_deleted', 'payload': {'car': {'id': pk}}} for pk in self.deleted_cars]
+
+        record_change(self.event.pk, 'batch', {'changes': changes})
+        return changes
+
+
+@require_http_methods(['GET'])
+def event_state(request, slug):
+    """The event with all of its cars and members."""
+    return _event_state(slug)
+
+
+@require_http_methods(['POST'])
+def batch(request, slug):
+    """Apply a list of operations atomically and return the resulting event state."""
+    event = get_object_or_404(Event, slug=slug)
+    try:
+        pending = Batch(event, _json_body(request).get('operations'))
+        with event_atomic():
+            pending.validate()
+            pending.apply()
+    except BatchError as error:
+        return _error_response(error)
+    except CarFull as full:
+        return _error_response(BatchError({'car': _messages(f'No free seats left in car(s) {", ".join(map(str, full.car_ids))}.', 'full')}, status=409))
+    except IntegrityError:
+        return _error_response(BatchError({'__all__': _messages('The event changed while applying the batch; please retry.')}, status=409))
+    return _event_state(slug)
+
+
+@require_http_methods(['POST'])
+def create_car(request, slug):
+    event = get_object_or_404(Event, slug=slug)
+    try:
+        form = CarCreateForm(_form_data(_json_body(request), CarCreateForm.Meta.fields))
+    except BatchError as error:
+        return _error_response(error)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    car = form.save(commit=False)
+    car.event = event
+    car.save()
+    return JsonResponse({'car': car_payload(car)}, status=201)
+
+
+@require_http_methods(['DELETE'])
+def delete_car(request, slug, car_id):
+    car = get_object_or_404(Car, id=car_id, event__slug=slug)
+    car.delete()
+    return HttpResponse(status=204)
+
+
+@require_http_methods(['POST'])
+def create_member(request, slug):
+    event = get_object_or_404(Event, slug=slug)
+    try:
+        form = MemberCreateForm(_form_data(_json_body(request), MemberCreateForm.Meta.fields), event=event)
+    except BatchError as error:
+        return _error_response(error)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    member = form.save(commit=False)
+    member.event = event
+    try:
+        with event_atomic():
+            member.save()
+    except CarFull:
+        return JsonResponse({'errors': {'car': _messages(f'{member.car} is full.', 'full')}}, status=409)
+    except IntegrityError:
+        return JsonResponse({'errors': {'name': _messages(f'A member named "{member.name}" already exists in this event.', 'unique')}}, status=409)
+    return JsonResponse({'member': member_payload(member)}, status=201)
+
+
+@require_http_methods(['PATCH', 'DELETE'])
+def member_detail(request, slug, member_id):
+    """Move a member to another car (PATCH {"car": id|null}) or remove them."""
+    member = get_object_or_404(Member.objects.select_related('event'), id=member_id, event__slug=slug)
+    if request.method == 'DELETE':
+        member.delete()
+        return HttpResponse(status=204)
+    try:
+        form = MemberUpdateForm(_form_data(_json_body(request), MemberUpdateForm.Meta.fields), instance=member, event=member.event)
+    except BatchError as error:
+        return _error_response(error)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors.get_json_data()}, status=400)
+    try:
+        form.save()
+    except CarFull:
+        return JsonResponse({'errors': {'car': _messages(f'{member.car} is full.', 'full')}}, status=409)
+    return JsonResponse({'member': member_payload(member)})
+
+
+def _search_limit(request):
+    try:
+        return min(max(int(request.GET.get('limit', 20)), 1), MAX_SEARCH_RESULTS)
+    except ValueError:
+        return 20
+
+
+@require_http_methods(['GET'])
+def search_events(request):
+    """Events whose name, location or slug match ``?q=``, best first."""
+    if not settings.PUBLIC_EVENT_SEARCH:
+        raise Http404
+    limit = _search_limit(request)
+    # Ranks are per shard, so interleave each shard's best matches.
+    ranked = [search(Event, request.GET.get('q', ''), limit=limit, using=alias) for alias in shards()]
+    events = [event for rank in zip_longest(*ranked) for event in rank if event is not None][:limit]
+    return JsonResponse({'results': [
+        {
+            'name': event.name,
+            'slug': event.slug,
+            'date': event.date.isoformat() if event.date else None,
+            'location': event.location,
+            'url': reverse('event_detail', kwargs={'slug': event.slug}),
+        }
+        for event in events
+    ]})
+
+
+@require_http_methods(['GET'])
+def search_event(request, slug):
+    """The event's cars and members matching ``?q=``, best first."""
+    event = get_object_or_404(Event.objects.only('pk'), slug=slug)
+    text, limit = request.GET.get('q', ''), _search_limit(request)
+    return JsonResponse({
+        'cars': [car_payload(car) for car in search(Car, text, event=event, limit=limit)],
+        'members': [member_payload(member) for member in search(Member, text, event=event, limit=limit)],
+    })
@@ -0,0 +1,188 @@
+"""Moving old events out of the live tables into compressed archive files.
+
+Each archived event becomes ``<slug>.ndjson.gz`` in ``EVENT_ARCHIVE_DIR``:
+one JSON line for the event, then one per car and one per member, written
+while the rows are streamed from the database. The file is fsynced and
+renamed into place before the event is deleted, so a crash never loses an
+event. The change log is not archived; restored events start a new one
+after their archived version, so open pages simply reload.
+"""
+import gzip
+import json
+import os
+import tempfile
+from datetime import timedelta
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .changes import event_payload, record_change
+from .models import Car, Event, Member
+from .sharding import event_atomic
+
+FORMAT = 1
+SUFFIX = '.ndjson.gz'
+CHUNK_SIZE = 2000
+BATCH_SIZE = 500
+
+EVENT_FIELDS = ('name', 'date', 'location', 'slug', 'version', 'changed_at', 'created_at')
+CAR_FIELDS = ('id', 'driver_name', 'car_name', 'capacity', 'notes', 'start_lat', 'start_lng', 'created_at')
+MEMBER_FIELDS = ('name', 'contact', 'car_id', 'pickup_lat', 'pickup_lng', 'created_at')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_dir():
+    return Path(getattr(settings, 'EVENT_ARCHIVE_DIR', settings.BASE_DIR / 'data' / 'archive'))
+
+
+def archive_path(slug, directory=None):
+    return Path(directory or archive_dir()) / f'{slug}{SUFFIX}'
+
+
+def archivable(days):
+    """Events created, held and last changed more than ``days`` days ago, oldest first."""
+    cutoff = timezone.now() - timedelta(days=days)
+    return (
+        Event.objects.filter(created_at__lt=cutoff, changed_at__lt=cutoff)
+        .filter(Q(date__isnull=True) | Q(date__lt=cutoff.date()))
+        .order_by('created_at')
+    )
+
+
+def _line(kind, values):
+    return json.dumps({kind: values}, separators=(',', ':'), default=str).encode() + b'\n'
+
+
+def write_archive(event, directory=None):
+    """Write ``event`` with its cars and members to its archive file; returns the path."""
+    path = archive_path(event.slug, directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            with gzip.GzipFile(filename=path.name, mode='wb', fileobj=raw, mtime=0) as out:
+                out.write(_line('event', {'format': FORMAT, **{f: getattr(event, f) for f in EVENT_FIELDS}}))
+                cars = Car.objects.filter(event=event).order_by('created_at', 'pk').values(*CAR_FIELDS)
+                for car in cars.iterator(chunk_size=CHUNK_SIZE):
+                    out.write(_line('car', car))
+                members = Member.objects.filter(event=event).order_by('created_at', 'pk').values(*MEMBER_FIELDS)
+                for member in members.iterator(chunk_size=CHUNK_SIZE):
+                    out.write(_line('member', member))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return path
+
+
+def archive_events(events, directory=None):
+    """
+    Archive and delete ``events`` (one short transaction for the whole list);
+    returns their slugs. The cascaded cars and members still send their
+    post_delete signals, but ``signals._deleting_event`` has them skip the
+    seat release and change log.
+    """
+    events = list(events)
+    for event in events:
+        write_archive(event, directory)
+    with event_atomic():
+        Event.objects.filter(pk__in=[event.pk for event in events]).delete()
+    return [event.slug for event in events]
+
+
+def refresh_statistics():
+    """
+    Re-analyze the event tables after archiving shrank them, so the admin's
+    row estimates follow. PostgreSQL's autovacuum does this by itself.
+    """
+    connection = connections[router.db_for_write(Event)]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for model in (Event, Car, Member):
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+
+def _read(path):
+    with gzip.open(path, 'rb') as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _timestamp(value):
+    return parse_datetime(value) if value else timezone.now()
+
+
+def restore_event(slug, directory=None, keep=False):
+    """
+    Recreate an archived event under its slug; returns it. The archive
+    file is removed afterwards unless ``keep``.
+    """
+    path = archive_path(slug, directory)
+    if not path.exists():
+        raise ArchiveError(f"No archive for {slug!r} in {path.parent}.")
+    if Event.objects.filter(slug=slug).exists():
+        raise ArchiveError(f"An event with slug {slug!r} already exists.")
+
+    records = _read(path)
+    head = next(records, {}).get('event')
+    if not head or head.get('format') != FORMAT:
+        raise ArchiveError(f"{path} is not a version {FORMAT} event archive.")
+
+    with event_atomic():
+        event = Event.objects.create(
+            name=head['name'], slug=head['slug'], location=head['location'],
+            date=parse_date(head['date']) if head['date'] else None,
+        )
+        # auto_now_add and the version counter ignore assigned values.
+        Event.objects.filter(pk=event.pk).update(
+            version=head['version'], changed_at=_timestamp(head['changed_at']),
+            created_at=_timestamp(head['created_at']),
+        )
+        car_ids = {}
+        for batch in _batches(records, BATCH_SIZE):
+            # Archives written before coordinates existed simply lack them.
+            cars = [(row['car'], Car(event=event, **{
+                field: row['car'][field] for field in CAR_FIELDS
+                if field not in ('id', 'created_at') and field in row['car']
+            })) for row in batch if 'car' in row]
+            members = [row['member'] for row in batch if 'member' in row]
+            if cars:
+                created = Car.objects.bulk_create([car for _, car in cars])
+                for (values, car), saved in zip(cars, created):
+                    car_ids[values['id']] = saved.pk
+                    saved.created_at = _timestamp(values['created_at'])
+                Car.objects.bulk_update(created, ['created_at'])
+            if members:
+                created = Member.objects.bulk_create([
+                    Member(event=event, name=values['name'], contact=values['contact'],
+                           car_id=car_ids.get(values['car_id']),
+                           pickup_lat=values.get('pickup_lat'), pickup_lng=values.get('pickup_lng'))
+                    for values in members
+                ])
+                for values, saved in zip(members, created):
+                    saved.created_at = _timestamp(values['created_at'])
+                Member.objects.bulk_update(created, ['created_at'])
+        Car.objects.filter(event=event).recount_seats()
+        # Starts the change log right after the archived version.
+        record_change(event.pk, 'event_updated', {'event': event_payload(event)})
+
+    if not keep:
+        path.unlink()
+    return event
@@ -0,0 +1,208 @@
+"""Automatic seat assignment for unassigned members.
+
+Planning loads the event's cars (with seats taken) and unassigned members
+in two queries, allocates seats with plain arrays of free-seat counts, and
+applies the result with a single UPDATE. Nothing is written until
+``apply_assignment`` is called, so a plan doubles as a dry-run preview.
+
+Seat rules:
+
+* cars with ``capacity=None`` have an unknown number of seats and are skipped
+  unless a ``default_capacity`` is given;
+* motorcycles (``car_name`` "motorcycle", as on the event page) take one
+  rider unless a capacity is set, and are only used once every car is full;
+* ``nearest`` seats members with a pickup point at the closest car with a
+  start point (see ``geo``), then balances everyone left over the seats
+  that remain.
+"""
+import heapq
+from array import array
+from collections import Counter, defaultdict
+
+from django.db.models import Case, IntegerField, Value, When
+
+from .changes import record_change
+from .dashboard import MOTORCYCLE
+from .geo import match_nearest
+from .models import Car, Member
+from .sharding import event_atomic
+
+BALANCE = 'balance'
+FILL = 'fill'
+NEAREST = 'nearest'
+STRATEGIES = {
+    BALANCE: 'Balance by free seats',
+    FILL: 'Fill cars first',
+    NEAREST: 'Nearest car to pickup point',
+}
+MOTORCYCLE_SEATS = 1
+
+
+def allocate(free_seats, count, strategy=BALANCE):
+    """
+    Place up to ``count`` riders into cars with the given free seats.
+
+    Returns an array of car indexes, one per placed rider, in rider order.
+    ``balance`` always picks the car with the most free seats left (ties go
+    to the earlier car); ``fill`` fills each car before moving on.
+    """
+    if strategy not in (BALANCE, FILL):
+        raise ValueError(f'Unknown strategy: {strategy!r}')
+    free = array('l', free_seats)
+    placed = array('l')
+
+    if strategy == FILL:
+        index = 0
+        while len(placed) < count:
+            while index < len(free) and free[index] <= 0:
+                index += 1
+            if index == len(free):
+                break
+            take = min(free[index], count - len(placed))
+            placed.extend([index] * take)
+            free[index] -= take
+        return placed
+
+    heap = [(-seats, index) for index, seats in enumerate(free) if seats > 0]
+    heapq.heapify(heap)
+    while heap and len(placed) < count:
+        seats, index = heap[0]
+        placed.append(index)
+        if seats < -1:
+            heapq.heapreplace(heap, (seats + 1, index))
+        else:
+            heapq.heappop(heap)
+    return placed
+
+
+class AssignmentPlan:
+    """The outcome of planning: which unassigned member goes to which car."""
+
+    def __init__(self, event, strategy, cars, assignments, unplaced, distances=()):
+        self.event = event
+        self.strategy = strategy
+        self.cars = cars                  # [(car id, label, seats added)]
+        self.assignments = assignments    # [(member id, name, contact, car id)]
+        self.unplaced = unplaced
+        self.distances = distances        # km from pickup to start, per nearest match
+
+    def summary(self):
+        placed = len(self.assignments)
+        if not placed:
+            return f'No free seats for the {self.unplaced} unassigned member(s).'
+        text = f'{placed} member(s) placed in {sum(1 for car in self.cars if car[2])} car(s)'
+        if self.distances:
+            text += (f', {len(self.distances)} by pickup point'
+                     f' ({sum(self.distances) / len(self.distances):.1f} km on average)')
+        if self.unplaced:
+            text += f'; {self.unplaced} still unassigned'
+        return text + '.'
+
+
+def _point(latitude, longitude):
+    return None if latitude is None or longitude is None else (latitude, longitude)
+
+
+def _tier_seats(rows, default_capacity):
+    """Split cars into (regular cars, motorcycles) with their free seats and start points."""
+    tiers = ([], [])
+    for car_id, label, capacity, car_name, member_count, latitude, longitude in rows:
+        is_motorcycle = (car_name or '').lower() == MOTORCYCLE
+        if capacity is None:
+            capacity = MOTORCYCLE_SEATS if is_motorcycle else default_capacity
+        if capacity is None:
+            continue
+        tiers[is_motorcycle].append((car_id, label, max(0, capacity - member_count), _point(latitude, longitude)))
+    return tiers
+
+
+def _place_nearest(members, tier, free, distances):
+    """Seat located members at the nearest located cars; returns (member, car index) pairs."""
+    riders = [member for member in members if member[3] is not None]
+    located = [index for index, car in enumerate(tier) if car[3] is not None]
+    matches = match_nearest(
+        [member[3] for member in riders], [tier[index][3] for index in located],
+        [free[index] for index in located],
+    )
+    placed = []
+    for member, match in zip(riders, matches):
+        if match is not None:
+            index = located[match[0]]
+            placed.append((member, index))
+            free[index] -= 1
+            distances.append(match[1])
+    return placed
+
+
+def plan_assignment(event, strategy=BALANCE, default_capacity=None):
+    """Plan seats for every unassigned member of ``event`` without saving anything."""
+    rows = (
+        Car.objects.filter(event=event)
+        .order_by('created_at', 'pk')
+        .values_list('pk', 'driver_name', 'capacity', 'car_name', 'seats_taken', 'start_lat', 'start_lng')
+    )
+    members = [
+        (pk, name, contact, _point(latitude, longitude))
+        for pk, name, contact, latitude, longitude in (
+            Member.objects.filter(event=event, car__isnull=True)
+            .order_by('created_at', 'pk')
+            .values_list('pk', 'name', 'contact', 'pickup_lat', 'pickup_lng')
+        )
+    ]
+
+    assignments = []
+    summary = []
+    distances = []
+    remaining = members
+    for tier in _tier_seats(rows, default_capacity):
+        free = [seats for _, _, seats, _ in tier]
+        placed = _place_nearest(remaining, tier, free, distances) if strategy == NEAREST else []
+        if placed:
+            seated = {member[0] for member, _ in placed}
+            remaining = [member for member in remaining if member[0] not in seated]
+        indexes = allocate(free, len(remaining), FILL if strategy == FILL else BALANCE)
+        placed += zip(remaining, indexes)
+        remaining = remaining[len(indexes):]
+        added = array('l', [0]) * len(tier)
+        for member, index in placed:
+            assignments.append((*member[:3], tier[index][0]))
+            added[index] += 1
+        summary += [(car_id, label, added[i]) for i, (car_id, label, _, _) in enumerate(tier)]
+
+    return AssignmentPlan(event, strategy, summary, assignments, len(remaining), distances)
+
+
+def apply_assignment(plan):
+    """
+    Write a plan with one UPDATE and publish it as a single change.
+    Members assigned by someone else since planning are left alone; raises
+    ``CarFull`` (writing nothing) if a car filled up in the meantime.
+    """
+    if not plan.assignments:
+        return 0
+    with event_atomic():
+        # Locked, so concurrent assignments on PostgreSQL cannot both seat a member.
+        still_unassigned = set(
+            Member.objects.filter(pk__in=[row[0] for row in plan.assignments], car__isnull=True)
+            .select_for_update().order_by('pk').values_list('pk', flat=True)
+        )
+        assignments = [row for row in plan.assignments if row[0] in still_unassigned]
+        if not assignments:
+            return 0
+        Car.objects.apply_seat_deltas(Counter(car_id for *_, car_id in assignments))
+        # Branch per car rather than per member, as bulk_update would; building
+        # thousands of CASE branches costs more than running the statement.
+        riders = defaultdict(list)
+        for pk, _, _, car_id in assignments:
+            riders[car_id].append(pk)
+        Member.objects.filter(event=plan.event, car__isnull=True).update(car_id=Case(
+            *[When(pk__in=pks, then=Value(car_id)) for car_id, pks in riders.items()],
+            default=None, output_field=IntegerField(),
+        ))
+        record_change(plan.event.pk, 'batch', {'changes': [
+            {'kind': 'member_saved', 'payload': {'member': {
+                'id': pk, 'name': name, 'contact': contact, 'car_id': car_id,
+            }}}
+            for pk, name, contact, car_id in assignments
+        ]})
+    return len(assignments)
@@ -0,0 +1,320 @@
+"""Synthetic events and per-view scenarios for the ``benchmark_views`` command.
+
+``populate(size)`` builds an event with ``size`` members spread over cars
+(a few left unassigned) using bulk inserts. Each scenario prepares whatever
+it mutates outside the measurement and returns a callable that issues one
+request through the test client; ``measure`` times that call and counts its
+SQL queries. Streaming responses are consumed inside the measurement.
+"""
+import statistics
+import time
+from datetime import date
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .caching import dashboard_cache
+from .changes import event_payload, record_change
+from .dashboard import car_options, car_page
+from .models import Car, Event, Member
+from .qr import encode_qr
+
+SIZES = (10, 100, 1000, 10000)
+UNASSIGNED = 5
+SEATED_PER_CAR = 4
+CAPACITY = 5
+
+
+def admission_settings(scratch):
+    """
+    Settings keeping admission control in the measured path, with a
+    throwaway bucket file and rate limits no benchmark run reaches.
+    """
+    return {
+        'RATE_LIMIT_DB': Path(scratch) / 'ratelimit.sqlite3',
+        'RATE_LIMITS': {name: (10 ** 9, 10 ** 9) for name in settings.RATE_LIMITS},
+    }
+
+
+class Fixture:
+    """A populated benchmark event plus counters for unique names."""
+
+    def __init__(self, event):
+        self.event = event
+        self.slug = event.slug
+        self.serial = 0
+
+    def name(self, prefix):
+        self.serial += 1
+        return f'{prefix} {self.serial}'
+
+    def car(self, capacity=CAPACITY):
+        return Car.objects.create(event=self.event, driver_name=self.name('Driver'), capacity=capacity)
+
+    def member(self, car=None):
+        return Member.objects.create(event=self.event, name=self.name('Rider'), car=car)
+
+    def url(self, name, **kwargs):
+        return reverse(name, kwargs={'slug': self.slug, **kwargs})
+
+    def version(self):
+        return Event.objects.filter(pk=self.event.pk).values_list('version', flat=True).get()
+
+
+def populate(size):
+    """Create an event with ``size`` members; all but ``UNASSIGNED`` are seated."""
+    event = Event.objects.create(name=f'Benchmark {size}', date=date(2030, 1, 1), location='Benchmark hall')
+    seated = max(0, size - UNASSIGNED)
+    cars = Car.objects.bulk_create([
+        Car(event=event, driver_name=f'Driver {i}', car_name='Car', capacity=CAPACITY)
+        for i in range(max(1, -(-seated // SEATED_PER_CAR)))
+    ])
+    Member.objects.bulk_create(
+        [
+            Member(event=event, name=f'Member {i}', contact=f'member{i}@example.com',
+                   car_id=cars[i // SEATED_PER_CAR].pk if i < seated else None)
+            for i in range(size)
+        ],
+        batch_size=1000,
+    )
+    Car.objects.filter(event=event).recount_seats()
+    record_change(event.pk, 'event_updated', {'event': event_payload(event)})
+    return Fixture(event)
+
+
+def _consume(response):
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def _stream_head(response, messages=2):
+    """Read the first SSE messages of an endless stream, then close it."""
+    content = iter(response.streaming_content)
+    for _ in range(messages):
+        next(content)
+    response.close()
+    return response
+
+
+# Each scenario: (name, URL name, expected status, setup(fixture, client) -> request(client)).
+
+def _home(fx, client):
+    return lambda c: c.get(reverse('home'))
+
+
+def _home_create(fx, client):
+    return lambda c: c.post(reverse('home'), {'name': fx.name('Event')})
+
+
+def _detail_cold(fx, client):
+    dashboard_cache().clear()
+    return lambda c: c.get(fx.url('event_detail'))
+
+
+def _detail_cached(fx, client):
+    client.get(fx.url('event_detail'))
+    return lambda c: c.get(fx.url('event_detail'))
+
+
+def _detail_not_modified(fx, client):
+    client.get(fx.url('event_detail'))    # sets the CSRF cookie, which is part of the ETag
+    etag = client.get(fx.url('event_detail'))['ETag']
+    return lambda c: c.get(fx.url('event_detail'), HTTP_IF_NONE_MATCH=etag)
+
+
+def _after(cursor):
+    return {'after': cursor} if cursor else {}
+
+
+def _car_page(fx, client):
+    after = car_page(fx.event.pk)[1]
+    return lambda c: c.get(fx.url('event_cars'), _after(after))
+
+
+def _changed_cars(fx, client):
+    ids = list(Car.objects.filter(event=fx.event).order_by('-pk').values_list('pk', flat=True)[:3])
+    return lambda c: c.get(fx.url('event_cars'), {'id': ids})
+
+
+def _unassigned_page(fx, client):
+    return lambda c: c.get(fx.url('event_unassigned'))
+
+
+def _car_options(fx, client):
+    after = car_options(fx.event.pk)[1]
+    return lambda c: c.get(fx.url('event_car_options'), {'q': 'driver', **_after(after)})
+
+
+def _qr(fx, client):
+    return lambda c: c.get(fx.url('event_qr'))
+
+
+def _changes(fx, client):
+    after = fx.version() - 1
+    return lambda c: c.get(fx.url('event_changes'), {'after': after})
+
+
+def _stream(fx, client):
+    after = fx.version() - 1
+    return lambda c: _stream_head(c.get(fx.url('event_stream'), {'after': after}))
+
+
+def _add_car(fx, client):
+    return lambda c: c.post(fx.url('add_car'), {'driver_name': fx.name('Driver'), 'capacity': CAPACITY})
+
+
+def _add_member(fx, client):
+    car = fx.car()
+    return lambda c: c.post(fx.url('add_member'), {'name': fx.name('Rider'), 'car': car.pk})
+
+
+def _add_member_fragment(fx, client):
+    car = fx.car()
+    return lambda c: c.post(fx.url('add_member'), {'name': fx.name('Rider'), 'car': car.pk},
+                            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+
+def _update_member(fx, client):
+    member, car = fx.member(), fx.car()
+    return lambda c: c.post(fx.url('update_member', member_id=member.pk), {'car': car.pk})
+
+
+def _delete_member(fx, client):
+    member = fx.member(fx.car())
+    return lambda c: c.post(fx.url('delete_member', member_id=member.pk))
+
+
+def _delete_car(fx, client):
+    car = fx.car()
+    fx.member(car)
+    fx.member(car)
+    return lambda c: c.post(fx.url('delete_car', car_id=car.pk))
+
+
+def _auto_assign(fx, client):
+    fx.car()
+    for _ in range(UNASSIGNED):
+        fx.member()
+    return lambda c: c.post(fx.url('auto_assign'), {'strategy': 'balance'})
+
+
+def _import(fx, client):
+    text = '\n'.join(fx.name('Imported') for _ in range(5))
+    return lambda c: c.post(fx.url('import_data'), {'kind': 'members', 'text': text})
+
+
+def _export(fx, client):
+    return lambda c: _consume(c.get(fx.url('event_export')))
+
+
+def _api_event(fx, client):
+    return lambda c: c.get(fx.url('api_event'))
+
+
+def _api_search(fx, client):
+    return lambda c: c.get(reverse('api_search'), {'q': fx.event.name.split()[0]})
+
+
+def _api_event_search(fx, client):
+    return lambda c: c.get(fx.url('api_event_search'), {'q': 'mem 1'})
+
+
+def _api_batch(fx, client):
+    moved, removed = fx.member(), fx.member()
+    operations = [
+        {'op': 'add_car', 'ref': 'new', 'driver_name': fx.name('Driver'), 'capacity': CAPACITY},
+        {'op': 'add_member', 'name': fx.name('Rider'), 'car': '@new'},
+        {'op': 'move_member', 'member': moved.pk, 'car': '@new'},
+        {'op': 'delete_member', 'member': removed.pk},
+    ]
+    return lambda c: c.post(fx.url('api_batch'), {'operations': operations}, content_type='application/json')
+
+
+def _api_create_car(fx, client):
+    data = {'driver_name': fx.name('Driver'), 'capacity': CAPACITY}
+    return lambda c: c.post(fx.url('api_cars'), data, content_type='application/json')
+
+
+def _api_delete_car(fx, client):
+    car = fx.car()
+    return lambda c: c.delete(fx.url('api_car', car_id=car.pk))
+
+
+def _api_create_member(fx, client):
+    data = {'name': fx.name('Rider'), 'car': fx.car().pk}
+    return lambda c: c.post(fx.url('api_members'), data, content_type='application/json')
+
+
+def _api_move_member(fx, client):
+    member, car = fx.member(), fx.car()
+    return lambda c: c.patch(fx.url('api_member', member_id=member.pk), {'car': car.pk}, content_type='application/json')
+
+
+def _api_delete_member(fx, client):
+    member = fx.member(fx.car())
+    return lambda c: c.delete(fx.url('api_member', member_id=member.pk))
+
+
+SCENARIOS = [
+    ('home', 'home', 200, _home),
+    ('home_create', 'home', 302, _home_create),
+    ('event_detail_cold', 'event_detail', 200, _detail_cold),
+    ('event_detail_cached', 'event_detail', 200, _detail_cached),
+    ('event_detail_304', 'event_detail', 304, _detail_not_modified),
+    ('event_cars_page', 'event_cars', 200, _car_page),
+    ('event_cars_by_id', 'event_cars', 200, _changed_cars),
+    ('event_unassigned', 'event_unassigned', 200, _unassigned_page),
+    ('event_car_options', 'event_car_options', 200, _car_options),
+    ('event_qr', 'event_qr', 200, _qr),
+    ('event_changes', 'event_changes', 200, _changes),
+    ('event_stream', 'event_stream', 200, _stream),
+    ('add_car', 'add_car', 302, _add_car),
+    ('add_member', 'add_member', 302, _add_member),
+    ('add_member_fragment', 'add_member', 200, _add_member_fragment),
+    ('update_member', 'update_member', 302, _update_member),
+    ('delete_member', 'delete_member', 302, _delete_member),
+    ('delete_car', 'delete_car', 302, _delete_car),
+    ('auto_assign', 'auto_assign', 302, _auto_assign),
+    ('import_data', 'import_data', 302, _import),
+    ('event_export', 'event_export', 200, _export),
+    ('api_event', 'api_event', 200, _api_event),
+    ('api_search', 'api_search', 200, _api_search),
+    ('api_event_search', 'api_event_search', 200, _api_event_search),
+    ('api_batch', 'api_batch', 200, _api_batch),
+    ('api_create_car', 'api_cars', 201, _api_create_car),
+    ('api_delete_car', 'api_car', 204, _api_delete_car),
+    ('api_create_member', 'api_members', 201, _api_create_member),
+    ('api_move_member', 'api_member', 200, _api_move_member),
+    ('api_delete_member', 'api_member', 204, _api_delete_member),
+]
+
+
+def measure(fx, client, setup, repeat):
+    """Run a scenario ``repeat`` times; returns (latencies in ms, max queries, statuses)."""
+    timings, queries, statuses = [], 0, set()
+    for _ in range(repeat):
+        request = setup(fx, client)
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = request(client)
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = max(queries, len(captured))
+        statuses.add(response.status_code)
+    return timings, queries, statuses
+
+
+def time_qr_encoding(repeat, data='https://carpool.example.com/event/benchmark-0123abcd/'):
+    """Median milliseconds to encode one QR image per format, bypassing the caches."""
+    results = {}
+    for fmt in ('png', 'svg'):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            encode_qr(data, fmt)
+            timings.append((time.perf_counter() - start) * 1000)
+        results[fmt] = round(statistics.median(timings), 3)
+    return results
@@ -0,0 +1,141 @@
+"""Cache backends used by the events app."""
+import pickle
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class SQLiteLRUCache(BaseCache):
+    """
+    Cache stored in a local SQLite file and shared by every worker process
+    on the host. When the cache grows past ``MAX_ENTRIES`` the least recently
+    read entries are evicted first. A read records its time only when the
+    one stored is over ``ACCESS_RESOLUTION`` seconds old, so hits rarely
+    take the file's write lock.
+
+        CACHES = {
+            'dashboard': {
+                'BACKEND': 'events.cache_backends.SQLiteLRUCache',
+                'LOCATION': '/app/data/cache.sqlite3',
+                'OPTIONS': {'MAX_ENTRIES': 500, 'CULL_FREQUENCY': 4, 'ACCESS_RESOLUTION': 60},
+            },
+        }
+    """
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    access_resolution = 60
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._access_resolution = float(params.get('OPTIONS', {}).get('ACCESS_RESOLUTION', self.access_resolution))
+        self._path = Path(location)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entry ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_entry_accessed ON cache_entry (accessed)')
+            self._local.conn = conn
+        return conn
+
+    def _expiry(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return None if timeout is None else time.time() + timeout
+
+    def _live(self, conn, key, now):
+        row = conn.execute('SELECT value, expires, accessed FROM cache_entry WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= now:
+            conn.execute('DELETE FROM cache_entry WHERE key = ? AND expires <= ?', (key, now))
+            return None
+        return row
+
+    def _cull(self, conn):
+        total = conn.execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+        if total <= self._max_entries:
+            return
+        conn.execute('DELETE FROM cache_entry WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        total = conn.execute('SELECT COUNT(*) FROM cache_entry').fetchone()[0]
+        if total > self._max_entries:
+            evict = total // self._cull_frequency if self._cull_frequency else total
+            conn.execute(
+                'DELETE FROM cache_entry WHERE key IN '
+                '(SELECT key FROM cache_entry ORDER BY accessed LIMIT ?)',
+                (max(evict, total - self._max_entries),),
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        now = time.time()
+        row = self._live(conn, key, now)
+        if row is None:
+            return default
+        if now - row[2] >= self._access_resolution:
+            conn.execute('UPDATE cache_entry SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(row[0])
+
+    def _store(self, mode, key, value, timeout):
+        conn = self._connection()
+        now = time.time()
+        payload = pickle.dumps(value, self.pickle_protocol)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if mode == 'add' and self._live(conn, key, now) is not None:
+                stored = False
+            else:
+                conn.execute(
+                    'INSERT OR REPLACE INTO cache_entry (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                    (key, payload, self._expiry(timeout), now),
+                )
+                self._cull(conn)
+                stored = True
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return stored
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._store('set', key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._store('add', key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        if self._live(conn, key, time.time()) is None:
+            return False
+        conn.execute('UPDATE cache_entry SET expires = ? WHERE key = ?', (self._expiry(timeout), key))
+        return True
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute('DELETE FROM cache_entry WHERE key = ?', (key,))
+        return cursor.rowcount > 0
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._live(self._connection(), key, time.time()) is not None
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entry')
+
+    def close(self, **kwargs):
+        # Connections are reused per thread for the lifetime of the process.
+        pass
@@ -0,0 +1,71 @@
+"""Versioned server-side cache for the rendered event dashboard."""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.functions import Now
+from django.template.loader import render_to_string
+
+from .dashboard import (
+    CAR_PAGE_SIZE, MEMBER_PAGE_SIZE, PROTOTYPE_CAR, PROTOTYPE_MEMBER, PROTOTYPE_MOTORCYCLE, build_dashboard,
+)
+from .metrics import count_cache
+from .models import Event
+from .sharding import event_atomic
+
+# Rendered into cached HTML in place of the per-request CSRF token.
+CSRF_PLACEHOLDER = '__carpool_csrf_token__'
+
+
+def dashboard_cache():
+    return caches[getattr(settings, 'DASHBOARD_CACHE_ALIAS', 'dashboard')]
+
+
+def bump_event_version(event_id):
+    """
+    Invalidate every cached rendering of the event and return its new
+    version, or None if the event no longer exists.
+    """
+    with event_atomic():
+        if not Event.objects.filter(pk=event_id).update(version=F('version') + 1, changed_at=Now()):
+            return None
+        return Event.objects.filter(pk=event_id).values_list('version', flat=True).get()
+
+
+def dashboard_cache_key(slug, version, event_url):
+    url_hash = hashlib.md5(event_url.encode(), usedforsecurity=False).hexdigest()[:12]
+    return f'event-dashboard:{slug}:{version}:{url_hash}'
+
+
+def render_dashboard(event, event_url):
+    """
+    Return the dashboard HTML for ``event``, rendering it only when no copy
+    exists for the event's current version. It holds the first page of cars
+    and of unassigned members; the page script fetches the rest. The HTML
+    contains ``CSRF_PLACEHOLDER`` wherever a CSRF token belongs.
+    """
+    cache = dashboard_cache()
+    key = dashboard_cache_key(event.slug, event.version, event_url)
+    html = cache.get(key)
+    count_cache('dashboard', 'miss' if html is None else 'hit')
+    if html is None:
+        dashboard = build_dashboard(event.slug, CAR_PAGE_SIZE, MEMBER_PAGE_SIZE)
+        html = render_to_string('events/_dashboard.html', {
+            'event': dashboard,
+            'event_url': event_url,
+            'cars': dashboard.cars,
+            'unassigned_members': dashboard.unassigned_members,
+            'car_count': dashboard.car_count,
+            'motorcycle_count': dashboard.motorcycle_count,
+            'next_cars': dashboard.next_cars,
+            'next_unassigned': dashboard.next_unassigned,
+            'car_page_size': CAR_PAGE_SIZE,
+            'version': event.version,
+            'prototype_car': PROTOTYPE_CAR,
+            'prototype_motorcycle': PROTOTYPE_MOTORCYCLE,
+            'prototype_member': PROTOTYPE_MEMBER,
+            'csrf_token': CSRF_PLACEHOLDER,
+        })
+        cache.set(key, html)
+    return html
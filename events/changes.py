@@ -0,0 +1,174 @@
+"""Per-event change feed.
+
+Every change to an event's cars or members bumps the event version (see
+``caching.bump_event_version``) and appends an ``EventChange`` whose ``seq`` is
+that new version, so sequence numbers are gap-free and monotonically
+increasing per event. Viewers subscribe through Server-Sent Events and apply
+the deltas to the page in place.
+"""
+import asyncio
+import json
+import time
+
+from django.conf import settings
+
+from .caching import bump_event_version
+from .dashboard import MOTORCYCLE
+from .models import Event, EventChange
+from .sharding import event_atomic
+
+# Number of changes kept per event; older ones are pruned as new ones arrive.
+RETENTION = getattr(settings, 'EVENT_CHANGE_RETENTION', 1000)
+# Most changes returned by a single feed read.
+BATCH_SIZE = 500
+
+
+def car_payload(car):
+    return {
+        'id': car.pk,
+        'driver_name': car.driver_name,
+        'car_name': car.car_name,
+        'capacity': car.capacity,
+        'notes': car.notes,
+        'is_motorcycle': (car.car_name or '').lower() == MOTORCYCLE,
+    }
+
+
+def member_payload(member):
+    return {
+        'id': member.pk,
+        'name': member.name,
+        'contact': member.contact,
+        'car_id': member.car_id,
+    }
+
+
+def event_payload(event):
+    return {
+        'name': event.name,
+        'date': event.date.isoformat() if event.date else None,
+        'location': event.location,
+    }
+
+
+def record_change(event_id, kind, payload):
+    """Bump the event version and log the change under it; return the new seq."""
+    with event_atomic():
+        seq = bump_event_version(event_id)
+        if seq is None:
+            return None
+        EventChange.objects.create(event_id=event_id, seq=seq, kind=kind, payload=payload)
+        if seq % 100 == 0:
+            EventChange.objects.filter(event_id=event_id, seq__lte=seq - RETENTION).delete()
+    return seq
+
+
+def _version(event_id):
+    return Event.objects.filter(pk=event_id).values_list('version', flat=True)
+
+
+def _changes_after(event_id, after):
+    return (
+        EventChange.objects.filter(event_id=event_id, seq__gt=after)
+        .order_by('seq')
+        .values('seq', 'kind', 'payload')[:BATCH_SIZE]
+    )
+
+
+def _checked(version, changes, after):
+    if not changes or changes[0]['seq'] != after + 1:
+        return version, None
+    return version, changes
+
+
+def changes_since(event_id, after):
+    """
+    Return ``(version, changes)`` for changes after sequence ``after``.
+
+    ``version`` is None when the event is gone. ``changes`` is None when the
+    log no longer reaches back to ``after`` and the client must reload.
+    """
+    version = _version(event_id).first()
+    if version is None or version <= after:
+        return version, []
+    return _checked(version, list(_changes_after(event_id, after)), after)
+
+
+async def achanges_since(event_id, after):
+    """``changes_since`` through the async ORM."""
+    version = await _version(event_id).afirst()
+    if version is None or version <= after:
+        return version, []
+    return _checked(version, [change async for change in _changes_after(event_id, after)], after)
+
+
+def _sse(event, data, id=None):
+    message = f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+    return f'id: {id}\n{message}' if id is not None else message
+
+
+def _poll(event_id, after):
+    """One feed read rendered as SSE messages: ``(messages, new_after, done)``."""
+    return _messages(*changes_since(event_id, after), after)
+
+
+async def _apoll(event_id, after):
+    return _messages(*await achanges_since(event_id, after), after)
+
+
+def _messages(version, changes, after):
+    if version is None:
+        return [_sse('deleted', {})], after, True
+    if changes is None:
+        return [_sse('reset', {'version': version})], after, True
+    messages = [_sse('change', change, id=change['seq']) for change in changes]
+    return messages, (changes[-1]['seq'] if changes else after), False
+
+
+class ChangeStream:
+    """
+    SSE body that polls the change log. Iterated synchronously under WSGI
+    and asynchronously under ASGI, where waiting never holds a thread.
+    Each stream ends after ``max_duration``; EventSource then reconnects
+    with ``Last-Event-ID`` and resumes where it left off.
+    """
+    poll_interval = getattr(settings, 'EVENT_STREAM_POLL_INTERVAL', 1.0)
+    max_duration = getattr(settings, 'EVENT_STREAM_MAX_DURATION', 300)
+    keepalive = 15
+
+    def __init__(self, event_id, after):
+        self.event_id = event_id
+        self.after = after
+
+    def __iter__(self):
+        yield 'retry: 3000\n\n'
+        deadline = time.monotonic() + self.max_duration
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            messages, self.after, done = _poll(self.event_id, self.after)
+            yield from messages
+            if done:
+                return
+            if messages:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > self.keepalive:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            time.sleep(self.poll_interval)
+
+    async def __aiter__(self):
+        yield 'retry: 3000\n\n'
+        deadline = time.monotonic() + self.max_duration
+        last_sent = time.monotonic()
+        while time.monotonic() < deadline:
+            messages, self.after, done = await _apoll(self.event_id, self.after)
+            for message in messages:
+                yield message
+            if done:
+                return
+            if messages:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent > self.keepalive:
+                yield ': keepalive\n\n'
+                last_sent = time.monotonic()
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,123 @@
+"""ETag / Last-Modified helpers for the public event pages.
+
+These are meant for ``django.views.decorators.http.condition``. The event row
+is looked up once per request and shared with the view through
+``get_event_state``. ``condition`` calls them synchronously even around async
+views, so those are wrapped in ``preload_event_state``, which fetches the row
+with the async ORM first.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.http import Http404
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Event
+from .qr import DEFAULT_FORMAT, QR_FORMATS, qr_key
+
+# QR images only depend on their URL, so clients may keep them for a month.
+QR_MAX_AGE = 30 * 24 * 60 * 60
+
+
+def _event_state(slug):
+    return Event.objects.only('id', 'name', 'slug', 'version', 'changed_at').filter(slug=slug)
+
+
+def _remember(request, event):
+    if event is None:
+        raise Http404('No Event matches the given query.')
+    request._event_state = event
+    return event
+
+
+def get_event_state(request, slug):
+    """Return the event's id, name, slug, version and change time (cached per request)."""
+    cached = getattr(request, '_event_state', None)
+    if cached is None or cached.slug != slug:
+        cached = _remember(request, _event_state(slug).first())
+    return cached
+
+
+async def aget_event_state(request, slug):
+    cached = getattr(request, '_event_state', None)
+    if cached is None or cached.slug != slug:
+        cached = _remember(request, await _event_state(slug).afirst())
+    return cached
+
+
+def preload_event_state(view):
+    """
+    Let the sync ETag callbacks run inside an async view: load the event
+    state, and any flash messages from the messages cookie, first.
+    """
+    @wraps(view)
+    async def inner(request, slug, *args, **kwargs):
+        await aget_event_state(request, slug)
+        if CookieStorage.cookie_name in request.COOKIES:
+            await sync_to_async(len)(messages.get_messages(request))
+        return await view(request, slug, *args, **kwargs)
+    return inner
+
+
+def _digest(*parts):
+    return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def event_etag(request, slug):
+    """
+    Strong ETag for the event dashboard. Besides the event version it covers
+    the page URL and the client's CSRF cookie, the only other inputs to the
+    cached HTML. Pending flash messages disable the conditional response.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    event = get_event_state(request, slug)
+    return _digest(
+        'event', event.slug, event.version,
+        request.build_absolute_uri(reverse('event_detail', kwargs={'slug': slug})),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    )
+
+
+def event_last_modified(request, slug):
+    """
+    The event's change time rounded up to the second, the resolution of
+    If-Modified-Since. Within that second a later change would compare as
+    unmodified, so until it has passed there is no Last-Modified (the ETag
+    still applies).
+    """
+    if len(messages.get_messages(request)):
+        return None
+    changed_at = get_event_state(request, slug).changed_at
+    if changed_at.microsecond:
+        changed_at = changed_at.replace(microsecond=0) + timedelta(seconds=1)
+    return changed_at if changed_at <= timezone.now() else None
+
+
+def qr_format(request):
+    """The QR image format requested through ``?format=`` (PNG by default)."""
+    fmt = request.GET.get('format', DEFAULT_FORMAT).lower()
+    if fmt not in QR_FORMATS:
+        raise Http404('Unsupported QR format.')
+    return fmt
+
+
+def qr_etag(request, slug):
+    """
+    Strong ETag for a QR image: its content address (encoded URL + render
+    options). None for unknown events, which must get their 404, not a 304.
+    """
+    try:
+        get_event_state(request, slug)
+    except Http404:
+        return None
+    return qr_key(
+        request.build_absolute_uri(reverse('event_detail', kwargs={'slug': slug})),
+        qr_format(request),
+    )[:32]
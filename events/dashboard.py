@@ -0,0 +1,411 @@
+"""Read model for the public event dashboard.
+
+``build_dashboard`` turns one event into an immutable snapshot using a fixed
+number of queries, no matter how many cars or members the event has:
+
+1. the event row LEFT JOINed to its cars, with per-car member counts, free
+   seats and the car/motorcycle split computed by the database;
+2. the members of those cars, grouped into them in Python, together with
+   the unassigned ones.
+
+The snapshot objects are plain ``__slots__`` classes, so templates rendering
+them never reach back into the ORM. ``build_cars`` and ``build_members``
+snapshot only part of an event, for re-rendering what a mutation changed.
+
+Large events are shown a page at a time: ``build_dashboard`` can stop after
+the first cars and unassigned members, and ``car_page``, ``unassigned_page``
+and ``car_options`` return the following ones. Pages are keyed by a cursor
+(the sort key of the last row shown) rather than an offset. The keys are
+stored columns in an index (cars: ``sort_group``, ``created_at``, id), so
+a page walks the index to its cursor and computes member counts for its
+own rows only, and rows added or removed meanwhile never shift later
+pages. The one row that can move is a motorcycle gaining its first rider
+or losing its last, which changes its ``sort_group``: while someone pages
+it may be skipped or come twice, and the live updates then put it right.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest, Lower
+from django.http import Http404
+
+from .models import MOTORCYCLE, Car, Event, Member
+from .search import matching
+
+# Rows per page of car cards, unassigned members and car picker options.
+CAR_PAGE_SIZE = getattr(settings, 'DASHBOARD_CAR_PAGE_SIZE', 12)
+MEMBER_PAGE_SIZE = getattr(settings, 'DASHBOARD_MEMBER_PAGE_SIZE', 50)
+CAR_OPTION_PAGE_SIZE = getattr(settings, 'DASHBOARD_CAR_OPTION_PAGE_SIZE', 50)
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    """Raised for a page cursor that was not handed out by this module."""
+
+
+class Snapshot:
+    """Base class for immutable, slot-only snapshot objects."""
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'{type(self).__name__} is read-only')
+
+    def __repr__(self):
+        return f'<{type(self).__name__} id={getattr(self, "id", None)}>'
+
+
+class MemberSnapshot(Snapshot):
+    __slots__ = ('id', 'name', 'contact', 'car_id')
+
+    def __str__(self):
+        return self.name
+
+
+def car_label(driver_name, car_name):
+    """How a car is listed in the car pickers."""
+    return driver_name + (f' - {car_name}' if car_name else '')
+
+
+class CarSnapshot(Snapshot):
+    __slots__ = (
+        'id', 'driver_name', 'car_name', 'capacity', 'notes',
+        'is_motorcycle', 'member_count', 'available_spots', 'members',
+    )
+
+    def __str__(self):
+        car_display = f"{self.driver_name}'s car"
+        if self.car_name:
+            car_display += f" ({self.car_name})"
+        return car_display
+
+    @property
+    def label(self):
+        return car_label(self.driver_name, self.car_name)
+
+    @property
+    def show_members(self):
+        """Motorcycles only show a passenger section once someone has joined."""
+        return not self.is_motorcycle or self.member_count > 0
+
+
+class EventDashboard(Snapshot):
+    __slots__ = (
+        'id', 'name', 'date', 'location', 'slug',
+        'cars', 'unassigned_members', 'car_count', 'motorcycle_count',
+        'next_cars', 'next_unassigned',
+    )
+
+    def __str__(self):
+        return self.name
+
+
+def _prototype_car(is_motorcycle):
+    return CarSnapshot(
+        id=0, driver_name='', car_name='', capacity=None, notes='', is_motorcycle=is_motorcycle,
+        member_count=0, available_spots=None, members=(),
+    )
+
+
+# Empty snapshots rendered into <template> elements for client-side cloning.
+PROTOTYPE_CAR = _prototype_car(is_motorcycle=False)
+PROTOTYPE_MOTORCYCLE = _prototype_car(is_motorcycle=True)
+PROTOTYPE_MEMBER = MemberSnapshot(id=0, name='', contact='', car_id=None)
+
+
+def _member_count_subquery(car_ref):
+    return Coalesce(
+        Subquery(
+            Member.objects.filter(car=OuterRef(car_ref))
+            .order_by()
+            .values('car')
+            .annotate(total=Count('pk'))
+            .values('total')[:1],
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def _vehicle_count_subquery(motorcycles):
+    is_motorcycle = Q(name_lower=MOTORCYCLE)
+    return Coalesce(
+        Subquery(
+            Car.objects.filter(event=OuterRef('pk'))
+            .annotate(name_lower=Lower('car_name'))
+            .filter(is_motorcycle if motorcycles else ~is_motorcycle)
+            .order_by()
+            .values('event')
+            .annotate(total=Count('pk'))
+            .values('total')[:1],
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def _car_columns(prefix=''):
+    """
+    The computed car columns, in the two rounds they must be annotated in,
+    for car rows or, with ``prefix='cars__'``, for an event joined to its cars.
+    """
+    counts = {
+        'car_is_motorcycle': Case(
+            When(**{f'{prefix}car_name__iexact': MOTORCYCLE}, then=Value(True)),
+            default=Value(False),
+        ),
+        'car_member_count': _member_count_subquery(f'{prefix}pk'),
+    }
+    derived = {
+        'car_available_spots': Case(
+            When(**{f'{prefix}capacity__isnull': True}, then=Value(None)),
+            default=Greatest(Value(0), F(f'{prefix}capacity') - F('car_member_count')),
+            output_field=IntegerField(),
+        ),
+    }
+    return counts, derived
+
+
+def _event_car_rows(slug):
+    """Event columns plus one row per car (or a single car-less row)."""
+    counts, derived = _car_columns('cars__')
+    return (
+        Event.objects.filter(slug=slug)
+        .annotate(
+            car_count=_vehicle_count_subquery(motorcycles=False),
+            motorcycle_count=_vehicle_count_subquery(motorcycles=True),
+            **counts,
+        )
+        .annotate(**derived)
+        .order_by('cars__sort_group', 'cars__created_at', 'cars__pk')
+        .values(
+            'id', 'name', 'date', 'location', 'slug', 'car_count', 'motorcycle_count',
+            'cars__id', 'cars__driver_name', 'cars__car_name', 'cars__capacity', 'cars__notes',
+            'cars__created_at', 'cars__sort_group', 'car_is_motorcycle', 'car_member_count',
+            'car_available_spots',
+        )
+    )
+
+
+def _car_rows(event_id):
+    """An event's cars with the computed columns of ``_event_car_rows``, in page order."""
+    counts, derived = _car_columns()
+    return (
+        Car.objects.filter(event_id=event_id)
+        .annotate(**counts)
+        .annotate(**derived)
+        .order_by('sort_group', 'created_at', 'pk')
+        .values(
+            'id', 'driver_name', 'car_name', 'capacity', 'notes', 'created_at', 'sort_group',
+            'car_is_motorcycle', 'car_member_count', 'car_available_spots',
+        )
+    )
+
+
+def _cursor(*values):
+    return '.'.join(
+        str((value - EPOCH) // timedelta(microseconds=1) if isinstance(value, datetime) else value)
+        for value in values
+    )
+
+
+def _parse_cursor(cursor, *kinds):
+    """The values of a ``_cursor``, converted to ``kinds`` (``int`` or ``datetime``)."""
+    parts = cursor.split('.')
+    if len(parts) != len(kinds):
+        raise InvalidCursor(cursor)
+    try:
+        return [
+            EPOCH + timedelta(microseconds=int(part)) if kind is datetime else int(part)
+            for part, kind in zip(parts, kinds)
+        ]
+    except (ValueError, OverflowError):
+        raise InvalidCursor(cursor) from None
+
+
+def _paged(rows, limit, key):
+    """``rows`` (fetched with one extra) cut to ``limit``, and the cursor of the next page or None."""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _cursor(*key(rows[-1]))
+
+
+def _member_snapshots(members):
+    return tuple(
+        MemberSnapshot(id=pk, name=name, contact=contact, car_id=car_id)
+        for pk, name, contact, car_id in members.order_by('created_at', 'pk').values_list('id', 'name', 'contact', 'car_id')
+    )
+
+
+def _members_by_car(members):
+    members_by_car = {}
+    for member in _member_snapshots(members):
+        members_by_car.setdefault(member.car_id, []).append(member)
+    return members_by_car
+
+
+def _car_snapshot(row, members, prefix=''):
+    return CarSnapshot(
+        id=row[f'{prefix}id'],
+        driver_name=row[f'{prefix}driver_name'],
+        car_name=row[f'{prefix}car_name'],
+        capacity=row[f'{prefix}capacity'],
+        notes=row[f'{prefix}notes'],
+        is_motorcycle=row['car_is_motorcycle'],
+        member_count=row['car_member_count'],
+        available_spots=row['car_available_spots'],
+        members=tuple(members.get(row[f'{prefix}id'], ())),
+    )
+
+
+def build_dashboard(slug, car_limit=None, member_limit=None):
+    """
+    Return an ``EventDashboard`` snapshot for ``slug`` or raise ``Http404``.
+    With limits it holds only the first cars and unassigned members, and the
+    cursors of the pages after them.
+    """
+    rows = _event_car_rows(slug)
+    rows = list(rows if car_limit is None else rows[:car_limit + 1])
+    if not rows:
+        raise Http404('No Event matches the given query.')
+    head = rows[0]
+
+    car_rows, next_cars = _paged(
+        [row for row in rows if row['cars__id'] is not None], car_limit,
+        lambda row: (row['cars__sort_group'], row['cars__created_at'], row['cars__id']),
+    )
+    # The shown cars' members and the first unassigned ones, in one query.
+    members = Member.objects.filter(event_id=head['id'])
+    if car_limit is not None or member_limit is not None:
+        seated = Q(car__isnull=False) if car_limit is None else Q(car_id__in=[row['cars__id'] for row in car_rows])
+        waiting = Q(car__isnull=True)
+        if member_limit is not None:
+            waiting = Q(pk__in=_unassigned(head['id']).values('pk')[:member_limit + 1])
+        members = members.filter(seated | waiting)
+    unassigned_rows, members_by_car = [], {}
+    for row in _member_rows(members.order_by('created_at', 'pk')):
+        pk, name, contact, car_id, _ = row
+        if car_id is None:
+            unassigned_rows.append(row)
+        else:
+            members_by_car.setdefault(car_id, []).append(
+                MemberSnapshot(id=pk, name=name, contact=contact, car_id=car_id)
+            )
+    unassigned, next_unassigned = _unassigned_snapshots(unassigned_rows, member_limit)
+
+    return EventDashboard(
+        id=head['id'],
+        name=head['name'],
+        date=head['date'],
+        location=head['location'],
+        slug=head['slug'],
+        cars=tuple(_car_snapshot(row, members_by_car, 'cars__') for row in car_rows),
+        unassigned_members=unassigned,
+        car_count=head['car_count'],
+        motorcycle_count=head['motorcycle_count'],
+        next_cars=next_cars,
+        next_unassigned=next_unassigned,
+    )
+
+
+def car_page(event_id, after=None, limit=CAR_PAGE_SIZE):
+    """
+    The snapshots of an event's cars after the cursor ``after``, with their
+    members, in two queries; and the cursor of the next page or None.
+    """
+    rows = _car_rows(event_id)
+    if after is not None:
+        group, created_at, pk = _parse_cursor(after, int, datetime, int)
+        rows = rows.filter(
+            Q(sort_group__gt=group)
+            | Q(sort_group=group, created_at__gt=created_at)
+            | Q(sort_group=group, created_at=created_at, pk__gt=pk)
+        )
+    rows, next_cars = _paged(
+        list(rows[:limit + 1]), limit, lambda row: (row['sort_group'], row['created_at'], row['id']),
+    )
+    members_by_car = _members_by_car(
+        Member.objects.filter(event_id=event_id, car_id__in=[row['id'] for row in rows])
+    )
+    return tuple(_car_snapshot(row, members_by_car) for row in rows), next_cars
+
+
+def build_cars(event_id, car_ids):
+    """
+    Snapshots of just the given cars of an event, with their members, in two
+    queries. Cars that no longer exist are left out.
+    """
+    members_by_car = _members_by_car(Member.objects.filter(event_id=event_id, car_id__in=car_ids))
+    return tuple(
+        _car_snapshot(row, members_by_car)
+        for row in _car_rows(event_id).filter(pk__in=car_ids)
+    )
+
+
+def build_members(event_id, member_ids):
+    """Snapshots of just the given members of an event, in one query."""
+    return _member_snapshots(Member.objects.filter(event_id=event_id, pk__in=member_ids))
+
+
+def _unassigned(event_id, after=None):
+    """An event's unassigned members after the cursor ``after``, in page order."""
+    members = Member.objects.filter(event_id=event_id, car__isnull=True)
+    if after is not None:
+        created_at, pk = _parse_cursor(after, datetime, int)
+        members = members.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+    return members.order_by('created_at', 'pk')
+
+
+def _member_rows(members):
+    return list(members.values_list('id', 'name', 'contact', 'car_id', 'created_at'))
+
+
+def _unassigned_snapshots(rows, limit):
+    """Snapshots of ``_member_rows`` (fetched with one extra) cut to ``limit``, and the next cursor."""
+    rows, next_unassigned = _paged(rows, limit, lambda row: (row[4], row[0]))
+    return tuple(
+        MemberSnapshot(id=pk, name=name, contact=contact, car_id=None) for pk, name, contact, _, _ in rows
+    ), next_unassigned
+
+
+def unassigned_page(event_id, after=None, limit=MEMBER_PAGE_SIZE):
+    """
+    Snapshots of an event's unassigned members after the cursor ``after``
+    (all of them without a ``limit``), in one query; and the next cursor.
+    """
+    members = _unassigned(event_id, after)
+    return _unassigned_snapshots(_member_rows(members if limit is None else members[:limit + 1]), limit)
+
+
+def vehicle_counts(event_id):
+    """An event's (car count, motorcycle count), in one query."""
+    counts = Car.objects.filter(event_id=event_id).aggregate(
+        total=Count('pk'), motorcycles=Count('pk', filter=Q(car_name__iexact=MOTORCYCLE)),
+    )
+    return counts['total'] - counts['motorcycles'], counts['motorcycles']
+
+
+def car_options(event_id, text='', after=None, limit=CAR_OPTION_PAGE_SIZE):
+    """
+    ``(id, label)`` of an event's cars matching ``text``, in the order they
+    were added, after the car id ``after``; and the next cursor.
+    """
+    cars = Car.objects.filter(event_id=event_id)
+    condition = matching(Car, text)
+    if condition is not None:
+        cars = cars.filter(condition)
+    if after is not None:
+        cars = cars.filter(pk__gt=_parse_cursor(after, int)[0])
+    rows, next_options = _paged(
+        list(cars.order_by('pk').values_list('id', 'driver_name', 'car_name')[:limit + 1]),
+        limit, lambda row: (row[0],),
+    )
+    return [(pk, car_label(driver_name, car_name)) for pk, driver_name, car_name in rows], next_options
@@ -0,0 +1,62 @@
+"""
+SQLite backend that retries statements failing with "database is locked".
+
+``busy_timeout`` already makes SQLite wait for a competing writer; this adds
+a few backed-off retries on top for the bursts that outlast it. Only
+statements run outside a transaction are retried, since a failed statement
+there has no effect and can simply be run again. Inside a transaction the
+error propagates as usual.
+
+That includes the ``BEGIN IMMEDIATE`` opening a transaction, where writers
+wait for the lock: ``_start_transaction_under_autocommit`` sends it through
+``self.cursor()``, that is through ``RetryingCursorWrapper``, not the raw
+connection. Keep it that way when overriding either.
+
+Set ``OPTIONS['lock_retries']`` to change the number of retries (default 3).
+"""
+import random
+import time
+
+from django.db.backends.sqlite3 import base
+
+
+def _is_locked(error):
+    return 'database is locked' in str(error) or 'database table is locked' in str(error)
+
+
+class RetryingCursorWrapper(base.SQLiteCursorWrapper):
+    retries = 3
+    backoff = 0.05
+
+    def _retry(self, method, *args):
+        attempt = 0
+        while True:
+            in_transaction = self.connection.in_transaction
+            try:
+                return method(*args)
+            except base.Database.OperationalError as error:
+                if in_transaction or attempt >= self.retries or not _is_locked(error):
+                    raise
+            attempt += 1
+            time.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        # The parameter list may be a one-shot iterator; retry from a copy.
+        param_list = list(param_list)
+        return self._retry(super().executemany, query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.lock_retries = kwargs.pop('lock_retries', RetryingCursorWrapper.retries)
+        return kwargs
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=RetryingCursorWrapper)
+        cursor.retries = self.lock_retries
+        return cursor
+
@@ -0,0 +1,116 @@
+"""Streaming roster export as CSV or NDJSON, optionally gzip-compressed.
+
+Members are read with one ``select_related`` query per export, fetched in
+chunks through ``QuerySet.iterator``, and encoded row by row, so memory stays
+flat however many events or members are exported. ``export_roster`` yields
+``bytes``, ready for ``StreamingHttpResponse`` or a file.
+"""
+import csv
+import json
+import zlib
+
+from django.http import StreamingHttpResponse
+
+from .models import Member
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = {
+    CSV: 'text/csv; charset=utf-8',
+    NDJSON: 'application/x-ndjson',
+}
+COLUMNS = (
+    'event', 'event_slug', 'event_date', 'event_location',
+    'member', 'contact', 'driver', 'car_name', 'capacity', 'joined_at',
+)
+CHUNK_SIZE = 2000
+# Encoded output is flushed in pieces of about this many bytes.
+FLUSH_SIZE = 64 * 1024
+
+
+def roster_rows(events, chunk_size=CHUNK_SIZE):
+    """Yield one tuple of ``COLUMNS`` per member of the given events (from their queryset's shard)."""
+    members = (
+        Member.objects.using(getattr(events, 'db', None)).filter(event__in=events)
+        .select_related('event', 'car')
+        .only(
+            'name', 'contact', 'created_at',
+            'event__name', 'event__slug', 'event__date', 'event__location',
+            'car__driver_name', 'car__car_name', 'car__capacity',
+        )
+        .order_by('event_id', 'car_id', 'created_at', 'pk')
+    )
+    for member in members.iterator(chunk_size=chunk_size):
+        event, car = member.event, member.car
+        yield (
+            event.name, event.slug, event.date.isoformat() if event.date else None, event.location,
+            member.name, member.contact,
+            car.driver_name if car else '', car.car_name if car else '',
+            car.capacity if car else None,
+            member.created_at.isoformat(),
+        )
+
+
+class _Echo:
+    """File-like object whose ``write`` returns what it was given."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def _buffered(lines):
+    """Join encoded lines into pieces of roughly ``FLUSH_SIZE`` bytes."""
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)    # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_roster(rows, fmt=CSV, compress=False):
+    """Yield ``rows`` of ``roster_rows`` encoded, e.g. those of several shards chained."""
+    encode = _csv_lines if fmt == CSV else _ndjson_lines
+    chunks = _buffered(encode(rows))
+    return _gzipped(chunks) if compress else chunks
+
+
+def export_roster(events, fmt=CSV, compress=False, chunk_size=CHUNK_SIZE):
+    """Yield the encoded roster of ``events`` (a queryset or list of events)."""
+    return encode_roster(roster_rows(events, chunk_size), fmt, compress)
+
+
+def roster_response(events, filename, fmt=CSV, compress=False):
+    """Stream the roster of ``events`` as a file download."""
+    filename = f'{filename}.{fmt}' + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        export_roster(events, fmt, compress),
+        content_type='application/gzip' if compress else FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -1,4 +1,7 @@
 from django import forms
+from django.contrib.admin.widgets import AutocompleteSelect
+from .assignment import BALANCE, STRATEGIES
+from .importing import KINDS, MEMBERS
 from .models import Event, Car, Member
 
 
@@ -20,12 +23,14 @@ class CarCreateForm(forms.ModelForm):
     
     class Meta:
         model = Car
-        fields = ['driver_name', 'car_name', 'capacity', 'notes']
+        fields = ['driver_name', 'car_name', 'capacity', 'notes', 'start_lat', 'start_lng']
         widgets = {
             'driver_name': forms.TextInput(attrs={'placeholder': "Driver's name"}),
             'car_name': forms.TextInput(attrs={'placeholder': 'Car name/label (optional)'}),
             'capacity': forms.NumberInput(attrs={'placeholder': 'Number of seats', 'min': 1}),
             'notes': forms.Textarea(attrs={'rows': 3, 'placeholder': 'Additional notes (optional)'}),
+            'start_lat': forms.NumberInput(attrs={'placeholder': 'Start latitude (optional)', 'step': 'any'}),
+            'start_lng': forms.NumberInput(attrs={'placeholder': 'Start longitude (optional)', 'step': 'any'}),
         }
 
 
@@ -34,10 +39,12 @@ class MemberCreateForm(forms.ModelForm):
     
     class Meta:
         model = Member
-        fields = ['name', 'contact', 'car']
+        fields = ['name', 'contact', 'car', 'pickup_lat', 'pickup_lng']
         widgets = {
             'name': forms.TextInput(attrs={'placeholder': 'Your name'}),
             'contact': forms.TextInput(attrs={'placeholder': 'Contact info (optional)'}),
+            'pickup_lat': forms.NumberInput(attrs={'placeholder': 'Pickup latitude (optional)', 'step': 'any'}),
+            'pickup_lng': forms.NumberInput(attrs={'placeholder': 'Pickup longitude (optional)', 'step': 'any'}),
         }
     
     def __init__(self, *args, **kwargs):
@@ -64,4 +71,38 @@ class MemberUpdateForm(forms.ModelForm):
         if event:
             # Only show cars from the current event
             self.fields['car'].queryset = Car.objects.filter(event=event)
-            self.fields['car'].empty_label = "Unassigned (no car yet)"
\ No newline at end of file
+            self.fields['car'].empty_label = "Unassigned (no car yet)"
+
+
+class AutoAssignForm(forms.Form):
+    """Form for seating unassigned members automatically."""
+    strategy = forms.ChoiceField(choices=STRATEGIES.items(), initial=BALANCE)
+    default_capacity = forms.IntegerField(
+        required=False, min_value=1,
+        help_text="Seats to assume for cars without a capacity (leave empty to skip them)",
+    )
+
+
+class ImportForm(forms.Form):
+    """Form for importing many members or cars from a CSV file or pasted list."""
+    kind = forms.ChoiceField(choices=KINDS.items(), initial=MEMBERS)
+    file = forms.FileField(required=False)
+    text = forms.CharField(required=False, widget=forms.Textarea(attrs={'rows': 4}))
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('file') and not cleaned_data.get('text', '').strip():
+            raise forms.ValidationError('Upload a CSV file or paste a list of names.')
+        return cleaned_data
+
+
+class MoveMembersForm(forms.Form):
+    """Admin action form picking the car to move members into."""
+    
+    def __init__(self, *args, admin_site, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Searched through the admin's autocomplete view, never listed in full.
+        self.fields['car'] = forms.ModelChoiceField(
+            queryset=Car.objects.select_related('event'),
+            widget=AutocompleteSelect(Member._meta.get_field('car'), admin_site),
+        )
@@ -0,0 +1,98 @@
+"""Partial page updates for mutations made with fetch/XHR, and later pages.
+
+Instead of redirecting to the full dashboard, the mutation views answer
+script callers with just the car cards and unassigned members they changed,
+rendered from the same partials as the page, plus the flash messages they
+queued. Rendering cost is proportional to the changed cars, not the event.
+
+The page itself only holds the first cars and unassigned members; the
+script fetches the following pages from the same partials as it scrolls.
+"""
+from django.contrib import messages
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+
+from .dashboard import build_cars, build_members, car_options, car_page, unassigned_page, vehicle_counts
+
+
+def wants_fragments(request):
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+def _car_fragments(request, event, cars):
+    return [
+        {
+            'id': car.id,
+            'is_motorcycle': car.is_motorcycle,
+            'label': car.label,
+            'html': render_to_string('events/_car_card.html', {'event': event, 'car': car}, request),
+        }
+        for car in cars
+    ]
+
+
+def _unassigned_fragments(request, event, members):
+    return [
+        {
+            'id': member.id,
+            'html': render_to_string('events/_unassigned_member.html', {'event': event, 'member': member}, request),
+        }
+        for member in members
+    ]
+
+
+def _changed_cars(request, event, cars, removed_cars=()):
+    """The cards of ``cars``, the ids of the removed ones and the event's vehicle counts."""
+    car_ids = {car_id for car_id in cars if car_id is not None}
+    snapshots = build_cars(event.pk, car_ids)
+    removed = set(removed_cars) | (car_ids - {car.id for car in snapshots})
+    car_count, motorcycle_count = vehicle_counts(event.pk)
+    return {
+        'cars': _car_fragments(request, event, snapshots),
+        'removed_cars': sorted(removed),
+        'totals': {'cars': car_count, 'motorcycles': motorcycle_count},
+    }
+
+
+def fragment_response(request, event, cars=(), removed_cars=(), unassigned=()):
+    """
+    JSON with the re-rendered cards of ``cars``, the ids of ``removed_cars``
+    (including requested cars that no longer exist), the unassigned rows of
+    the members ``unassigned`` (``html`` is null for those no longer
+    unassigned) and the request's pending messages, which it consumes.
+    """
+    member_ids = sorted({member_id for member_id in unassigned if member_id is not None})
+    waiting = [member for member in build_members(event.pk, member_ids) if member.car_id is None] if member_ids else ()
+    rows = {row['id']: row for row in _unassigned_fragments(request, event, waiting)}
+    data = {
+        **_changed_cars(request, event, cars, removed_cars),
+        'unassigned': [rows.get(member_id, {'id': member_id, 'html': None}) for member_id in member_ids],
+        'messages': [
+            {'level': message.level_tag, 'text': message.message}
+            for message in messages.get_messages(request)
+        ],
+    }
+    return JsonResponse(data)
+
+
+def cars_response(request, event, car_ids):
+    """JSON with the current cards of ``car_ids``, the ids of those that are gone and the vehicle counts."""
+    return JsonResponse(_changed_cars(request, event, car_ids))
+
+
+def car_page_response(request, event, after):
+    """JSON with the page of car cards after the cursor ``after`` and the next cursor."""
+    cars, next_cars = car_page(event.pk, after)
+    return JsonResponse({'cars': _car_fragments(request, event, cars), 'next': next_cars})
+
+
+def unassigned_page_response(request, event, after):
+    """JSON with the page of unassigned members after the cursor ``after`` and the next cursor."""
+    members, next_members = unassigned_page(event.pk, after)
+    return JsonResponse({'members': _unassigned_fragments(request, event, members), 'next': next_members})
+
+
+def car_options_response(event, text, after):
+    """JSON with the next page of car picker options, ``{id, label}`` each, and the next cursor."""
+    options, next_options = car_options(event.pk, text, after)
+    return JsonResponse({'cars': [{'id': pk, 'label': label} for pk, label in options], 'next': next_options})
@@ -0,0 +1,189 @@
+"""Matching riders to the nearest car with free seats.
+
+Pickup and start points are latitude/longitude pairs, projected onto a
+flat plane in kilometres around their mean latitude; that is accurate to
+well under a percent across a city or region, which is all an event
+spans (points across the antimeridian are not supported).
+
+Cars are bucketed into a uniform grid sized to hold a few cars per cell.
+Riders are queried a cell at a time: rings of cells are added around the
+riders' cell until every rider's ``k`` nearest candidates are provably
+closer than any car outside the searched block. With NumPy installed the
+distances of a whole cell's riders to its candidates are computed as one
+array; without it the same search runs in plain Python.
+
+Seats are then handed out greedily in order of distance over all
+(rider, candidate car) pairs, so the closest pairs in the whole event are
+matched first. Riders whose candidates all filled up are searched again
+against the cars that still have room, until no riders or no seats are left.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+try:
+    import numpy as np
+except ImportError:    # pure-Python search
+    np = None
+
+KM_PER_DEGREE = 111.195
+# Nearest cars considered per rider in each round.
+CANDIDATES = 8
+# Average cars per grid cell.
+CARS_PER_CELL = 4
+
+
+def project(points, latitude):
+    """(lat, lng) pairs -> (x, y) kilometres on a plane around ``latitude``."""
+    scale = KM_PER_DEGREE * math.cos(math.radians(latitude))
+    return [(lng * scale, lat * KM_PER_DEGREE) for lat, lng in points]
+
+
+class GridIndex:
+    """Uniform grid over projected points, for k-nearest searches."""
+
+    def __init__(self, points, per_cell=CARS_PER_CELL):
+        self.points = points
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        self.x0, self.y0 = min(xs), min(ys)
+        width, height = max(xs) - self.x0, max(ys) - self.y0
+        # Points on a line (or one spot) still get a few per cell.
+        self.size = max(
+            math.sqrt(width * height * per_cell / len(points)),
+            max(width, height) * per_cell / len(points),
+            1e-3,
+        )
+        self.columns = int(width / self.size) + 1
+        self.rows = int(height / self.size) + 1
+        self.cells = defaultdict(list)
+        self._array = None
+        for index, point in enumerate(points):
+            self.cells[self.cell(point)].append(index)
+
+    def cell(self, point):
+        """The cell containing ``point``, clamped to the grid."""
+        column = int((point[0] - self.x0) / self.size)
+        row = int((point[1] - self.y0) / self.size)
+        return min(max(column, 0), self.columns - 1), min(max(row, 0), self.rows - 1)
+
+    def ring(self, cell, radius):
+        """Point indexes in the cells exactly ``radius`` cells away from ``cell``."""
+        column, row = cell
+        found = []
+        for c in range(max(column - radius, 0), min(column + radius, self.columns - 1) + 1):
+            edge = abs(c - column) == radius
+            for r in (range(row - radius, row + radius + 1) if edge else {row - radius, row + radius}):
+                if 0 <= r < self.rows:
+                    found.extend(self.cells.get((c, r), ()))
+        return found
+
+    def covered(self, cell, radius):
+        """
+        The sides of the searched block with points beyond them, as
+        ``(low x, high x, low y, high y)`` with ``None`` for open sides.
+        """
+        column, row = cell
+        return (
+            self.x0 + (column - radius) * self.size if column - radius > 0 else None,
+            self.x0 + (column + radius + 1) * self.size if column + radius < self.columns - 1 else None,
+            self.y0 + (row - radius) * self.size if row - radius > 0 else None,
+            self.y0 + (row + radius + 1) * self.size if row + radius < self.rows - 1 else None,
+        )
+
+    def nearest(self, queries, k, vectorized=None):
+        """
+        Yield ``(query index, point index, distance)`` for the ``k`` nearest
+        points of every query point.
+        """
+        if vectorized is None:
+            vectorized = np is not None
+        groups = defaultdict(list)
+        for index, point in enumerate(queries):
+            groups[self.cell(point)].append(index)
+        search = self._search_arrays if vectorized else self._search
+        for cell, members in groups.items():
+            candidates = []
+            radius = 0
+            while True:
+                candidates += self.ring(cell, radius)
+                if len(candidates) >= min(k, len(self.points)):
+                    found = search(cell, radius, [queries[i] for i in members], candidates, k)
+                    if found is not None:
+                        for position, point, distance in found:
+                            yield members[position], point, distance
+                        break
+                radius += 1
+
+    def _search(self, cell, radius, queries, candidates, k):
+        bounds = self.covered(cell, radius)
+        found = []
+        for position, (x, y) in enumerate(queries):
+            distances = [math.hypot(self.points[i][0] - x, self.points[i][1] - y) for i in candidates]
+            nearest = heapq.nsmallest(k, range(len(candidates)), key=distances.__getitem__)
+            if distances[nearest[-1]] > _margin(bounds, x, y):
+                return None
+            found += [(position, candidates[i], distances[i]) for i in nearest]
+        return found
+
+    def _search_arrays(self, cell, radius, queries, candidates, k):
+        if self._array is None:
+            self._array = np.asarray(self.points, dtype=float)
+        queries = np.asarray(queries, dtype=float)
+        points = self._array[candidates]
+        distances = np.hypot(queries[:, None, 0] - points[None, :, 0], queries[:, None, 1] - points[None, :, 1])
+        k = min(k, len(candidates))
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k] if k < len(candidates) else (
+            np.broadcast_to(np.arange(len(candidates)), distances.shape)
+        )
+        picked = np.take_along_axis(distances, nearest, axis=1)
+        margin = np.full(len(queries), np.inf)
+        for side, axis, sign in zip(self.covered(cell, radius), (0, 0, 1, 1), (1, -1, 1, -1)):
+            if side is not None:
+                margin = np.minimum(margin, sign * (queries[:, axis] - side))
+        if (picked.max(axis=1) > margin).any():
+            return None
+        positions = np.repeat(np.arange(len(queries)), k)
+        points = np.asarray(candidates)[nearest.ravel()]
+        return zip(positions.tolist(), points.tolist(), picked.ravel().tolist())
+
+
+def _margin(bounds, x, y):
+    """Distance from (x, y) to the nearest side of the searched block with points beyond it."""
+    return min(
+        (sign * ((x, y)[axis] - side) for side, axis, sign in zip(bounds, (0, 0, 1, 1), (1, -1, 1, -1))
+         if side is not None),
+        default=math.inf,
+    )
+
+
+def match_nearest(riders, cars, free_seats, candidates=CANDIDATES, vectorized=None):
+    """
+    Seat riders at their nearest car with free seats.
+
+    ``riders`` and ``cars`` are (lat, lng) pairs, ``free_seats`` the seats
+    left in each car. Returns one ``(car index, km)`` or ``None`` per rider.
+    """
+    matches = [None] * len(riders)
+    if not riders or not cars:
+        return matches
+    latitude = sum(lat for lat, _ in [*riders, *cars]) / (len(riders) + len(cars))
+    rider_points, car_points = project(riders, latitude), project(cars, latitude)
+    free = list(free_seats)
+    pending = list(range(len(riders)))
+    open_cars = [index for index, seats in enumerate(free) if seats > 0]
+    while pending and open_cars:
+        index = GridIndex([car_points[i] for i in open_cars])
+        pairs = sorted(
+            (distance, pending[rider], open_cars[car])
+            for rider, car, distance in index.nearest(
+                [rider_points[i] for i in pending], candidates, vectorized,
+            )
+        )
+        for distance, rider, car in pairs:
+            if matches[rider] is None and free[car] > 0:
+                matches[rider] = (car, distance)
+                free[car] -= 1
+        pending = [rider for rider in pending if matches[rider] is None]
+        open_cars = [car for car in open_cars if free[car] > 0]
+    return matches
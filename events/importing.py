@@ -0,0 +1,261 @@
+"""Bulk import of members and cars from CSV files or pasted lists.
+
+Input is read line by line and inserted in batches with ``bulk_create``, so
+memory stays bounded by the batch size (plus the event's existing names)
+however long the file is. Text whose first line is a CSV header is read as
+CSV, with the columns below; anything else is read as one name per line.
+
+* members: ``name``, ``contact``, ``car`` (the driver's name),
+  ``pickup_lat``, ``pickup_lng``
+* cars: ``driver_name``, ``car_name``, ``capacity``, ``notes``,
+  ``start_lat``, ``start_lng``
+
+Rows that clash with an existing name or an earlier row are skipped and
+reported together in the result rather than failing the import. Members
+whose car is unknown, ambiguous or full are imported unassigned.
+"""
+import csv
+from itertools import chain, islice
+
+from django.db import IntegrityError
+
+from .changes import car_payload, member_payload, record_change
+from .models import Car, CarFull, Member
+from .sharding import event_atomic
+
+MEMBERS = 'members'
+CARS = 'cars'
+KINDS = {
+    MEMBERS: 'Members',
+    CARS: 'Cars',
+}
+COLUMNS = {
+    MEMBERS: ('name', 'contact', 'car', 'pickup_lat', 'pickup_lng'),
+    CARS: ('driver_name', 'car_name', 'capacity', 'notes', 'start_lat', 'start_lng'),
+}
+BATCH_SIZE = 500
+# Most skipped rows listed per problem; the rest are only counted.
+REPORT_LIMIT = 50
+
+_AMBIGUOUS = object()
+
+
+class ImportResult:
+    """Counts of what was imported and samples of what was skipped."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.created = 0
+        self.assigned = 0
+        self.problems = {}    # problem -> [count, first REPORT_LIMIT row labels]
+
+    def skip(self, problem, label):
+        entry = self.problems.setdefault(problem, [0, []])
+        entry[0] += 1
+        if len(entry[1]) < REPORT_LIMIT:
+            entry[1].append(label)
+
+    def summary(self):
+        text = f'Imported {self.created} {KINDS[self.kind].lower()}'
+        if self.kind == MEMBERS:
+            text += f' ({self.assigned} assigned to cars)'
+        text += '.'
+        for problem, (count, labels) in self.problems.items():
+            more = f' and {count - len(labels)} more' if count > len(labels) else ''
+            text += f' {count} {problem}: {", ".join(labels)}{more}.'
+        return text
+
+
+def read_rows(lines, kind):
+    """
+    Yield ``(line number, {column: value})`` from an iterable of text lines.
+    A first line naming the kind's first column is taken as a CSV header.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    header = [column.strip().lower() for column in next(csv.reader([first]))]
+    if COLUMNS[kind][0] in header:
+        reader = csv.DictReader(lines, fieldnames=header)
+        for row in reader:
+            values = {column: (row.get(column) or '').strip() for column in COLUMNS[kind]}
+            if any(values.values()):
+                # line_num counts lines read after the header.
+                yield reader.line_num + 1, values
+        return
+    for number, line in enumerate(chain([first], lines), start=1):
+        name = line.strip()
+        if name:
+            yield number, {COLUMNS[kind][0]: name}
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _too_long(model, **values):
+    return any(len(value) > model._meta.get_field(field).max_length for field, value in values.items())
+
+
+def _point(row, prefix):
+    """
+    The row's optional ``<prefix>_lat``/``<prefix>_lng`` as floats, or
+    Nones; raises ``ValueError`` for half-given or out-of-range points.
+    """
+    latitude, longitude = row.get(f'{prefix}_lat', ''), row.get(f'{prefix}_lng', '')
+    if not latitude and not longitude:
+        return None, None
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError(f'({latitude}, {longitude}) is not a point on Earth')
+    return latitude, longitude
+
+
+def import_members(event, lines, batch_size=BATCH_SIZE):
+    """Import members into ``event``; returns an ``ImportResult``."""
+    result = ImportResult(MEMBERS)
+    names = set(Member.objects.filter(event=event).values_list('name', flat=True))
+    cars = {}
+    free = {}
+    for car_id, driver, capacity, taken in (
+        Car.objects.filter(event=event).values_list('pk', 'driver_name', 'capacity', 'seats_taken')
+    ):
+        key = driver.strip().casefold()
+        cars[key] = _AMBIGUOUS if key in cars else car_id
+        free[car_id] = None if capacity is None else capacity - taken
+
+    def members():
+        for number, row in read_rows(lines, MEMBERS):
+            name, contact, driver = row['name'], row.get('contact', ''), row.get('car', '')
+            label = f'"{name}"' if name else f'line {number}'
+            if not name or _too_long(Member, name=name, contact=contact):
+                result.skip('invalid row(s) skipped', label)
+                continue
+            try:
+                latitude, longitude = _point(row, 'pickup')
+            except ValueError:
+                result.skip('invalid pickup point row(s) skipped', label)
+                continue
+            if name in names:
+                result.skip('duplicate name(s) skipped', label)
+                continue
+            names.add(name)
+            car_id = None
+            if driver:
+                car_id = cars.get(driver.casefold())
+                if car_id is None:
+                    result.skip('unknown car(s), left unassigned', f'"{name}" ({driver})')
+                elif car_id is _AMBIGUOUS:
+                    result.skip('ambiguous car(s), left unassigned', f'"{name}" ({driver})')
+                    car_id = None
+                elif free[car_id] is not None and free[car_id] <= 0:
+                    result.skip('full car(s), left unassigned', f'"{name}" ({driver})')
+                    car_id = None
+                elif free[car_id] is not None:
+                    free[car_id] -= 1
+            yield Member(event=event, name=name, contact=contact, car_id=car_id,
+                         pickup_lat=latitude, pickup_lng=longitude)
+
+    for batch in _batches(members(), batch_size):
+        created = _create_members(event, batch, free, result)
+        result.created += len(created)
+        result.assigned += sum(1 for member in created if member.car_id)
+    return result
+
+
+def _create_members(event, batch, free, result):
+    """
+    Insert one batch together with its seat reservations. If someone else
+    took a seat or a name meanwhile, demote or drop the affected rows and
+    try again.
+    """
+    while batch:
+        deltas = {}
+        for member in batch:
+            if member.car_id:
+                deltas[member.car_id] = deltas.get(member.car_id, 0) + 1
+        try:
+            with event_atomic():
+                Car.objects.apply_seat_deltas(deltas)
+                created = Member.objects.bulk_create(batch)
+                record_change(event.pk, 'batch', {'changes': [
+                    {'kind': 'member_saved', 'payload': {'member': member_payload(member)}}
+                    for member in created
+                ]})
+            return created
+        except CarFull as full:
+            for car_id, capacity, taken in (
+                Car.objects.filter(pk__in=full.car_ids).values_list('pk', 'capacity', 'seats_taken')
+            ):
+                free[car_id] = capacity - taken
+            for member in batch:
+                if member.car_id in full.car_ids:
+                    if free[member.car_id] > 0:
+                        free[member.car_id] -= 1
+                    else:
+                        result.skip('full car(s), left unassigned', f'"{member.name}"')
+                        member.car_id = None
+        except IntegrityError:
+            taken = set(
+                Member.objects.filter(event=event, name__in=[member.name for member in batch])
+                .values_list('name', flat=True)
+            )
+            if not taken:
+                raise
+            for member in batch:
+                if member.name in taken:
+                    result.skip('duplicate name(s) skipped', f'"{member.name}"')
+            batch = [member for member in batch if member.name not in taken]
+    return []
+
+
+def import_cars(event, lines, batch_size=BATCH_SIZE):
+    """Import cars into ``event``; returns an ``ImportResult``."""
+    result = ImportResult(CARS)
+    drivers = {
+        driver.strip().casefold()
+        for driver in Car.objects.filter(event=event).values_list('driver_name', flat=True)
+    }
+
+    def cars():
+        for number, row in read_rows(lines, CARS):
+            driver = row['driver_name']
+            label = f'"{driver}"' if driver else f'line {number}'
+            car_name, notes, capacity = row.get('car_name', ''), row.get('notes', ''), row.get('capacity', '')
+            if not driver or _too_long(Car, driver_name=driver, car_name=car_name):
+                result.skip('invalid row(s) skipped', label)
+                continue
+            if capacity:
+                if not capacity.isdigit() or int(capacity) < 1:
+                    result.skip('invalid capacity row(s) skipped', label)
+                    continue
+                capacity = int(capacity)
+            try:
+                latitude, longitude = _point(row, 'start')
+            except ValueError:
+                result.skip('invalid start point row(s) skipped', label)
+                continue
+            if driver.casefold() in drivers:
+                result.skip('duplicate driver(s) skipped', label)
+                continue
+            drivers.add(driver.casefold())
+            yield Car(event=event, driver_name=driver, car_name=car_name, capacity=capacity or None, notes=notes,
+                      start_lat=latitude, start_lng=longitude)
+
+    for batch in _batches(cars(), batch_size):
+        with event_atomic():
+            created = Car.objects.bulk_create(batch)
+            record_change(event.pk, 'batch', {'changes': [
+                {'kind': 'car_saved', 'payload': {'car': car_payload(car)}} for car in created
+            ]})
+        result.created += len(created)
+    return result
+
+
+IMPORTERS = {
+    MEMBERS: import_members,
+    CARS: import_cars,
+}
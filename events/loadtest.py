@@ -0,0 +1,152 @@
+"""A dependency-free HTTP/1.1 load generator for the ``loadtest_servers`` command.
+
+``run_load`` keeps ``concurrency`` keep-alive connections busy for a fixed
+duration, cycling through the given paths, while ``idle_streams`` extra
+connections hold the event's SSE stream open the way viewers' browsers do.
+Only status lines and bodies are parsed as much as needed to reuse the
+connection; anything unexpected counts as an error and reconnects.
+"""
+import asyncio
+import itertools
+import statistics
+import time
+from urllib.parse import urlsplit
+
+REQUEST_TIMEOUT = 10.0
+
+
+class Result:
+    """Latencies and outcomes of one load run against one server."""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+        return {
+            'server': self.name,
+            'requests': len(latencies),
+            'errors': self.errors,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'rps': round(len(latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+        }
+
+
+async def _read_response(reader):
+    """Read one response; returns (status, keep_alive)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length, chunked, keep_alive = 0, False, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value
+        elif name == 'connection':
+            keep_alive = value != 'close'
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+
+def _request(host, path):
+    return f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept-Encoding: identity\r\n\r\n'.encode()
+
+
+async def _client(base, paths, deadline, result):
+    url = urlsplit(base)
+    connection = None
+    while time.monotonic() < deadline:
+        path = next(paths)
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.wait_for(
+                    asyncio.open_connection(url.hostname, url.port), REQUEST_TIMEOUT,
+                )
+            reader, writer = connection
+            writer.write(_request(url.netloc, path))
+            status, keep_alive = await asyncio.wait_for(_read_response(reader), REQUEST_TIMEOUT)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            result.errors += 1
+            keep_alive = False
+        else:
+            result.latencies.append(time.perf_counter() - start)
+            result.statuses[status] = result.statuses.get(status, 0) + 1
+        if not keep_alive and connection is not None:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def _idle_stream(base, path, deadline, opened):
+    """Hold an SSE stream open until ``deadline``, discarding what it sends."""
+    url = urlsplit(base)
+    try:
+        reader, writer = await asyncio.open_connection(url.hostname, url.port)
+    except OSError:
+        return
+    writer.write(_request(url.netloc, path))
+    try:
+        if (await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)).split()[1:2] == [b'200']:
+            opened.append(1)
+        while time.monotonic() < deadline:
+            if not await asyncio.wait_for(reader.read(4096), max(0.01, deadline - time.monotonic())):
+                break
+    except (OSError, asyncio.TimeoutError, IndexError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _run(name, base, paths, concurrency, duration, idle_streams, stream_path):
+    result = Result(name)
+    opened = []
+    stream_deadline = time.monotonic() + duration + REQUEST_TIMEOUT + 5
+    streams = [
+        asyncio.create_task(_idle_stream(base, stream_path, stream_deadline, opened))
+        for _ in range(idle_streams)
+    ]
+    if streams:
+        await asyncio.sleep(1)    # let the streams occupy the server first
+    cycle = itertools.cycle(paths)
+    start = time.monotonic()
+    await asyncio.gather(*(_client(base, cycle, start + duration, result) for _ in range(concurrency)))
+    result.elapsed = time.monotonic() - start
+    for task in streams:
+        task.cancel()
+    await asyncio.gather(*streams, return_exceptions=True)
+    summary = result.summary()
+    summary['streams_opened'] = len(opened)
+    return summary
+
+
+def run_load(name, base, paths, concurrency=32, duration=10.0, idle_streams=0, stream_path=None):
+    """Load ``base`` (e.g. 'http://127.0.0.1:8001') and return a summary dict."""
+    return asyncio.run(_run(name, base, paths, concurrency, duration, idle_streams, stream_path))
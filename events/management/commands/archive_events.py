@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from events.archiving import archivable, archive_dir, archive_events, refresh_statistics
+from events.sharding import shards, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Move events older than --days into compressed archive files and delete them from the "
+        "live tables, a batch of events per transaction. Restore one with restore_event."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'EVENT_RETENTION_DAYS', 365),
+                            help="Archive events created, held and last changed more than this many days ago")
+        parser.add_argument('--batch-size', type=int, default=50, help="Events deleted per transaction")
+        parser.add_argument('--limit', type=int, help="Archive at most this many events")
+        parser.add_argument('--archive-dir', help="Where to write archives (default: EVENT_ARCHIVE_DIR)")
+        parser.add_argument('--dry-run', action='store_true', help="Only list what would be archived")
+
+    def handle(self, *args, **options):
+        directory = options['archive_dir'] or archive_dir()
+        archived = 0
+        for alias in shards():
+            with use_shard(alias):
+                archived += self._archive(options, directory, archived)
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Archived {archived} event(s) to {directory}."))
+
+    def _archive(self, options, directory, done):
+        """Archive (or list) the current shard's old events; ``done`` were on other shards."""
+        limit = None if options['limit'] is None else options['limit'] - done
+        candidates = archivable(options['days']).only(*(
+            'id', 'name', 'date', 'location', 'slug', 'version', 'changed_at', 'created_at',
+        ))
+        if limit is not None:
+            candidates = candidates[:limit]
+        if options['dry_run']:
+            listed = 0
+            for listed, event in enumerate(candidates, 1):
+                self.stdout.write(f"{event.slug}  created {event.created_at:%Y-%m-%d}  {event.name}")
+            return listed
+
+        archived = 0
+        # Re-query each batch: archived events are gone, so the next ones come first.
+        while limit is None or archived < limit:
+            size = options['batch_size']
+            if limit is not None:
+                size = min(size, limit - archived)
+            batch = list(archivable(options['days'])[:size])
+            if not batch:
+                break
+            archived += len(archive_events(batch, directory))
+            self.stdout.write(f"Archived {done + archived} event(s)...")
+        if archived:
+            refresh_statistics()
+        return archived
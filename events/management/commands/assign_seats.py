@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from events.assignment import BALANCE, STRATEGIES, apply_assignment, plan_assignment
+from events.models import CarFull, Event
+from events.sharding import locate, use_shard
+
+
+class Command(BaseCommand):
+    help = "Seat an event's unassigned members in cars with free capacity."
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', help="Event slug")
+        parser.add_argument('--strategy', choices=sorted(STRATEGIES), default=BALANCE)
+        parser.add_argument('--default-capacity', type=int, default=None,
+                            help="Seats to assume for cars without a capacity (default: skip them)")
+        parser.add_argument('--dry-run', action='store_true', help="Show the plan without saving it")
+
+    def handle(self, *args, **options):
+        with use_shard(locate(options['slug'])):
+            self._handle(options)
+
+    def _handle(self, options):
+        try:
+            event = Event.objects.get(slug=options['slug'])
+        except Event.DoesNotExist:
+            raise CommandError(f"No event with slug \"{options['slug']}\".")
+
+        plan = plan_assignment(event, options['strategy'], options['default_capacity'])
+        for car_id, label, added in plan.cars:
+            if added:
+                self.stdout.write(f"  {label} (car {car_id}): +{added}")
+
+        if options['dry_run']:
+            self.stdout.write(f"Dry run: {plan.summary()}")
+            return
+        try:
+            applied = apply_assignment(plan)
+        except CarFull as full:
+            raise CommandError(f"Car(s) {', '.join(map(str, full.car_ids))} filled up meanwhile; nothing was assigned.")
+        self.stdout.write(self.style.SUCCESS(f"Assigned {applied} member(s). {plan.summary()}"))
@@ -0,0 +1,117 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from events import geo
+from events.assignment import BALANCE, FILL, NEAREST, allocate, apply_assignment, plan_assignment
+from events.models import Car, Event, Member
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the seat allocator and nearest-car matching on synthetic events, then planning "
+        "and applying whole assignments in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=5000)
+        parser.add_argument('--cars', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--spread-km', type=float, default=15.0,
+                            help="Standard deviation of pickup and start points around the venue")
+        parser.add_argument('--no-database', action='store_true',
+                            help="Only time the in-memory allocation, not planning and applying")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        free_seats = [rng.randint(0, 7) for _ in range(options['cars'])]
+        self.stdout.write(
+            f"{options['members']} riders, {options['cars']} cars, {sum(free_seats)} free seats"
+        )
+        for strategy in (BALANCE, FILL):
+            self._time(strategy, options['repeat'], lambda: len(allocate(free_seats, options['members'], strategy)))
+
+        # Riders and drivers scattered around a venue in a few neighbourhoods.
+        spread = options['spread_km'] / geo.KM_PER_DEGREE
+        hubs = [(14.55 + rng.gauss(0, spread), 121.03 + rng.gauss(0, spread)) for _ in range(12)]
+
+        def point():
+            lat, lng = rng.choice(hubs)
+            return lat + rng.gauss(0, spread / 4), lng + rng.gauss(0, spread / 4)
+
+        riders = [point() for _ in range(options['members'])]
+        cars = [point() for _ in range(options['cars'])]
+        backends = [('nearest', True), ('nearest-py', False)] if geo.np is not None else [('nearest-py', False)]
+        results = {}
+        for name, vectorized in backends:
+            def run():
+                results[name] = geo.match_nearest(riders, cars, free_seats, vectorized=vectorized)
+                return sum(1 for match in results[name] if match)
+            self._time(name, options['repeat'], run)
+            matched = [match[1] for match in results[name] if match]
+            if matched:
+                self.stdout.write(f"  {'':<10} mean pickup distance {sum(matched) / len(matched):.2f} km")
+        if geo.np is None:
+            self.stdout.write("NumPy is not installed; only the pure-Python search was timed.")
+        elif _cars(results['nearest']) != _cars(results['nearest-py']):
+            self.stdout.write(self.style.WARNING("The NumPy and pure-Python searches chose different cars."))
+
+        if not options['no_database']:
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self._time_database(free_seats, riders, cars, options['repeat'])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                teardown_test_environment()
+
+    def _time_database(self, free_seats, riders, cars, repeat):
+        """Time ``plan_assignment`` plus ``apply_assignment`` end to end, as the assign view runs them."""
+        event = Event.objects.create(name='Assignment benchmark')
+        Car.objects.bulk_create([
+            Car(event=event, driver_name=f'Driver {i}', capacity=seats, start_lat=lat, start_lng=lng)
+            for i, (seats, (lat, lng)) in enumerate(zip(free_seats, cars))
+        ])
+        Member.objects.bulk_create(
+            [Member(event=event, name=f'Rider {i}', pickup_lat=lat, pickup_lng=lng)
+             for i, (lat, lng) in enumerate(riders)],
+            batch_size=1000,
+        )
+        self.stdout.write(f"Plan + apply in {connection.vendor}:")
+        for strategy in (BALANCE, FILL, NEAREST):
+            plans, applies = [], []
+            for _ in range(repeat):
+                Member.objects.filter(event=event).update(car=None)
+                Car.objects.filter(event=event).update(seats_taken=0)
+                start = time.perf_counter()
+                plan = plan_assignment(event, strategy)
+                planned = time.perf_counter()
+                placed = apply_assignment(plan)
+                plans.append(planned - start)
+                applies.append(time.perf_counter() - planned)
+            totals = [plan + apply for plan, apply in zip(plans, applies)]
+            self.stdout.write(
+                f"  {strategy:<10} placed {placed:>6}  "
+                f"best {min(totals) * 1000:8.2f} ms  worst {max(totals) * 1000:8.2f} ms  "
+                f"(plan {min(plans) * 1000:.2f} ms, apply {min(applies) * 1000:.2f} ms)"
+            )
+
+    def _time(self, name, repeat, run):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            placed = run()
+            timings.append(time.perf_counter() - start)
+        self.stdout.write(
+            f"  {name:<10} placed {placed:>6}  "
+            f"best {min(timings) * 1000:8.2f} ms  worst {max(timings) * 1000:8.2f} ms"
+        )
+
+
+def _cars(matches):
+    # Distances may differ in the last bit between the two searches.
+    return [match and match[0] for match in matches]
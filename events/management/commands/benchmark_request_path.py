@@ -0,0 +1,122 @@
+import secrets
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+
+from events.benchmarks import SCENARIOS, admission_settings, populate
+
+MUTATIONS = (
+    'home_create', 'add_car', 'add_member', 'add_member_fragment', 'update_member',
+    'delete_member', 'delete_car', 'auto_assign', 'import_data',
+)
+# Django's stock pipeline: sessions and users on every request, messages in
+# a cookie that spills over into the session.
+LEGACY = {
+    'MIDDLEWARE': [
+        {
+            'events.sessionless.AdminSessionMiddleware': 'django.contrib.sessions.middleware.SessionMiddleware',
+            'events.sessionless.AdminAuthenticationMiddleware': 'django.contrib.auth.middleware.AuthenticationMiddleware',
+        }.get(middleware, middleware)
+        for middleware in settings.MIDDLEWARE
+    ],
+    'MESSAGE_STORAGE': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    'SESSION_COOKIE_PATH': '/',
+}
+WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def _long_report(fx, client):
+    # Over-long names are each listed in the summary, which outgrows the cookie.
+    text = '\n'.join(['name', *(f"{fx.name('Rider')} {secrets.token_hex(60)}" for _ in range(60))])
+    return lambda c: c.post(fx.url('import_data'), {'kind': 'members', 'text': text})
+
+
+class Command(BaseCommand):
+    help = (
+        "Count database queries, writes and session-table queries per public mutation (including "
+        "the redirected page that shows its message) with the sessionless request path versus "
+        "Django's stock session pipeline, in a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100, help="Members in the benchmark event")
+        parser.add_argument('--repeat', type=int, default=5, help="Measured runs per mutation")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as scratch, override_settings(
+                QR_CACHE_DIR=Path(scratch) / 'qr', **admission_settings(scratch),
+            ):
+                self._run(options['size'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def _run(self, size, repeat):
+        fixture = populate(size)
+        staff = get_user_model().objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+        scenarios = [(name, setup) for name, _, _, setup in SCENARIOS if name in MUTATIONS]
+        scenarios.append(('import_long_report', _long_report))
+
+        header = f"{'mutation':<22}{'visitor':<10}" + ''.join(
+            f"{pipeline + ' ' + column:>19}" for pipeline in ('stock', 'sessionless')
+            for column in ('q/w/s', 'ms')
+        )
+        self.stdout.write(header + "    (q/w/s: queries/writes/session-table queries)")
+        totals = {}
+        for visitor in ('anonymous', 'staff'):
+            for name, setup in scenarios:
+                cells = []
+                for pipeline, overrides in (('stock', LEGACY), ('sessionless', {})):
+                    with override_settings(**overrides):
+                        client = Client()
+                        if visitor == 'staff':
+                            client.force_login(staff)
+                        client.get(fixture.url('event_detail'))    # CSRF cookie, like a real visit
+                        counts, timings = self._measure(fixture, client, setup, repeat)
+                    total = totals.setdefault((visitor, pipeline), [0, 0, 0])
+                    for i, count in enumerate(counts):
+                        total[i] += count
+                    cells += [f"{counts[0]}/{counts[1]}/{counts[2]}", f"{statistics.median(timings):.2f}"]
+                self.stdout.write(f"{name:<22}{visitor:<10}" + ''.join(f"{cell:>19}" for cell in cells))
+
+        self.stdout.write("\nTotals per visitor (queries / writes / session-table queries):")
+        for visitor in ('anonymous', 'staff'):
+            stock, lean = totals[(visitor, 'stock')], totals[(visitor, 'sessionless')]
+            self.stdout.write(
+                f"  {visitor:<10} stock {stock[0]}/{stock[1]}/{stock[2]}  "
+                f"sessionless {lean[0]}/{lean[1]}/{lean[2]}  "
+                f"({stock[1] - lean[1]} fewer writes, {stock[2] - lean[2]} fewer session queries)"
+            )
+
+    def _measure(self, fixture, client, setup, repeat):
+        """Worst-case (queries, writes, session queries) and latencies of mutation + redirected page."""
+        worst, timings = (0, 0, 0), []
+        for _ in range(repeat):
+            request = setup(fixture, client)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request(client)
+                if response.status_code == 302:
+                    client.get(response['Location'])
+                timings.append((time.perf_counter() - start) * 1000)
+            statements = [query['sql'] for query in captured.captured_queries]
+            counts = (
+                len(statements),
+                sum(1 for sql in statements if sql.lstrip().split(None, 1)[0].upper() in WRITES),
+                sum(1 for sql in statements if 'django_session' in sql),
+            )
+            worst = max(worst, counts)
+        return worst, timings
@@ -0,0 +1,162 @@
+import json
+import platform
+import statistics
+import tempfile
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from events import urls
+from events.benchmarks import SCENARIOS, SIZES, admission_settings, measure, populate, time_qr_encoding
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every events view at several event sizes in a throwaway test database. "
+        "Fails if a view's query count grows with event size or latency regresses past a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="Members per event")
+        parser.add_argument('--repeat', type=int, default=5, help="Measured runs per view and size")
+        parser.add_argument('--output', '-o', help="Write the results as JSON to this file")
+        parser.add_argument('--baseline', help="Earlier JSON results to compare latency and queries against")
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help="Allowed relative latency increase over the baseline (default 0.5 = +50%%)")
+        parser.add_argument('--slack-ms', type=float, default=2.0,
+                            help="Absolute latency increase always allowed, for very fast views")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Cannot read baseline: {error}")
+
+        sizes = sorted(set(options['sizes']))
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as scratch, override_settings(
+                CACHES=self._caches(scratch), QR_CACHE_DIR=Path(scratch) / 'qr', **admission_settings(scratch),
+            ):
+                results = self._run(sizes, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        failures = self._check_growth(results, sizes) + self._check_coverage()
+        if baseline:
+            failures += self._check_baseline(results, baseline, options['tolerance'], options['slack_ms'])
+        results['failures'] = failures
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2) + '\n')
+            self.stdout.write(f"Results written to {options['output']}.")
+        if failures:
+            raise CommandError(f"{len(failures)} benchmark failure(s):\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("No query growth or latency regressions."))
+
+    def _caches(self, scratch):
+        caches = {alias: dict(config) for alias, config in settings.CACHES.items()}
+        caches[settings.DASHBOARD_CACHE_ALIAS] = {
+            **caches[settings.DASHBOARD_CACHE_ALIAS],
+            'BACKEND': 'events.cache_backends.SQLiteLRUCache',
+            'LOCATION': str(Path(scratch) / 'cache.sqlite3'),
+        }
+        return caches
+
+    def _run(self, sizes, repeat):
+        views = []
+        self.stdout.write(f"{'view':<22}" + ''.join(f"{size:>16}" for size in sizes))
+        rows = {name: [] for name, *_ in SCENARIOS}
+        for size in sizes:
+            fixture = populate(size)
+            for name, url_name, expected, setup in SCENARIOS:
+                client = Client()
+                timings, queries, statuses = measure(fixture, client, setup, repeat)
+                views.append({
+                    'view': name,
+                    'url_name': url_name,
+                    'size': size,
+                    'median_ms': round(statistics.median(timings), 3),
+                    'min_ms': round(min(timings), 3),
+                    'max_ms': round(max(timings), 3),
+                    'queries': queries,
+                    'status': sorted(statuses),
+                    'expected_status': expected,
+                })
+                rows[name].append(f"{statistics.median(timings):>8.2f}ms {queries:>3}q")
+        for name, cells in rows.items():
+            self.stdout.write(f"{name:<22}" + ''.join(f"{cell:>16}" for cell in cells))
+
+        qr = time_qr_encoding(repeat)
+        self.stdout.write("QR encoding: " + ", ".join(f"{fmt} {ms:.2f}ms" for fmt, ms in qr.items()))
+        return {
+            'generated_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'sizes': sizes,
+            'repeat': repeat,
+            'views': views,
+            'qr_encode_ms': qr,
+        }
+
+    def _check_growth(self, results, sizes):
+        failures = []
+        by_view = {}
+        for row in results['views']:
+            by_view.setdefault(row['view'], {})[row['size']] = row
+            if row['status'] != [row['expected_status']]:
+                failures.append(
+                    f"{row['view']} at {row['size']} members answered {row['status']}, "
+                    f"expected {row['expected_status']}"
+                )
+        for view, rows in by_view.items():
+            smallest = rows[sizes[0]]['queries']
+            for size in sizes[1:]:
+                if rows[size]['queries'] > smallest:
+                    failures.append(
+                        f"{view}: {rows[size]['queries']} queries at {size} members "
+                        f"vs {smallest} at {sizes[0]} (N+1?)"
+                    )
+        return failures
+
+    def _check_coverage(self):
+        covered = {url_name for _, url_name, _, _ in SCENARIOS}
+        return [
+            f"{pattern.name}: no benchmark scenario"
+            for pattern in urls.urlpatterns if pattern.name and pattern.name not in covered
+        ]
+
+    def _check_baseline(self, results, baseline, tolerance, slack_ms):
+        failures = []
+        previous = {(row['view'], row['size']): row for row in baseline.get('views', [])}
+        for row in results['views']:
+            old = previous.get((row['view'], row['size']))
+            if old is None:
+                continue
+            limit = old['median_ms'] * (1 + tolerance) + slack_ms
+            if row['median_ms'] > limit:
+                failures.append(
+                    f"{row['view']} at {row['size']} members: {row['median_ms']:.2f}ms "
+                    f"vs baseline {old['median_ms']:.2f}ms"
+                )
+            if row['queries'] > old['queries']:
+                failures.append(
+                    f"{row['view']} at {row['size']} members: {row['queries']} queries "
+                    f"vs baseline {old['queries']}"
+                )
+        for fmt, ms in results['qr_encode_ms'].items():
+            old = baseline.get('qr_encode_ms', {}).get(fmt)
+            if old is not None and ms > old * (1 + tolerance) + slack_ms:
+                failures.append(f"QR {fmt} encoding: {ms:.2f}ms vs baseline {old:.2f}ms")
+        return failures
@@ -0,0 +1,96 @@
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.test.utils import override_settings
+
+from events.benchmarks import admission_settings
+from events.models import Car, CarFull, Event, Member
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure write throughput of the configured database from concurrent threads. "
+        "Run once per DATABASE_ENGINE to compare SQLite and PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--writes', type=int, default=200, help="Writes per thread")
+        parser.add_argument('--cars', type=int, default=20)
+
+    def handle(self, *args, **options):
+        # The same throwaway admission settings as the request benchmarks,
+        # so no run touches the real bucket file.
+        with tempfile.TemporaryDirectory() as scratch, override_settings(**admission_settings(scratch)):
+            self._run(options)
+
+    def _run(self, options):
+        event = Event.objects.create(name=f'Write benchmark {uuid.uuid4().hex[:8]}')
+        cars = Car.objects.bulk_create([
+            Car(event=event, driver_name=f'Driver {i}', capacity=None) for i in range(options['cars'])
+        ])
+        car_ids = [car.pk for car in cars]
+        outcomes = Counter()
+        latencies = []
+        lock = threading.Lock()
+
+        def worker(number):
+            local = Counter()
+            timings = []
+            try:
+                for i in range(options['writes']):
+                    start = time.perf_counter()
+                    try:
+                        # A join followed by a move: a seat reservation, a
+                        # release and the change-log writes behind each.
+                        with transaction.atomic():
+                            member = Member(event=event, name=f'Writer {number}-{i}',
+                                            car_id=car_ids[(number + i) % len(car_ids)])
+                            member.save()
+                        member.car_id = car_ids[(number + i + 1) % len(car_ids)]
+                        member.save()
+                        local['ok'] += 1
+                    except OperationalError as error:
+                        local['locked' if 'locked' in str(error) else 'db error'] += 1
+                    except CarFull:
+                        local['full'] += 1
+                    timings.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+                with lock:
+                    outcomes.update(local)
+                    latencies.extend(timings)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        event.delete()
+
+        latencies.sort()
+        settings = connection.settings_dict
+        self.stdout.write(f"{connection.vendor} ({settings['ENGINE']}), {options['threads']} threads")
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.stdout.write(f"  journal_mode={cursor.fetchone()[0]}")
+        self.stdout.write(
+            f"  {outcomes['ok']} join+move pairs in {elapsed:.2f}s = {outcomes['ok'] / elapsed:.0f}/s"
+        )
+        self.stdout.write(
+            f"  latency p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms"
+        )
+        failures = {kind: count for kind, count in outcomes.items() if kind != 'ok'}
+        if failures:
+            self.stdout.write(self.style.WARNING(
+                "  failed: " + ", ".join(f"{kind} {count}" for kind, count in sorted(failures.items()))
+            ))
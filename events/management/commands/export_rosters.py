@@ -0,0 +1,50 @@
+import sys
+from itertools import chain
+
+from django.core.management.base import BaseCommand, CommandError
+
+from events.exporting import CHUNK_SIZE, CSV, FORMATS, encode_roster, roster_rows
+from events.models import Event
+from events.sharding import shards
+
+
+class Command(BaseCommand):
+    help = "Stream the member rosters of one or many events as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help="Event slugs (default: every event matching the filters)")
+        parser.add_argument('--format', dest='fmt', choices=sorted(FORMATS), default=CSV)
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip")
+        parser.add_argument('--output', '-o', default='-', help="Output file, or - for standard output")
+        parser.add_argument('--from-date', help="Only events on or after this date (YYYY-MM-DD)")
+        parser.add_argument('--to-date', help="Only events on or before this date (YYYY-MM-DD)")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def _events(self, alias, options):
+        events = Event.objects.using(alias)
+        if options['slugs']:
+            events = events.filter(slug__in=options['slugs'])
+        if options['from_date']:
+            events = events.filter(date__gte=options['from_date'])
+        if options['to_date']:
+            events = events.filter(date__lte=options['to_date'])
+        return events
+
+    def handle(self, *args, **options):
+        matched = [events for events in (self._events(alias, options) for alias in shards()) if events.exists()]
+        if not matched:
+            raise CommandError("No events matched.")
+
+        rows = chain.from_iterable(roster_rows(events.values('pk'), options['chunk_size']) for events in matched)
+        chunks = encode_roster(rows, options['fmt'], options['gzip'])
+        if options['output'] == '-':
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+            return
+        written = 0
+        with open(options['output'], 'wb') as out:
+            for chunk in chunks:
+                written += out.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}."))
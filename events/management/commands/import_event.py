@@ -0,0 +1,44 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from events.importing import BATCH_SIZE, IMPORTERS, KINDS, MEMBERS
+from events.models import Event
+from events.sharding import locate, use_shard
+
+
+class Command(BaseCommand):
+    help = "Import members or cars into an event from a CSV file or a list of names (one per line)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', help="Event slug")
+        parser.add_argument('path', help="File to import, or - for standard input")
+        parser.add_argument('--kind', choices=sorted(KINDS), default=MEMBERS)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--encoding', default='utf-8-sig')
+
+    def handle(self, *args, **options):
+        with use_shard(locate(options['slug'])):
+            self._handle(options)
+
+    def _handle(self, options):
+        try:
+            event = Event.objects.get(slug=options['slug'])
+        except Event.DoesNotExist:
+            raise CommandError(f"No event with slug \"{options['slug']}\".")
+
+        start = time.perf_counter()
+        importer = IMPORTERS[options['kind']]
+        try:
+            if options['path'] == '-':
+                result = importer(event, sys.stdin, options['batch_size'])
+            else:
+                with open(options['path'], encoding=options['encoding'], newline='') as lines:
+                    result = importer(event, lines, options['batch_size'])
+        except (OSError, UnicodeDecodeError) as error:
+            raise CommandError(str(error))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.summary()} ({time.perf_counter() - start:.2f}s)"
+        ))
@@ -0,0 +1,153 @@
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from events.loadtest import run_load
+
+PATHS = {
+    'detail': '/event/{slug}/',
+    'qr': '/event/{slug}/qr/',
+    'changes': '/event/{slug}/changes/?after=0',
+}
+STREAM_PATH = '/event/{slug}/stream/'
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync WSGI (gunicorn gthread) and async ASGI (gunicorn + Uvicorn) throughput "
+        "on this machine against the same scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load per server")
+        parser.add_argument('--concurrency', type=int, default=32, help="Concurrent keep-alive connections")
+        parser.add_argument('--streams', type=int, default=0,
+                            help="SSE streams held open during the run, like viewers with the page open")
+        parser.add_argument('--paths', nargs='+', choices=sorted(PATHS), default=sorted(PATHS))
+        parser.add_argument('--size', type=int, default=100, help="Members in the scratch event")
+        parser.add_argument('--workers', type=int, default=1, help="Worker processes per server")
+        parser.add_argument('--threads', type=int, default=4, help="Threads per WSGI worker")
+        parser.add_argument('--target', action='append', default=[], metavar='NAME=URL',
+                            help="Load an already running server instead of spawning both "
+                                 "(its database must contain --slug)")
+        parser.add_argument('--slug', help="Event to request on --target servers")
+        parser.add_argument('--output', '-o', help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options['target']:
+            if not options['slug']:
+                raise CommandError("--target needs --slug.")
+            targets = dict(target.split('=', 1) for target in options['target'])
+            results = [self._load(name, url, options['slug'], options) for name, url in targets.items()]
+        else:
+            for module in ('gunicorn', 'uvicorn_worker'):
+                if importlib.util.find_spec(module) is None:
+                    raise CommandError(
+                        f"{module} is not installed; install requirements.txt or use --target."
+                    )
+            results = self._spawn_and_load(options)
+
+        self.stdout.write(f"{'server':<8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+                          f"{'errors':>8}{'streams':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['server']:<8}{row['rps']:>10}{row['p50_ms'] or '-':>10}{row['p95_ms'] or '-':>10}"
+                f"{row['p99_ms'] or '-':>10}{row['errors']:>8}{row['streams_opened']:>9}"
+            )
+        if options['output']:
+            Path(options['output']).write_text(json.dumps({
+                'python': sys.version.split()[0],
+                'cpus': os.cpu_count(),
+                'options': {key: options[key] for key in (
+                    'duration', 'concurrency', 'streams', 'paths', 'size', 'workers', 'threads',
+                )},
+                'results': results,
+            }, indent=2) + '\n')
+            self.stdout.write(f"Results written to {options['output']}.")
+
+    def _load(self, name, url, slug, options):
+        self.stdout.write(f"Loading {name} at {url} for {options['duration']:.0f}s...")
+        return run_load(
+            name, url.rstrip('/'),
+            [PATHS[path].format(slug=slug) for path in options['paths']],
+            concurrency=options['concurrency'],
+            duration=options['duration'],
+            idle_streams=options['streams'],
+            stream_path=STREAM_PATH.format(slug=slug),
+        )
+
+    def _spawn_and_load(self, options):
+        with tempfile.TemporaryDirectory() as scratch:
+            env = {
+                **os.environ,
+                'DATABASE_ENGINE': 'sqlite',
+                'SQLITE_PATH': str(Path(scratch) / 'db.sqlite3'),
+                'DASHBOARD_CACHE_LOCATION': str(Path(scratch) / 'cache.sqlite3'),
+                'QR_CACHE_DIR': str(Path(scratch) / 'qr'),
+                'STATIC_ROOT': str(Path(scratch) / 'static'),
+                'DEBUG': '0',
+                'PYTHONUNBUFFERED': '1',
+            }
+            slug = self._prepare(env, options['size'])
+            servers = {
+                'wsgi': ['carpool_project.wsgi:application', '--worker-class', 'gthread',
+                         '--threads', str(options['threads'])],
+                'asgi': ['carpool_project.asgi:application'],
+            }
+            results = []
+            for name, arguments in servers.items():
+                port = _free_port()
+                process = subprocess.Popen(
+                    [sys.executable, '-m', 'gunicorn', '-c', 'carpool_project/gunicorn.conf.py', *arguments,
+                     '--bind', f'127.0.0.1:{port}', '--workers', str(options['workers']),
+                     '--log-level', 'warning'],
+                    cwd=settings.BASE_DIR, env=env,
+                )
+                try:
+                    url = f'http://127.0.0.1:{port}'
+                    self._wait_ready(url + PATHS['changes'].format(slug=slug), process)
+                    results.append(self._load(name, url, slug, options))
+                finally:
+                    process.terminate()
+                    process.wait(timeout=30)
+            return results
+
+    def _prepare(self, env, size):
+        manage = [sys.executable, 'manage.py']
+        subprocess.run([*manage, 'migrate', '--verbosity', '0'], cwd=settings.BASE_DIR, env=env, check=True)
+        subprocess.run([*manage, 'collectstatic', '--noinput', '--verbosity', '0'],
+                       cwd=settings.BASE_DIR, env=env, check=True)
+        created = subprocess.run(
+            [*manage, 'shell', '-c', f'from events.benchmarks import populate; print(populate({size}).slug)'],
+            cwd=settings.BASE_DIR, env=env, check=True, capture_output=True, text=True,
+        )
+        return created.stdout.split()[-1]
+
+    def _wait_ready(self, url, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited with status {process.returncode}.")
+            try:
+                with urllib.request.urlopen(url, timeout=2):
+                    return
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.2)
+        raise CommandError(f"Server did not answer {url} within {timeout}s.")
@@ -0,0 +1,27 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from events.sharding import index_directory, shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply migrations to the default database and every event shard, then record the events "
+        "already on each shard in the slug-to-shard directory. Run it after changing EVENT_SHARD_COUNT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Events checked per directory query")
+        parser.add_argument('--skip-directory', action='store_true', help="Only apply migrations")
+
+    def handle(self, *args, **options):
+        aliases = [DEFAULT_DB_ALIAS, *(alias for alias in shards() if alias != DEFAULT_DB_ALIAS)]
+        for alias in aliases:
+            self.stdout.write(f"Migrating {alias}...")
+            call_command('migrate', database=alias, interactive=False, verbosity=max(options['verbosity'] - 1, 0))
+        if not options['skip_directory'] and len(shards()) > 1:
+            for alias in shards():
+                added = index_directory(alias, options['batch_size'])
+                self.stdout.write(f"  {alias}: recorded {added} event(s) new to the directory")
+        self.stdout.write(self.style.SUCCESS(f"Migrated {len(aliases)} database(s)."))
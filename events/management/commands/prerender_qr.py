@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from events.models import Event
+from events.qr import QR_FORMATS, render_qr
+from events.sharding import shards
+
+
+def _prerender(job):
+    event_url, fmt = job
+    return len(render_qr(event_url, fmt))
+
+
+class Command(BaseCommand):
+    help = "Pre-render QR codes for many events into the on-disk QR cache, in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help="Event slugs (default: every event matching the filters)")
+        parser.add_argument('--base-url', required=True,
+                            help="Public origin the QR codes point at, e.g. https://carpool.example.com")
+        parser.add_argument('--format', dest='formats', action='append', choices=sorted(QR_FORMATS),
+                            help="Image format to render; may be repeated (default: png)")
+        parser.add_argument('--from-date', help="Only events on or after this date (YYYY-MM-DD)")
+        parser.add_argument('--to-date', help="Only events on or before this date (YYYY-MM-DD)")
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+
+    def _slugs(self, alias, options):
+        events = Event.objects.using(alias)
+        if options['slugs']:
+            events = events.filter(slug__in=options['slugs'])
+        if options['from_date']:
+            events = events.filter(date__gte=options['from_date'])
+        if options['to_date']:
+            events = events.filter(date__lte=options['to_date'])
+        return events.values_list('slug', flat=True).iterator()
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        formats = options['formats'] or ['png']
+        jobs = [
+            (base_url + reverse('event_detail', kwargs={'slug': slug}), fmt)
+            for alias in shards()
+            for slug in self._slugs(alias, options)
+            for fmt in formats
+        ]
+        if not jobs:
+            raise CommandError("No events matched.")
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            total_bytes = sum(pool.map(_prerender, jobs, chunksize=16))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {len(jobs)} QR image(s) ({total_bytes} bytes) into the QR cache."
+        ))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from events.models import Event
+from events.sharding import locate, misplaced, move_event, shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Move events to the shard their slug hashes to, e.g. after adding shards, one event at a "
+        "time; or move the given events to --to and pin them there. Writes to an event are refused "
+        "with a 503 while it moves; reads keep working."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help="Move just these events (default: every misplaced one)")
+        parser.add_argument('--to', help="Shard to move the given events to; they stay there (pinned)")
+        parser.add_argument('--limit', type=int, help="Move at most this many events")
+        parser.add_argument('--dry-run', action='store_true', help="Only list what would move")
+
+    def handle(self, *args, **options):
+        if len(shards()) == 1:
+            raise CommandError("There is only one shard; set EVENT_SHARD_COUNT to add more.")
+        target = options['to']
+        if target is not None:
+            if not options['slugs']:
+                raise CommandError("--to needs the slugs of the events to move.")
+            if target not in shards():
+                raise CommandError(f"Unknown shard {target!r}; the shards are {', '.join(shards())}.")
+            moves = [(slug, locate(slug), target) for slug in options['slugs']]
+        else:
+            # Listed up front: moving rewrites the directory being read.
+            moves = [move for move in misplaced() if not options['slugs'] or move[0] in options['slugs']]
+
+        moved = 0
+        for slug, source, destination in moves:
+            if options['limit'] is not None and moved >= options['limit']:
+                break
+            if options['dry_run']:
+                self.stdout.write(f"{slug}: {source} -> {destination}")
+                moved += 1
+                continue
+            try:
+                if move_event(slug, destination, pin=target is not None):
+                    moved += 1
+                    self.stdout.write(f"  {slug}: {source} -> {destination}")
+            except Event.DoesNotExist:
+                self.stderr.write(self.style.WARNING(f"  {slug}: no such event on {source}, skipped"))
+        verb = "Would move" if options['dry_run'] else "Moved"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {moved} event(s)."))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from events import search
+from events.models import Car, Event, Member
+from events.sharding import shards
+
+MODELS = {'events': Event, 'cars': Car, 'members': Member}
+
+
+class Command(BaseCommand):
+    help = (
+        "Reinstall missing search triggers and re-index events, cars and members in batches of ids, "
+        "one short transaction each, so the site stays writable. Resume with --start."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=sorted(MODELS), default=list(MODELS),
+                            help="Re-index just these tables")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Ids re-indexed per transaction")
+        parser.add_argument('--start', type=int, default=1, help="First id to re-index")
+        parser.add_argument('--triggers-only', action='store_true',
+                            help="Only reinstall missing tables and triggers")
+
+    def handle(self, *args, **options):
+        for alias in shards():
+            if len(shards()) > 1:
+                self.stdout.write(f"Shard {alias}:")
+            self._rebuild(alias, options)
+
+    def _rebuild(self, alias, options):
+        if connections[alias].vendor == 'postgresql':
+            self.stdout.write("PostgreSQL maintains the search vectors itself; nothing to rebuild.")
+            return
+        if not search.available(alias):
+            raise CommandError("This SQLite build has no FTS5; search uses LIKE lookups instead.")
+
+        repaired = search.install(alias)
+        if repaired:
+            self.stdout.write(self.style.WARNING(
+                "Reinstalled missing search tables or triggers for "
+                + ", ".join(model._meta.db_table for model in repaired) + "."
+            ))
+        if options['triggers_only']:
+            return
+        for name in options['only']:
+            last = None
+            for last in search.rebuild(MODELS[name], options['batch_size'], options['start'], alias):
+                self.stdout.write(f"  {name}: re-indexed up to id {last}")
+            self.stdout.write(self.style.SUCCESS(f"Re-indexed {name}" + ("." if last is not None else " (none).")))
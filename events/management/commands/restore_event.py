@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from events.archiving import ArchiveError, restore_event
+from events.sharding import locate, use_shard
+
+
+class Command(BaseCommand):
+    help = "Restore an event archived by archive_events back into the live tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug')
+        parser.add_argument('--archive-dir', help="Where archives are kept (default: EVENT_ARCHIVE_DIR)")
+        parser.add_argument('--keep', action='store_true', help="Keep the archive file after restoring")
+
+    def handle(self, *args, **options):
+        # Back onto the shard its slug hashes to.
+        with use_shard(locate(options['slug'])):
+            try:
+                event = restore_event(options['slug'], options['archive_dir'], keep=options['keep'])
+            except ArchiveError as error:
+                raise CommandError(str(error))
+            self.stdout.write(self.style.SUCCESS(
+                f"Restored {event.slug} with {event.cars.count()} car(s) and {event.members.count()} member(s)."
+            ))
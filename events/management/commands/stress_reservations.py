@@ -0,0 +1,119 @@
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from events.benchmarks import admission_settings
+from events.models import Car, Event, Member
+
+
+class Command(BaseCommand):
+    help = "Hammer seat reservations from many threads and check that no car is overbooked."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=50, help="Requests per thread")
+        parser.add_argument('--cars', type=int, default=5)
+        parser.add_argument('--capacity', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help="Keep the scratch event for inspection")
+
+    def handle(self, *args, **options):
+        # Keep admission control in the path, but with throwaway buckets
+        # and limits the run never reaches.
+        with tempfile.TemporaryDirectory() as scratch, override_settings(**admission_settings(scratch)):
+            self._run(options)
+
+    def _run(self, options):
+        event = Event.objects.create(name=f'Reservation stress {uuid.uuid4().hex[:8]}')
+        cars = Car.objects.bulk_create([
+            Car(event=event, driver_name=f'Driver {i}', capacity=options['capacity'])
+            for i in range(options['cars'])
+        ])
+        car_ids = [car.pk for car in cars]
+        outcomes = Counter()
+        riders = []
+        lock = threading.Lock()
+
+        def worker(number):
+            rng = random.Random(options['seed'] * 1000 + number)
+            client = Client()
+            try:
+                for i in range(options['requests']):
+                    try:
+                        if riders and rng.random() < 0.4:
+                            # Any thread's rider, so moves of one member compete.
+                            with lock:
+                                member_id = rng.choice(riders)
+                            url = reverse('update_member', kwargs={'slug': event.slug, 'member_id': member_id})
+                            response = client.post(url, {'car': rng.choice(car_ids + [''])})
+                            outcome = 'move'
+                        else:
+                            response = client.post(reverse('add_member', kwargs={'slug': event.slug}), {
+                                'name': f'Rider {number}-{i}',
+                                'car': rng.choice(car_ids),
+                            })
+                            member_id = (
+                                Member.objects.filter(event=event, name=f'Rider {number}-{i}')
+                                .values_list('pk', flat=True).first()
+                            )
+                            if member_id:
+                                with lock:
+                                    riders.append(member_id)
+                            outcome = 'join'
+                        if response.status_code in (429, 503):
+                            outcome = 'refused'
+                    except OperationalError as error:
+                        outcome = 'locked' if 'locked' in str(error) else 'db error'
+                    with lock:
+                        outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        rows = (
+            Car.objects.filter(event=event)
+            .annotate(member_count=Count('members'))
+            .values_list('pk', 'capacity', 'seats_taken', 'member_count')
+        )
+        problems = []
+        for car_id, capacity, seats_taken, member_count in rows:
+            if member_count > capacity:
+                problems.append(f"car {car_id}: {member_count} members in {capacity} seats")
+            if seats_taken != member_count:
+                problems.append(f"car {car_id}: seats_taken={seats_taken} but {member_count} members")
+
+        total = sum(outcomes.values())
+        self.stdout.write(
+            f"{total} requests in {elapsed:.2f}s ({total / elapsed:.0f}/s): "
+            + ", ".join(f"{kind} {count}" for kind, count in sorted(outcomes.items()))
+        )
+        self.stdout.write(
+            f"{Member.objects.filter(event=event, car__isnull=False).count()} seated, "
+            f"{Member.objects.filter(event=event, car__isnull=True).count()} unassigned, "
+            f"{options['cars'] * options['capacity']} seats"
+        )
+        if options['keep']:
+            self.stdout.write(f"Kept scratch event {event.slug}.")
+        else:
+            event.delete()
+
+        if problems:
+            raise CommandError("Overbooking detected:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("No car was overbooked."))
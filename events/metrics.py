@@ -0,0 +1,277 @@
+"""Request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` records, per resolved URL name, a latency histogram,
+the number and total time of SQL queries and a response size histogram.
+Cache lookups are counted through ``count_cache`` and requests turned away
+by admission control through ``count_rejection``. Queries are counted by an
+execute wrapper installed on every connection that reports to the request's
+counter through a context variable, so queries the async ORM runs on worker
+threads are attributed to the right request too.
+
+Every thread aggregates into its own ``_Shard``, so recording never takes a
+lock; ``render`` sums the shards when ``/metrics`` is scraped. Numbers are
+per process: with several worker processes, scrape each one or put a
+multiprocess-aware exporter in front. SQL run while a streaming response is
+being sent, after the view returned, is not included.
+"""
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+UNRESOLVED = '<unresolved>'
+
+
+class _ViewStats:
+    __slots__ = ('requests', 'latency_sum', 'latency_buckets', 'queries', 'sql_seconds',
+                 'size_sum', 'size_buckets', 'streaming', 'statuses')
+
+    def __init__(self):
+        self.requests = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.size_sum = 0
+        self.size_buckets = [0] * (len(SIZE_BUCKETS) + 1)
+        self.streaming = 0
+        self.statuses = {}
+
+
+class _Shard:
+    """One thread's counters; only that thread ever writes to it."""
+
+    def __init__(self):
+        self.views = {}
+        self.caches = {}
+        self.rejections = {}
+
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def _bucket(bounds, value):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            return index
+    return len(bounds)
+
+
+def record_request(view, status, seconds, queries, sql_seconds, size=None):
+    views = _shard().views
+    stats = views.get(view)
+    if stats is None:
+        stats = views[view] = _ViewStats()
+    stats.requests += 1
+    stats.latency_sum += seconds
+    stats.latency_buckets[_bucket(LATENCY_BUCKETS, seconds)] += 1
+    stats.queries += queries
+    stats.sql_seconds += sql_seconds
+    if size is None:
+        stats.streaming += 1
+    else:
+        stats.size_sum += size
+        stats.size_buckets[_bucket(SIZE_BUCKETS, size)] += 1
+    stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+
+def count_cache(cache, result):
+    """Count one lookup in ``cache`` (e.g. 'dashboard') that ended in ``result`` (e.g. 'hit')."""
+    caches = _shard().caches
+    caches[cache, result] = caches.get((cache, result), 0) + 1
+
+
+def count_rejection(view, reason):
+    """Count one request to ``view`` refused for ``reason`` (e.g. 'client' or 'concurrency')."""
+    rejections = _shard().rejections
+    rejections[view, reason] = rejections.get((view, reason), 0) + 1
+
+
+class _QueryCounter:
+    """The number and total time of the queries one request runs."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_current = ContextVar('carpool_query_counter', default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    counter = _current.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.seconds += time.perf_counter() - start
+        counter.queries += 1
+
+
+@receiver(connection_created)
+def install_query_counter(connection, **kwargs):
+    # Outermost, so execute_wrapper() blocks popping their own wrapper never remove it.
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_queries)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported missed the signal.
+        for alias in connections:
+            install_query_counter(connections[alias])
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = _QueryCounter()
+        token = _current.set(counter)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = _QueryCounter()
+        token = _current.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    def _record(self, request, response, elapsed, counter):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else UNRESOLVED
+        size = None if response.streaming else len(response.content)
+        record_request(view, response.status_code, elapsed, counter.queries, counter.seconds, size)
+
+
+def _merged():
+    views, caches, rejections = {}, {}, {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for view, stats in shard.views.copy().items():
+            total = views.setdefault(view, _ViewStats())
+            total.requests += stats.requests
+            total.latency_sum += stats.latency_sum
+            total.latency_buckets = [a + b for a, b in zip(total.latency_buckets, stats.latency_buckets)]
+            total.queries += stats.queries
+            total.sql_seconds += stats.sql_seconds
+            total.size_sum += stats.size_sum
+            total.size_buckets = [a + b for a, b in zip(total.size_buckets, stats.size_buckets)]
+            total.streaming += stats.streaming
+            for status, count in stats.statuses.copy().items():
+                total.statuses[status] = total.statuses.get(status, 0) + count
+        for key, count in shard.caches.copy().items():
+            caches[key] = caches.get(key, 0) + count
+        for key, count in shard.rejections.copy().items():
+            rejections[key] = rejections.get(key, 0) + count
+    return views, caches, rejections
+
+
+def _histogram(lines, name, view, bounds, buckets, total, count):
+    cumulative = 0
+    for bound, hits in zip(bounds, buckets):
+        cumulative += hits
+        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {count}')
+    lines.append(f'{name}_sum{{view="{view}"}} {total}')
+    lines.append(f'{name}_count{{view="{view}"}} {count}')
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    views, caches, rejections = _merged()
+    lines = [
+        '# HELP carpool_request_duration_seconds Time spent in the view and middleware.',
+        '# TYPE carpool_request_duration_seconds histogram',
+    ]
+    for view, stats in sorted(views.items()):
+        _histogram(lines, 'carpool_request_duration_seconds', view, LATENCY_BUCKETS,
+                   stats.latency_buckets, stats.latency_sum, stats.requests)
+    lines += [
+        '# HELP carpool_response_size_bytes Size of non-streaming response bodies.',
+        '# TYPE carpool_response_size_bytes histogram',
+    ]
+    for view, stats in sorted(views.items()):
+        _histogram(lines, 'carpool_response_size_bytes', view, SIZE_BUCKETS,
+                   stats.size_buckets, stats.size_sum, stats.requests - stats.streaming)
+    lines += [
+        '# HELP carpool_responses_total Responses by view and status code.',
+        '# TYPE carpool_responses_total counter',
+    ]
+    for view, stats in sorted(views.items()):
+        for status, count in sorted(stats.statuses.items()):
+            lines.append(f'carpool_responses_total{{view="{view}",status="{status}"}} {count}')
+    lines += [
+        '# HELP carpool_sql_queries_total SQL queries run while handling requests.',
+        '# TYPE carpool_sql_queries_total counter',
+    ]
+    lines += [f'carpool_sql_queries_total{{view="{view}"}} {stats.queries}' for view, stats in sorted(views.items())]
+    lines += [
+        '# HELP carpool_sql_duration_seconds_total Time spent in SQL while handling requests.',
+        '# TYPE carpool_sql_duration_seconds_total counter',
+    ]
+    lines += [f'carpool_sql_duration_seconds_total{{view="{view}"}} {stats.sql_seconds}' for view, stats in sorted(views.items())]
+    lines += [
+        '# HELP carpool_cache_lookups_total Cache lookups by cache and result.',
+        '# TYPE carpool_cache_lookups_total counter',
+    ]
+    lines += [
+        f'carpool_cache_lookups_total{{cache="{cache}",result="{result}"}} {count}'
+        for (cache, result), count in sorted(caches.items())
+    ]
+    lines += [
+        '# HELP carpool_rejected_requests_total Writes refused by rate limits or for overload, by view and reason.',
+        '# TYPE carpool_rejected_requests_total counter',
+    ]
+    lines += [
+        f'carpool_rejected_requests_total{{view="{view}",reason="{reason}"}} {count}'
+        for (view, reason), count in sorted(rejections.items())
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """The metrics, guarded by a bearer token when METRICS_TOKEN is set."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponseForbidden('Forbidden\n', content_type='text/plain')
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text="Bumped on every change to the event's cars or members"),
+        ),
+    ]
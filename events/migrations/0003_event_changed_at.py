@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0002_event_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, help_text="Time of the last change to the event's cars or members"),
+        ),
+    ]
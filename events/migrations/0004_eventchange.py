@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_event_changed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveIntegerField(help_text='Event version produced by this change')),
+                ('kind', models.CharField(choices=[('car_saved', 'Car saved'), ('car_deleted', 'Car deleted'), ('member_saved', 'Member saved'), ('member_deleted', 'Member deleted'), ('event_updated', 'Event updated')], max_length=20)),
+                ('payload', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='events.event')),
+            ],
+            options={
+                'ordering': ['seq'],
+                'unique_together': {('event', 'seq')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_eventchange'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventchange',
+            name='kind',
+            field=models.CharField(choices=[('car_saved', 'Car saved'), ('car_deleted', 'Car deleted'), ('member_saved', 'Member saved'), ('member_deleted', 'Member deleted'), ('event_updated', 'Event updated'), ('batch', 'Batch of changes')], max_length=20),
+        ),
+    ]
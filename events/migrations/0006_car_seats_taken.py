@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:22
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_seats(apps, schema_editor):
+    Car = apps.get_model('events', 'Car')
+    Member = apps.get_model('events', 'Member')
+    members = (
+        Member.objects.filter(car=OuterRef('pk')).order_by().values('car')
+        .annotate(total=Count('pk')).values('total')
+    )
+    Car.objects.update(seats_taken=Coalesce(Subquery(members), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0005_eventchange_batch_kind'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='seats_taken',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Members currently assigned (maintained on every join, move and removal)'),
+        ),
+        migrations.RunPython(count_seats, migrations.RunPython.noop),
+    ]
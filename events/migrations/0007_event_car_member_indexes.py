@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0006_car_seats_taken'),
+    ]
+
+    operations = [
+        # Composite indexes first; they make the plain FK indexes redundant.
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['event', 'created_at'], name='car_event_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['-created_at'], name='event_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['event', 'car', 'created_at'], name='member_event_car_idx'),
+        ),
+        migrations.AlterField(
+            model_name='car',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cars', to='events.event'),
+        ),
+        migrations.AlterField(
+            model_name='member',
+            name='event',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='members', to='events.event'),
+        ),
+    ]
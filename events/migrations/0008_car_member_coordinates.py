@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:53
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0007_event_car_member_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='start_lat',
+            field=models.FloatField(blank=True, help_text='Latitude the driver sets out from (optional)', null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='start_lng',
+            field=models.FloatField(blank=True, help_text='Longitude the driver sets out from (optional)', null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='pickup_lat',
+            field=models.FloatField(blank=True, help_text='Latitude to be picked up at (optional)', null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='pickup_lng',
+            field=models.FloatField(blank=True, help_text='Longitude to be picked up at (optional)', null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+    ]
@@ -0,0 +1,83 @@
+from django.db import migrations
+
+# (table, indexed columns by weight, best first, indexes its event)
+TABLES = [
+    ('events_event', ['name', 'location', 'slug'], False),
+    ('events_car', ['driver_name', 'car_name', 'notes'], True),
+    ('events_member', ['name', 'contact'], True),
+]
+PG_WEIGHTS = 'ABC'
+
+
+def _sqlite_statements(table, columns, by_event):
+    fts = f'{table}_fts'
+    indexed = (['event'] if by_event else []) + columns
+    values = (["'e' || event_id"] if by_event else []) + columns
+    new = (["'e' || new.event_id"] if by_event else []) + [f'new.{column}' for column in columns]
+    watched = (['event_id'] if by_event else []) + columns
+    insert = f"INSERT INTO {fts} (rowid, {', '.join(indexed)}) VALUES (new.id, {', '.join(new)});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(indexed)}, "
+        f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+        f"INSERT INTO {fts} (rowid, {', '.join(indexed)}) SELECT id, {', '.join(values)} FROM {table}",
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; END",
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {', '.join(watched)} ON {table} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; {insert} END",
+    ]
+
+
+def _postgresql_statements(table, columns, by_event):
+    vector = ' || '.join(
+        f"setweight(to_tsvector('simple', coalesce({column}, '')), '{PG_WEIGHTS[min(i, 2)]}')"
+        for i, column in enumerate(columns)
+    )
+    return [
+        f'ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED',
+        f'CREATE INDEX {table}_search_idx ON {table} USING GIN (search_vector)',
+    ]
+
+
+def _has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite' and not _has_fts5(schema_editor.connection):
+        return    # search falls back to LIKE lookups
+    for table, columns, by_event in TABLES:
+        if vendor == 'sqlite':
+            statements = _sqlite_statements(table, columns, by_event)
+        elif vendor == 'postgresql':
+            statements = _postgresql_statements(table, columns, by_event)
+        else:
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+
+def drop_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, _, _ in TABLES:
+        if vendor == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_fts_{trigger}')
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table}_fts')
+        elif vendor == 'postgresql':
+            schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+    # The FTS5 virtual tables and triggers live outside Django's model state.
+
+    dependencies = [
+        ('events', '0008_car_member_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The directory lives on the default database only (see events.sharding).
+
+    dependencies = [
+        ('events', '0009_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(unique=True)),
+                ('shard', models.CharField(help_text='Database alias holding the event', max_length=50)),
+                ('pinned', models.BooleanField(default=False, help_text='Moved here by hand; rebalancing leaves it alone')),
+                ('moving', models.BooleanField(default=False, help_text='Being copied to another shard; writes are refused meanwhile')),
+            ],
+            options={
+                'verbose_name': 'event shard',
+            },
+        ),
+    ]
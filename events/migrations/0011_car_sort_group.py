@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:52
+
+import django.db.models.expressions
+import django.db.models.functions.text
+import django.db.models.lookups
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0010_eventshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='sort_group',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(django.db.models.expressions.NegatedExpression(django.db.models.lookups.Exact(django.db.models.functions.text.Lower('car_name'), 'motorcycle')), then=models.Value(0)), models.When(django.db.models.lookups.GreaterThan(models.F('seats_taken'), 0), then=models.Value(1)), default=models.Value(2)), output_field=models.PositiveSmallIntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['event', 'sort_group', 'created_at', 'id'], name='car_event_page_idx'),
+        ),
+    ]
@@ -1,18 +1,45 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, router, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest, Lower
+from django.db.models.lookups import Exact, GreaterThan
+from django.utils import timezone
 from django.utils.text import slugify
 import uuid
 
 
+def _latitude(help_text):
+    return models.FloatField(null=True, blank=True, help_text=help_text,
+                             validators=[MinValueValidator(-90), MaxValueValidator(90)])
+
+
+def _longitude(help_text):
+    return models.FloatField(null=True, blank=True, help_text=help_text,
+                             validators=[MinValueValidator(-180), MaxValueValidator(180)])
+
+
+def _check_point(instance, latitude, longitude):
+    if (getattr(instance, latitude) is None) != (getattr(instance, longitude) is None):
+        raise ValidationError('Give both latitude and longitude, or neither.')
+
+
 class Event(models.Model):
     """Event model for carpool events."""
     name = models.CharField(max_length=200, help_text="Event title")
     date = models.DateField(null=True, blank=True, help_text="Event date")
     location = models.CharField(max_length=500, blank=True, help_text="Event location")
     slug = models.SlugField(unique=True, max_length=50, help_text="Unique slug for public access")
+    version = models.PositiveIntegerField(default=0, editable=False, help_text="Bumped on every change to the event's cars or members")
+    changed_at = models.DateTimeField(default=timezone.now, editable=False, help_text="Time of the last change to the event's cars or members")
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Admin listing and the archival scan by age.
+            models.Index(fields=['-created_at'], name='event_created_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -23,20 +50,114 @@ class Event(models.Model):
             base_slug = slugify(self.name)[:40]  # Limit base slug length
             unique_slug = f"{base_slug}-{uuid.uuid4().hex[:8]}"
             self.slug = unique_slug
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # ``version`` and ``changed_at`` are only ever bumped atomically by
+            # the database; never write back a possibly stale in-memory copy.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('version', 'changed_at')
+            ]
         super().save(*args, **kwargs)
 
 
+# Cars named this are motorcycles: one rider unless a capacity is set.
+MOTORCYCLE = 'motorcycle'
+
+
+class CarFull(Exception):
+    """Raised when a car has fewer free seats than a change needs."""
+    
+    def __init__(self, car_ids):
+        super().__init__(f"No free seats left in car(s) {', '.join(map(str, car_ids))}")
+        self.car_ids = list(car_ids)
+
+
+class CarQuerySet(models.QuerySet):
+    """
+    Seat bookkeeping for ``Car.seats_taken``. Reservations are race-free
+    without locking the event: single joins and moves use one conditional
+    UPDATE per car, bulk changes lock just the cars they touch.
+    """
+    
+    def reserve(self, seats=1):
+        """Take seats in every car that still has room; returns how many did."""
+        return self.filter(
+            Q(capacity__isnull=True) | Q(capacity__gte=F('seats_taken') + seats)
+        ).update(seats_taken=F('seats_taken') + seats)
+    
+    def release(self, seats=1):
+        return self.update(seats_taken=Greatest(F('seats_taken') - seats, Value(0)))
+    
+    def apply_seat_deltas(self, deltas):
+        """
+        Apply ``{car_id: seats}`` changes all-or-nothing under row locks.
+        Raises ``CarFull`` if any increase would exceed a car's capacity.
+        Must run inside a transaction.
+        """
+        deltas = {car_id: delta for car_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        cars = list(
+            self.select_for_update().filter(pk__in=deltas).order_by('pk').only('pk', 'capacity', 'seats_taken')
+        )
+        full = [
+            car.pk for car in cars
+            if deltas[car.pk] > 0 and car.capacity is not None
+            and car.seats_taken + deltas[car.pk] > car.capacity
+        ]
+        if full:
+            raise CarFull(full)
+        # One UPDATE with a branch per distinct new count, far fewer than the
+        # per-row branches of bulk_update.
+        taken = {}
+        for car in cars:
+            taken.setdefault(max(0, car.seats_taken + deltas[car.pk]), []).append(car.pk)
+        self.model.objects.filter(pk__in=deltas).update(seats_taken=Case(
+            *[When(pk__in=pks, then=Value(seats)) for seats, pks in taken.items()],
+            default=F('seats_taken'), output_field=models.PositiveIntegerField(),
+        ))
+    
+    def recount_seats(self):
+        """Reset ``seats_taken`` from the actual member rows."""
+        members = (
+            Member.objects.filter(car=OuterRef('pk')).order_by().values('car')
+            .annotate(total=Count('pk')).values('total')
+        )
+        return self.update(seats_taken=Coalesce(Subquery(members), Value(0)))
+
+
 class Car(models.Model):
     """Car model for each carpool vehicle."""
-    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='cars')
+    # Indexed by (event, created_at) and in page order below.
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='cars', db_index=False)
     driver_name = models.CharField(max_length=100, help_text="Driver's name")
     car_name = models.CharField(max_length=100, blank=True, help_text="Car name/label")
     capacity = models.PositiveIntegerField(null=True, blank=True, help_text="Number of seats available")
     notes = models.TextField(blank=True, help_text="Additional notes")
+    seats_taken = models.PositiveIntegerField(default=0, editable=False, help_text="Members currently assigned (maintained on every join, move and removal)")
+    start_lat = _latitude("Latitude the driver sets out from (optional)")
+    start_lng = _longitude("Longitude the driver sets out from (optional)")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Cars first, then motorcycles with riders, then empty motorcycles.
+    sort_group = models.GeneratedField(
+        expression=Case(
+            When(~Exact(Lower('car_name'), MOTORCYCLE), then=Value(0)),
+            When(GreaterThan(F('seats_taken'), 0), then=Value(1)),
+            default=Value(2),
+        ),
+        output_field=models.PositiveSmallIntegerField(),
+        db_persist=True,
+    )
+    
+    objects = CarQuerySet.as_manager()
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['event', 'created_at'], name='car_event_created_idx'),
+            # An event's cars in dashboard page order.
+            models.Index(fields=['event', 'sort_group', 'created_at', 'id'], name='car_event_page_idx'),
+        ]
     
     def __str__(self):
         car_display = f"{self.driver_name}'s car"
@@ -44,31 +165,144 @@ class Car(models.Model):
             car_display += f" ({self.car_name})"
         return car_display
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # ``seats_taken`` is only ever changed atomically by the
+            # database; never write back a possibly stale in-memory copy.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and not field.generated and field.name != 'seats_taken'
+            ]
+        super().save(*args, **kwargs)
+    
+    def clean(self):
+        _check_point(self, 'start_lat', 'start_lng')
+    
     @property
     def available_spots(self):
         """Calculate available spots in the car."""
         if self.capacity is None:
             return None
-        current_members = self.members.count()
-        return max(0, self.capacity - current_members)
+        return max(0, self.capacity - self.seats_taken)
+    
+    @property
+    def is_full(self):
+        return self.capacity is not None and self.seats_taken >= self.capacity
 
 
 class Member(models.Model):
     """Member model for carpool participants."""
-    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='members')
+    # Indexed by (event, name) and (event, car, created_at) below.
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='members', db_index=False)
     name = models.CharField(max_length=100, help_text="Member's name")
     contact = models.CharField(max_length=200, blank=True, help_text="Contact information (optional)")
     car = models.ForeignKey(Car, on_delete=models.SET_NULL, null=True, blank=True, related_name='members', help_text="Assigned car")
+    pickup_lat = _latitude("Latitude to be picked up at (optional)")
+    pickup_lng = _longitude("Longitude to be picked up at (optional)")
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['created_at']
         unique_together = ['event', 'name']  # Prevent duplicate names in same event
+        indexes = [
+            # An event's unassigned members, or those of some of its cars, in page order.
+            models.Index(fields=['event', 'car', 'created_at'], name='member_event_car_idx'),
+        ]
+    
+    # Car the row had when loaded; seats move only when this changes.
+    _loaded_car_id = None
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_car_id = instance.__dict__.get('car_id')
+        return instance
+    
+    def clean(self):
+        _check_point(self, 'pickup_lat', 'pickup_lng')
+        # Friendly early check; the reservation in save() is the real guard.
+        if self.car_id and self.car_id != self._loaded_car_id and self.car.is_full:
+            raise ValidationError({'car': f'{self.car} is full.'})
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding and self.car_id == self._loaded_car_id:
+            if kwargs.get('update_fields') is None:
+                # Someone may have moved the member since this copy was
+                # loaded; never write back its possibly stale car.
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name != 'car'
+                ]
+            super().save(*args, **kwargs)
+            return
+        using = kwargs.get('using') or router.db_for_write(Member, instance=self)
+        with transaction.atomic(using=using):
+            # Seats move from the car the row is in now, read under the
+            # transaction's lock, not from the one it had when loaded.
+            current = None if self._state.adding else current_car_id(self, using)
+            if self.car_id != current:
+                if self.car_id is not None and not Car.objects.using(using).filter(pk=self.car_id).reserve():
+                    raise CarFull([self.car_id])
+                if current is not None:
+                    Car.objects.using(using).filter(pk=current).release()
+            super().save(*args, **kwargs)
+        self._loaded_car_id = self.car_id
+    
     @property
     def is_unassigned(self):
         """Check if member is unassigned to any car."""
         return self.car is None
+
+
+def current_car_id(member, using):
+    """
+    The car ``member``'s row is in now, locking the row until the
+    transaction ends. On SQLite every write transaction already holds the
+    database lock from its ``BEGIN IMMEDIATE``.
+    """
+    return (
+        Member.objects.using(using).select_for_update().filter(pk=member.pk)
+        .values_list('car_id', flat=True).first()
+    )
+
+
+class EventChange(models.Model):
+    """Append-only log of changes to an event's cars and members."""
+    KIND_CHOICES = [
+        ('car_saved', 'Car saved'),
+        ('car_deleted', 'Car deleted'),
+        ('member_saved', 'Member saved'),
+        ('member_deleted', 'Member deleted'),
+        ('event_updated', 'Event updated'),
+        ('batch', 'Batch of changes'),
+    ]
+
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='changes')
+    seq = models.PositiveIntegerField(help_text="Event version produced by this change")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['seq']
+        unique_together = ['event', 'seq']
+    
+    def __str__(self):
+        return f"{self.event_id}#{self.seq} {self.kind}"
+
+
+class EventShard(models.Model):
+    """Directory entry: which shard database holds the event with this slug (see ``events.sharding``)."""
+    slug = models.SlugField(unique=True, max_length=50)
+    shard = models.CharField(max_length=50, help_text="Database alias holding the event")
+    pinned = models.BooleanField(default=False, help_text="Moved here by hand; rebalancing leaves it alone")
+    moving = models.BooleanField(default=False, help_text="Being copied to another shard; writes are refused meanwhile")
+    
+    class Meta:
+        verbose_name = 'event shard'
+    
+    def __str__(self):
+        return f"{self.slug} → {self.shard}"
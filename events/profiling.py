@@ -0,0 +1,324 @@
+"""Profiling single requests in production.
+
+``ProfilingMiddleware`` profiles a request when it carries a staff token
+(the ``X-Profile`` header or the ``_profile`` query parameter, both signed,
+handed out on the admin's profiles page) or, at ``PROFILE_SAMPLE_RATE``, at
+random. A profiled request records:
+
+* a cProfile dump of the thread that handled it,
+* every SQL statement in order, with its database and duration (the
+  statements only, never their parameters, which hold names and contacts),
+* the time spent rendering each template.
+
+Each capture is written to ``PROFILE_DIR`` as ``<id>.json`` (the request,
+its SQL and templates) and ``<id>.prof`` (load it with ``pstats`` or
+snakeviz). Only the newest ``PROFILE_MAX_CAPTURES`` are kept, and each keeps
+at most ``PROFILE_MAX_QUERIES`` statements. The response carries the capture
+id in ``X-Profile-Id``. The admin lists the slowest captures.
+
+Only one request per process is profiled at a time, since profilers cannot
+overlap (from Python 3.12 a second one fails to start, before that they
+overwrite each other's data). A request sampled or tokened meanwhile records
+its SQL and templates only, without a ``.prof``.
+
+The profiler follows one thread. For async views that is the event loop
+(which may interleave other requests) under ASGI, or, under WSGI, the
+request thread, where their ORM and template work runs. SQL and templates
+are attributed through a context variable, so they are always complete,
+except for what a streaming response does after the view returned.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.base import Template
+from django.utils import timezone
+
+from .sessionless import is_admin_request
+
+HEADER = 'X-Profile'
+PARAM = '_profile'
+TOKEN_SALT = 'events.profiling'
+MAX_SQL_LENGTH = 4000
+MAX_TEMPLATES = 500
+STAFF = 'staff'
+SAMPLED = 'sampled'
+
+_current = ContextVar('carpool_profile_capture', default=None)
+# Held while a request's cProfile is enabled.
+_profiler_lock = threading.Lock()
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'data' / 'profiles'))
+
+
+def profile_token(user):
+    """A token that has requests profiled for ``PROFILE_TOKEN_MAX_AGE`` seconds."""
+    return signing.dumps(user.pk, salt=TOKEN_SALT)
+
+
+class Capture:
+    """What one profiled request did, collected while it runs."""
+
+    def __init__(self, trigger):
+        self.trigger = trigger
+        self.queries = []
+        self.dropped_queries = 0
+        self.templates = []
+        self.depth = 0
+
+    def add_query(self, alias, sql, seconds, many):
+        if len(self.queries) >= getattr(settings, 'PROFILE_MAX_QUERIES', 1000):
+            self.dropped_queries += 1
+            return
+        self.queries.append({'alias': alias, 'sql': sql[:MAX_SQL_LENGTH], 'ms': seconds * 1000, 'many': many})
+
+
+def _capture_queries(execute, sql, params, many, context):
+    capture = _current.get()
+    if capture is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        capture.add_query(context['connection'].alias, sql, time.perf_counter() - start, many)
+
+
+@receiver(connection_created)
+def install_query_capture(connection, **kwargs):
+    if _capture_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _capture_queries)
+
+
+def install_template_timer():
+    """Time ``Template.render`` (like Django's test instrumentation does) while a capture is active."""
+    render = Template.render
+    if getattr(render, 'profiled', False):
+        return
+
+    @wraps(render)
+    def timed_render(self, context):
+        capture = _current.get()
+        if capture is None:
+            return render(self, context)
+        depth = capture.depth
+        capture.depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            capture.depth = depth
+            if len(capture.templates) < MAX_TEMPLATES:
+                capture.templates.append({
+                    'name': self.origin.template_name or self.name or '<string>',
+                    'ms': (time.perf_counter() - start) * 1000, 'depth': depth,
+                })
+
+    timed_render.profiled = True
+    Template.render = timed_render
+
+
+def _start_profiler():
+    """An enabled profiler, or None while another request's is running."""
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        _profiler_lock.release()
+        return None    # another profiling tool is active
+    return profiler
+
+
+def _stop_profiler(profiler):
+    if profiler is not None:
+        profiler.disable()
+        _profiler_lock.release()
+
+
+def _token(request):
+    return request.headers.get(HEADER) or request.GET.get(PARAM)
+
+
+def _staff_token(token):
+    """Whether ``token`` is a live profiling token of an active staff user."""
+    try:
+        user_id = signing.loads(token, salt=TOKEN_SALT, max_age=getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return False
+    return get_user_model()._default_manager.filter(pk=user_id, is_staff=True, is_active=True).exists()
+
+
+def _sampled(request):
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+    return rate > 0 and random.random() < rate and not is_admin_request(request)
+
+
+def _path(request):
+    query = request.GET.copy()
+    query.pop(PARAM, None)
+    return request.path + (f'?{query.urlencode()}' if query else '')
+
+
+def _write(path, write):
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    os.close(fd)
+    try:
+        write(tmp_name)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def _rotate(root, keep):
+    for stale in sorted(root.glob('*.json'))[:-keep]:
+        for path in (stale, stale.with_suffix('.prof')):
+            path.unlink(missing_ok=True)
+
+
+def save(capture, profiler, request, response, seconds):
+    """
+    Write ``capture`` and its profile, if it has one, to ``PROFILE_DIR``,
+    dropping the oldest; returns its id.
+    """
+    now = timezone.now()
+    capture_id = f"{now:%Y%m%d-%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    match = getattr(request, 'resolver_match', None)
+    record = {
+        'id': capture_id,
+        'at': now.isoformat(),
+        'trigger': capture.trigger,
+        'profiled': profiler is not None,
+        'method': request.method,
+        'path': _path(request),
+        'view': (match.url_name or match.view_name) if match else None,
+        'status': response.status_code,
+        'ms': seconds * 1000,
+        'sql_ms': sum(query['ms'] for query in capture.queries),
+        'query_count': len(capture.queries) + capture.dropped_queries,
+        'dropped_queries': capture.dropped_queries,
+        'template_ms': sum(template['ms'] for template in capture.templates if template['depth'] == 0),
+        'queries': capture.queries,
+        'templates': capture.templates,
+    }
+    root = profile_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    if profiler is not None:
+        _write(root / f'{capture_id}.prof', profiler.dump_stats)
+    _write(root / f'{capture_id}.json', lambda name: Path(name).write_text(json.dumps(record)))
+    _rotate(root, max(getattr(settings, 'PROFILE_MAX_CAPTURES', 200), 1))
+    return capture_id
+
+
+def captures():
+    """Every capture's record without its SQL and templates, newest first."""
+    records = []
+    for path in sorted(profile_dir().glob('*.json'), reverse=True):
+        try:
+            record = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue    # rotated away or half-written meanwhile
+        record.pop('queries', None)
+        record.pop('templates', None)
+        records.append(record)
+    return records
+
+
+def load(capture_id):
+    """The full record of a capture, or None."""
+    try:
+        return json.loads((profile_dir() / f'{capture_id}.json').read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def profile_path(capture_id):
+    return profile_dir() / f'{capture_id}.prof'
+
+
+def stats_text(capture_id, sort='cumulative', limit=40):
+    """The top ``limit`` functions of a capture's profile, as ``pstats`` prints them."""
+    out = io.StringIO()
+    pstats.Stats(str(profile_path(capture_id)), stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported missed the signal.
+        for alias in connections:
+            install_query_capture(connections[alias])
+        install_template_timer()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _token(request)
+        trigger = self._trigger(request, token and _staff_token(token))
+        if trigger is None:
+            return self.get_response(request)
+        capture = Capture(trigger)
+        context = _current.set(capture)
+        start = time.perf_counter()
+        profiler = _start_profiler()
+        try:
+            response = self.get_response(request)
+        finally:
+            _stop_profiler(profiler)
+            _current.reset(context)
+        return self._saved(response, capture, profiler, request, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        token = _token(request)
+        trigger = self._trigger(request, token and await sync_to_async(_staff_token)(token))
+        if trigger is None:
+            return await self.get_response(request)
+        capture = Capture(trigger)
+        context = _current.set(capture)
+        start = time.perf_counter()
+        profiler = _start_profiler()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _stop_profiler(profiler)
+            _current.reset(context)
+        return await sync_to_async(self._saved)(response, capture, profiler, request, time.perf_counter() - start)
+
+    def _trigger(self, request, staff):
+        if staff:
+            return STAFF
+        return SAMPLED if _sampled(request) else None
+
+    def _saved(self, response, capture, profiler, request, seconds):
+        try:
+            response[f'{HEADER}-Id'] = save(capture, profiler, request, response, seconds)
+        except OSError:
+            pass    # a full or read-only disk must not fail the request
+        return response
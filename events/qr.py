@@ -0,0 +1,156 @@
+"""QR code rendering with a two-level cache.
+
+Rendered images are looked up in a bounded in-process LRU first, then in a
+content-addressed store on disk (shared by all workers and by the
+``prerender_qr`` management command), and only encoded when both miss.
+
+Async callers use ``arender_qr``, which answers memory hits inline and does
+disk reads and encoding on a small bounded thread pool, so the event loop
+never blocks on them.
+
+This module deliberately avoids the ORM so it can run in worker processes.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+
+from .metrics import count_cache
+
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+DEFAULT_FORMAT = 'png'
+BOX_SIZE = 10
+BORDER = 4
+
+
+class LRUCache:
+    """A small thread-safe LRU mapping bounded by entry count."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return None
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_memory = LRUCache(getattr(settings, 'QR_MEMORY_CACHE_SIZE', 256))
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _render_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'QR_RENDER_WORKERS', None) or min(4, os.cpu_count() or 1)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='qr-render')
+        return _executor
+
+
+def qr_key(data, fmt=DEFAULT_FORMAT, box_size=BOX_SIZE, border=BORDER):
+    """Content address of a QR image: a digest of everything that shapes it."""
+    return hashlib.sha256(f'{fmt}\x1f{box_size}\x1f{border}\x1f{data}'.encode()).hexdigest()
+
+
+def _disk_path(key, fmt):
+    root = Path(getattr(settings, 'QR_CACHE_DIR', settings.BASE_DIR / 'data' / 'qr'))
+    return root / key[:2] / f'{key}.{fmt}'
+
+
+def _read_disk(path):
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None
+
+
+def _write_disk(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def encode_qr(data, fmt=DEFAULT_FORMAT, box_size=BOX_SIZE, border=BORDER):
+    """Encode ``data`` as a QR image without touching any cache."""
+    if fmt not in QR_FORMATS:
+        raise ValueError(f'Unsupported QR format: {fmt!r}')
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = BytesIO()
+    if fmt == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_qr(data, fmt=DEFAULT_FORMAT, box_size=BOX_SIZE, border=BORDER):
+    """Return the QR image for ``data`` as bytes, using the memory and disk caches."""
+    key = qr_key(data, fmt, box_size, border)
+    content = _memory.get(key)
+    if content is not None:
+        count_cache('qr', 'memory')
+        return content
+    path = _disk_path(key, fmt)
+    content = _read_disk(path)
+    if content is None:
+        count_cache('qr', 'miss')
+        content = encode_qr(data, fmt, box_size, border)
+        _write_disk(path, content)
+    else:
+        count_cache('qr', 'disk')
+    _memory.set(key, content)
+    return content
+
+
+async def arender_qr(data, fmt=DEFAULT_FORMAT, box_size=BOX_SIZE, border=BORDER):
+    """``render_qr`` for async views: cache misses run on the bounded render pool."""
+    content = _memory.get(qr_key(data, fmt, box_size, border))
+    if content is not None:
+        count_cache('qr', 'memory')
+        return content
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_render_pool(), render_qr, data, fmt, box_size, border)
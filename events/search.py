@@ -0,0 +1,255 @@
+"""Ranked, prefix-matching full-text search over events, cars and members.
+
+On SQLite each table has an FTS5 index (``events_event_fts`` and so on,
+rowid = object id) kept in step by insert/update/delete triggers; car and
+member rows also index their event as a ``e<id>`` token, so searching
+inside one event is an index intersection rather than a scan. On
+PostgreSQL each table has a generated, GIN-indexed ``search_vector``
+tsvector column. Both are created by migration 0009. Django rebuilds
+SQLite tables for some schema changes, which drops their triggers, so
+after every ``migrate`` ``repair_after_migrate`` reinstalls missing ones
+and re-indexes their tables (``rebuild_search_index`` does the same by
+hand).
+
+Queries are split into words, and every word must prefix-match some
+indexed column: "ana off" finds "Ana Reyes" at "Office Party". Results are
+ranked by BM25 (SQLite) or ``ts_rank`` (PostgreSQL), with names weighted
+above the other columns. Where neither index exists (an SQLite build
+without FTS5) the same filters fall back to ``icontains`` lookups.
+"""
+import operator
+import re
+from functools import reduce
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Car, Event, Member
+
+MAX_TERMS = 8
+MAX_TERM_LENGTH = 50
+DEFAULT_LIMIT = 20
+
+
+class Index:
+    """How one model is indexed: its columns, by rank weight, best first."""
+
+    def __init__(self, model, columns, weights, by_event):
+        self.model = model
+        self.columns = columns
+        self.weights = weights
+        self.by_event = by_event
+        self.table = model._meta.db_table
+        self.fts_table = f'{self.table}_fts'
+
+
+INDEXES = {
+    Event: Index(Event, ('name', 'location', 'slug'), (10.0, 4.0, 1.0), by_event=False),
+    Car: Index(Car, ('driver_name', 'car_name', 'notes'), (10.0, 4.0, 1.0), by_event=True),
+    Member: Index(Member, ('name', 'contact'), (10.0, 2.0), by_event=True),
+}
+
+
+def terms(text):
+    """The words of a search box query, lowercased and capped."""
+    return [word[:MAX_TERM_LENGTH] for word in re.findall(r'\w+', text.lower())[:MAX_TERMS]]
+
+
+def available(using=DEFAULT_DB_ALIAS):
+    """Whether the database has the full-text indexes (checked once per connection)."""
+    connection = connections[using]
+    if getattr(connection, 'search_available', None) is None:
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'events_event_fts'")
+                connection.search_available = cursor.fetchone() is not None
+        else:
+            connection.search_available = connection.vendor == 'postgresql'
+    return connection.search_available
+
+
+def _match_sql(index, words, connection, event_id=None, ranked=False, limit=None):
+    """SQL selecting matching ids (best first when ``ranked``) and its params."""
+    if connection.vendor == 'sqlite':
+        query = ' '.join(f'"{word}"*' for word in words)
+        # The event token column is only ever matched explicitly.
+        query = f'{{{" ".join(index.columns)}}} : ({query})'
+        if event_id is not None:
+            query = f'event : e{int(event_id)} AND {query}'
+        sql = f'SELECT rowid FROM {index.fts_table} WHERE {index.fts_table} MATCH %s'
+        params = [query]
+        if ranked:
+            weights = ((0.0,) if index.by_event else ()) + index.weights
+            sql += f' ORDER BY bm25({index.fts_table}, {", ".join(map(str, weights))})'
+    else:
+        query = ' & '.join(f'{word}:*' for word in words)
+        sql = f"SELECT id FROM {index.table} WHERE search_vector @@ to_tsquery('simple', %s)"
+        params = [query]
+        if event_id is not None:
+            sql += ' AND event_id = %s'
+            params.append(event_id)
+        if ranked:
+            sql += " ORDER BY ts_rank(search_vector, to_tsquery('simple', %s)) DESC, id"
+            params.append(query)
+    if limit is not None:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    return sql, params
+
+
+def _fallback(model, words):
+    return reduce(operator.and_, [
+        reduce(operator.or_, [Q(**{f'{column}__icontains': word}) for column in INDEXES[model].columns])
+        for word in words
+    ])
+
+
+def matching(model, text, using=None):
+    """
+    A ``Q`` for the ``model`` rows matching ``text``, unranked, for use in
+    querysets on ``using`` (default: where the model is routed); ``None``
+    if the text has no words.
+    """
+    words = terms(text)
+    if not words:
+        return None
+    using = using or router.db_for_read(model)
+    if not available(using):
+        return _fallback(model, words)
+    return Q(pk__in=RawSQL(*_match_sql(INDEXES[model], words, connections[using])))
+
+
+def search(model, text, event=None, limit=DEFAULT_LIMIT, using=None):
+    """
+    The ``model`` objects best matching ``text``, best first, optionally
+    within one ``event``. Cars and members must be searched within an event.
+    """
+    index = INDEXES[model]
+    if index.by_event and event is None:
+        raise ValueError(f'{model.__name__} search needs an event.')
+    words = terms(text)
+    if not words:
+        return []
+    using = using or router.db_for_read(model)
+    queryset = model._default_manager.using(using)
+    if event is not None:
+        queryset = queryset.filter(event=event)
+    if not available(using):
+        return list(queryset.filter(_fallback(model, words)).order_by(*index.columns[:1], 'pk')[:limit])
+    with connections[using].cursor() as cursor:
+        cursor.execute(*_match_sql(
+            index, words, connections[using], getattr(event, 'pk', None), ranked=True, limit=limit,
+        ))
+        ids = [row[0] for row in cursor.fetchall()]
+    found = queryset.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found]
+
+
+def filter_search(queryset, text):
+    """
+    ``queryset`` narrowed to rows matching ``text``, in their own columns
+    or (for cars and members) their event's name.
+    """
+    condition = matching(queryset.model, text, queryset.db)
+    if condition is None:
+        return queryset
+    if INDEXES[queryset.model].by_event:
+        condition |= Q(event__in=Event.objects.using(queryset.db).filter(matching(Event, text, queryset.db)).values('pk'))
+    return queryset.filter(condition)
+
+
+def _sqlite_columns(index):
+    """The FTS columns and the table columns they are filled from."""
+    if index.by_event:
+        return ['event', *index.columns], ['event_id', *index.columns]
+    return list(index.columns), list(index.columns)
+
+
+def _values(index, row=''):
+    """SQL for the FTS column values of a table row (``row='new.'`` in triggers)."""
+    values = [f'{row}{column}' for column in index.columns]
+    return ', '.join([f"'e' || {row}event_id", *values] if index.by_event else values)
+
+
+def install(using=DEFAULT_DB_ALIAS):
+    """Create any missing FTS5 table or trigger (SQLite only); returns the models that lacked one."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not available(using):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+    statements = []
+    repaired = []
+    for index in INDEXES.values():
+        before = len(statements)
+        fts, table = index.fts_table, index.table
+        indexed, watched = _sqlite_columns(index)
+        insert = f"INSERT INTO {fts} (rowid, {', '.join(indexed)}) VALUES (new.id, {_values(index, 'new.')});"
+        if fts not in existing:
+            statements.append(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(indexed)}, "
+                f"tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        triggers = {
+            f'{fts}_insert': f'AFTER INSERT ON {table} BEGIN {insert} END',
+            f'{fts}_delete': f'AFTER DELETE ON {table} BEGIN DELETE FROM {fts} WHERE rowid = old.id; END',
+            f'{fts}_update': f"AFTER UPDATE OF {', '.join(watched)} ON {table} BEGIN "
+                             f"DELETE FROM {fts} WHERE rowid = old.id; {insert} END",
+        }
+        statements += [f'CREATE TRIGGER {name} {body}' for name, body in triggers.items() if name not in existing]
+        if len(statements) > before:
+            repaired.append(index.model)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+    return repaired
+
+
+def repair_after_migrate(sender, using=DEFAULT_DB_ALIAS, verbosity=1, stdout=None, **kwargs):
+    """
+    ``post_migrate`` handler: reinstall the triggers a migration dropped by
+    rebuilding a table, and re-index that table, whose rows changed unseen.
+    Databases without the search tables (before migration 0009) are left alone.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    connection.search_available = None    # the migration may have just created or dropped it
+    if not available(using):
+        return
+    for model in install(using):
+        for _ in rebuild(model, using=using):
+            pass
+        if verbosity >= 1 and stdout is not None:
+            stdout.write(f"  Reinstalled search triggers and re-indexed {model._meta.db_table}.")
+
+
+def rebuild(model, batch_size=1000, start=1, using=DEFAULT_DB_ALIAS):
+    """
+    Re-index ``model`` rows with ids from ``start`` in batches of
+    ``batch_size`` ids, each in its own short transaction, so writers are
+    never blocked for long. Yields the last id of each batch.
+    SQLite only: PostgreSQL's generated vectors are never stale.
+    """
+    index = INDEXES[model]
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not available(using):
+        return
+    indexed, _ = _sqlite_columns(index)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MAX(id) FROM {index.table}')
+        last = cursor.fetchone()[0] or 0
+    low = start
+    while low <= last:
+        high = low + batch_size - 1
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {index.fts_table} WHERE rowid BETWEEN %s AND %s', [low, high])
+            cursor.execute(
+                f"INSERT INTO {index.fts_table} (rowid, {', '.join(indexed)}) "
+                f"SELECT id, {_values(index)} FROM {index.table} WHERE id BETWEEN %s AND %s",
+                [low, high],
+            )
+        yield min(high, last)
+        low = high + 1
@@ -0,0 +1,59 @@
+"""The public request path, without sessions.
+
+Event pages have no accounts, so only the admin needs sessions and users:
+``AdminSessionMiddleware`` and ``AdminAuthenticationMiddleware`` run
+Django's middleware for requests under the admin's URL only, and nothing
+else ever reads or writes ``django_session``. Flash messages travel in a
+signed cookie (``MessageCookieStorage``) and the CSRF token in its own
+cookie, for admin requests too.
+"""
+from functools import cache
+
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.urls import reverse
+
+# Longer messages are cut so they never overflow the cookie and get dropped.
+MAX_MESSAGE_LENGTH = 600
+
+
+@cache
+def admin_prefix():
+    return reverse('admin:index')
+
+
+def is_admin_request(request):
+    return request.path_info.startswith(admin_prefix())
+
+
+class AdminSessionMiddleware(SessionMiddleware):
+    """``SessionMiddleware`` for admin requests only."""
+
+    def process_request(self, request):
+        if is_admin_request(request):
+            super().process_request(request)
+
+    def process_response(self, request, response):
+        if not hasattr(request, 'session'):
+            return response
+        return super().process_response(request, response)
+
+
+class AdminAuthenticationMiddleware(AuthenticationMiddleware):
+    """``AuthenticationMiddleware`` for requests that have a session, i.e. admin ones."""
+
+    def process_request(self, request):
+        if hasattr(request, 'session'):
+            super().process_request(request)
+
+
+class MessageCookieStorage(CookieStorage):
+    """Signed-cookie flash messages, each cut short enough to always fit."""
+
+    def _store(self, messages, response, *args, **kwargs):
+        for message in messages:
+            text = str(message.message)
+            if len(text) > MAX_MESSAGE_LENGTH:
+                message.message = text[:MAX_MESSAGE_LENGTH - 1] + '…'
+        return super()._store(messages, response, *args, **kwargs)
@@ -0,0 +1,261 @@
+"""Events spread over several databases ("shards"), one whole event per shard.
+
+Every event, with its cars, members and change log, lives on exactly one of
+the databases in ``EVENT_SHARDS``. On SQLite each shard is its own file with
+its own write lock, so writes to events on different shards never queue
+behind each other. ``EventShardRouter`` sends the events app's queries to
+the current shard: ``ShardMiddleware`` sets it from the URL's slug before
+the view runs, and code outside requests picks one with ``use_shard``.
+Transactions on event data must be opened with ``event_atomic``.
+
+A new event is placed by rendezvous hashing of its slug, so adding a shard
+only moves the events that now hash onto it. The directory (``EventShard``
+rows on the default database) records where each event actually is; an
+event it does not know yet is looked for where its slug hashes to.
+``migrate_shards`` migrates every database and records the events already
+on them; ``rebalance_shards`` moves events to where they hash (or one event
+to a shard of your choice), refusing writes to an event while it moves.
+
+Users, sessions, the admin log and the directory stay on the default
+database, which is also the first shard. With a single shard nothing
+changes: the middleware switches itself off and no directory is kept.
+"""
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+from .models import Event, EventShard
+from .sessionless import is_admin_request
+
+APP_LABEL = Event._meta.app_label
+# The admin browses one shard at a time, picked with a cookie (see admin.choose_shard).
+ADMIN_COOKIE = 'admin_shard'
+# Seconds writers are asked to wait while their event is being moved.
+MOVE_RETRY_AFTER = 5
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_current = ContextVar('carpool_event_shard', default=None)
+
+
+def shards():
+    """The database aliases events are spread over; the default database is the first."""
+    return list(getattr(settings, 'EVENT_SHARDS', None) or [DEFAULT_DB_ALIAS])
+
+
+def sharded():
+    return len(shards()) > 1
+
+
+def _score(alias, slug):
+    return hashlib.blake2b(f'{alias}:{slug}'.encode(), digest_size=8).digest()
+
+
+def placement(slug):
+    """The shard ``slug`` hashes to: the one scoring highest for it."""
+    return max(shards(), key=lambda alias: _score(alias, slug))
+
+
+def _entry(slug):
+    return EventShard.objects.filter(slug=slug).values_list('shard', 'moving').first()
+
+
+async def _aentry(slug):
+    return await EventShard.objects.filter(slug=slug).values_list('shard', 'moving').afirst()
+
+
+def locate(slug):
+    """The shard holding the event ``slug``: its directory entry, else where it hashes to."""
+    if not sharded():
+        return DEFAULT_DB_ALIAS
+    entry = _entry(slug)
+    return entry[0] if entry else placement(slug)
+
+
+def current():
+    """The shard event data is read from and written to right now."""
+    return _current.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_shard(alias):
+    """Send the events app's queries to ``alias`` inside the block."""
+    token = _current.set(alias)
+    try:
+        yield alias
+    finally:
+        _current.reset(token)
+
+
+def event_atomic(**kwargs):
+    """``transaction.atomic`` on the current shard."""
+    return transaction.atomic(using=current(), **kwargs)
+
+
+def record(slug, alias):
+    """Note in the directory that the event ``slug`` is on ``alias``."""
+    EventShard.objects.bulk_create(
+        [EventShard(slug=slug, shard=alias)],
+        update_conflicts=True, unique_fields=['slug'], update_fields=['shard'],
+    )
+
+
+def forget(slug, alias):
+    """Drop the directory entry of the event ``slug``, unless it already points elsewhere."""
+    EventShard.objects.filter(slug=slug, shard=alias).delete()
+
+
+def index_directory(alias, batch_size=1000):
+    """Record every event on ``alias`` the directory does not know yet; returns how many."""
+    slugs = Event.objects.using(alias).order_by('pk').values_list('slug', flat=True).iterator(chunk_size=batch_size)
+    added = 0
+    while batch := list(islice(slugs, batch_size)):
+        known = set(EventShard.objects.filter(slug__in=batch).values_list('slug', flat=True))
+        missing = [EventShard(slug=slug, shard=alias) for slug in batch if slug not in known]
+        EventShard.objects.bulk_create(missing)
+        added += len(missing)
+    return added
+
+
+def misplaced():
+    """Directory entries of events that are not where their slug hashes to, and not pinned there."""
+    entries = EventShard.objects.filter(pinned=False).order_by('pk').values_list('slug', 'shard')
+    for slug, alias in entries.iterator():
+        target = placement(slug)
+        if target != alias:
+            yield slug, alias, target
+
+
+def move_event(slug, target, pin=False):
+    """
+    Move the event ``slug`` with its cars and members to shard ``target``;
+    returns False if it is already there. The copy goes through the archive
+    format, so car and member ids change and open pages reload. Writes to
+    the event are refused while it moves and its old shard stays locked for
+    writing until the copy is done, so nothing written meanwhile is lost.
+    ``pin`` keeps rebalancing from moving it back.
+    """
+    from .archiving import restore_event, write_archive
+
+    if target not in shards():
+        raise ValueError(f"{target!r} is not one of the shards {', '.join(shards())}.")
+    source = locate(slug)
+    if source == target:
+        if pin:
+            EventShard.objects.filter(slug=slug).update(pinned=True)
+        return False
+    EventShard.objects.update_or_create(slug=slug, defaults={'shard': source, 'moving': True})
+    try:
+        with tempfile.TemporaryDirectory() as scratch, use_shard(source), event_atomic():
+            event = Event.objects.select_for_update().get(slug=slug)
+            write_archive(event, scratch)
+            with use_shard(target):
+                restore_event(slug, scratch)
+            EventShard.objects.filter(slug=slug).update(shard=target, pinned=pin)
+            # The cascade still sends each car's and member's post_delete;
+            # signals._deleting_event(origin) makes those skip the seat
+            # release and change log entries. Keep that guard.
+            Event.objects.filter(pk=event.pk).delete()
+    finally:
+        EventShard.objects.filter(slug=slug).update(moving=False)
+    return True
+
+
+class EventShardRouter:
+    """The events app on the current shard; its directory and every other app on the default database."""
+
+    def _route(self, model, instance=None):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        if model is EventShard:
+            return DEFAULT_DB_ALIAS
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        alias = _current.get()
+        if alias is None and isinstance(instance, Event) and instance.slug:
+            return placement(instance.slug)
+        return alias
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._meta.app_label == obj2._meta.app_label == APP_LABEL:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == APP_LABEL and model_name != EventShard._meta.model_name:
+            return db in shards()
+        return db == DEFAULT_DB_ALIAS
+
+
+def admin_shard(request):
+    alias = request.COOKIES.get(ADMIN_COOKIE)
+    return alias if alias in shards() else DEFAULT_DB_ALIAS
+
+
+class ShardMiddleware:
+    """
+    Serve each request from its event's shard, found through the directory
+    by the URL's slug; admin requests use the shard picked in the admin.
+    Writes to an event that is being moved get a 503 with Retry-After.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not sharded():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        slug = self._slug(request)
+        refused = self._activate(request, slug, _entry(slug) if slug else None)
+        return refused or self.get_response(request)
+
+    async def __acall__(self, request):
+        slug = self._slug(request)
+        refused = self._activate(request, slug, await _aentry(slug) if slug else None)
+        return refused or await self.get_response(request)
+
+    def _slug(self, request):
+        try:
+            return resolve(request.path_info).kwargs.get('slug')
+        except Resolver404:
+            return None
+
+    def _activate(self, request, slug, entry):
+        alias = None
+        if slug:
+            alias, moving = entry or (placement(slug), False)
+            if moving and request.method not in SAFE_METHODS:
+                response = HttpResponse(
+                    "This event is being moved to another database. Please try again in a few seconds.",
+                    status=503, content_type='text/plain',
+                )
+                response['Retry-After'] = str(MOVE_RETRY_AFTER)
+                return response
+        elif is_admin_request(request):
+            alias = admin_shard(request)
+            request.admin_shards = shards()
+        # Set for every request rather than reset afterwards: streaming
+        # responses still read from the shard after this returns.
+        _current.set(alias)
+        request.event_shard = alias or DEFAULT_DB_ALIAS
+        return None
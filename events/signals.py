@@ -0,0 +1,111 @@
+import threading
+from contextlib import contextmanager
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .changes import car_payload, event_payload, member_payload, record_change
+from .models import Car, Event, Member, current_car_id
+from .sharding import forget, record, sharded
+
+
+_state = threading.local()
+
+
+@contextmanager
+def changes_deferred():
+    """
+    Skip the per-row change records below, e.g. for bulk operations that
+    record a single summarising change themselves.
+    """
+    previous = getattr(_state, 'deferred', False)
+    _state.deferred = True
+    try:
+        yield
+    finally:
+        _state.deferred = previous
+
+
+def _deferred():
+    return getattr(_state, 'deferred', False)
+
+
+@contextmanager
+def seats_released():
+    """
+    Skip the per-row seat release below, for bulk deletes that have already
+    released their members' seats in one update.
+    """
+    previous = getattr(_state, 'seats_released', False)
+    _state.seats_released = True
+    try:
+        yield
+    finally:
+        _state.seats_released = previous
+
+
+def _deleting_event(origin):
+    """True when the delete cascades from removing the whole event."""
+    if isinstance(origin, QuerySet):
+        return origin.model is Event
+    return isinstance(origin, Event)
+
+
+@receiver(post_save, sender=Car)
+def car_saved(sender, instance, **kwargs):
+    if not _deferred():
+        record_change(instance.event_id, 'car_saved', {'car': car_payload(instance)})
+
+
+@receiver(post_delete, sender=Car)
+def car_deleted(sender, instance, origin=None, **kwargs):
+    # Its members were unassigned by SET_NULL; viewers move them client-side.
+    if not _deferred() and not _deleting_event(origin):
+        record_change(instance.event_id, 'car_deleted', {'car': {'id': instance.pk}})
+
+
+@receiver(post_save, sender=Member)
+def member_saved(sender, instance, **kwargs):
+    if not _deferred():
+        record_change(instance.event_id, 'member_saved', {'member': member_payload(instance)})
+
+
+@receiver(pre_delete, sender=Member)
+def release_seat(sender, instance, using, origin=None, **kwargs):
+    """
+    Seat bookkeeping is not deferred with the change records: bulk deletes
+    release seats too, unless under ``seats_released``. This runs inside the
+    delete's transaction, so the seat released is the one the row holds now,
+    not the one it had when ``instance`` was loaded.
+    """
+    if not _deleting_event(origin) and not getattr(_state, 'seats_released', False):
+        car_id = current_car_id(instance, using)
+        if car_id is not None:
+            Car.objects.using(using).filter(pk=car_id).release()
+
+
+@receiver(post_delete, sender=Member)
+def member_deleted(sender, instance, origin=None, **kwargs):
+    if not _deferred() and not _deleting_event(origin):
+        record_change(instance.event_id, 'member_deleted', {'member': {'id': instance.pk}})
+
+
+@receiver(post_save, sender=Event)
+def event_updated(sender, instance, created, **kwargs):
+    """Edits to the event itself (e.g. through the admin) also change the page."""
+    if not created and not _deferred():
+        record_change(instance.pk, 'event_updated', {'event': event_payload(instance)})
+
+
+@receiver(post_save, sender=Event)
+def event_placed(sender, instance, using, **kwargs):
+    """Keep the shard directory in step; it is only kept with several shards."""
+    if sharded():
+        record(instance.slug, using)
+
+
+@receiver(post_delete, sender=Event)
+def event_removed(sender, instance, using, **kwargs):
+    if sharded():
+        forget(instance.slug, using)
@@ -0,0 +1,15 @@
+'use strict';
+// Autocomplete list filters (events.admin.AutocompleteFilter): reload the
+// changelist filtered by the picked object, or unfiltered when cleared.
+django.jQuery(function ($) {
+    $('select[data-filter-param]').on('change', function () {
+        const base = this.dataset.filterClearUrl;
+        if (!this.value) {
+            window.location.search = base;
+            return;
+        }
+        const params = new URLSearchParams(base);
+        params.set(this.dataset.filterParam, this.value);
+        window.location.search = params.toString();
+    });
+});
@@ -0,0 +1,585 @@
+function copyUrl() {
+    const input = document.getElementById('event-url');
+    input.select();
+    document.execCommand('copy');
+    
+    const button = event.target;
+    const originalText = button.textContent;
+    button.textContent = 'Copied!';
+    button.classList.add('btn-success');
+    button.classList.remove('btn-outline');
+    setTimeout(() => {
+        button.textContent = originalText;
+        button.classList.remove('btn-success');
+        button.classList.add('btn-outline');
+    }, 1000);
+}
+
+function showMoveModal(button) {
+    const row = button.closest('[data-member-id]');
+    const eventUrl = document.getElementById('event-dashboard').dataset.eventUrl;
+    document.getElementById('modalTitle').textContent = 'Move ' + row.dataset.memberName;
+    document.getElementById('moveForm').action = `${eventUrl}member/${row.dataset.memberId}/update/`;
+    prepareCarPicker(document.getElementById('carSelect'));
+    document.getElementById('moveModal').showModal();
+}
+
+function confirmRemove(button) {
+    return confirm('Remove ' + button.closest('[data-member-id]').dataset.memberName + '?');
+}
+
+function hideMoveModal() {
+    document.getElementById('moveModal').close();
+}
+
+function showQRModal() {
+    document.getElementById('qrModal').showModal();
+}
+
+function hideQRModal() {
+    document.getElementById('qrModal').close();
+}
+
+// Only part of a large event is on the page, so the vehicle counts come
+// from the server (with each fragment) rather than from counting cards.
+function refreshTotals(totals) {
+    const counts = document.getElementById('vehicle-count');
+    const cars = counts.querySelector('[data-role="car-count"]');
+    const motorcycles = counts.querySelector('[data-role="motorcycle-count"]');
+    const plural = (n) => (n === 1 ? '' : 's');
+    if (totals) {
+        cars.textContent = totals.cars;
+        counts.querySelector('[data-role="car-plural"]').textContent = plural(totals.cars);
+        motorcycles.textContent = totals.motorcycles;
+        counts.querySelector('[data-role="motorcycle-plural"]').textContent = plural(totals.motorcycles);
+    }
+    const vehicles = Number(cars.textContent) + Number(motorcycles.textContent);
+    counts.hidden = vehicles === 0;
+    document.getElementById('no-cars').hidden = vehicles > 0;
+    document.getElementById('unassigned-card').hidden =
+        document.getElementById('unassigned-members').children.length === 0 &&
+        document.getElementById('more-unassigned').hidden;
+}
+
+function carOption(id, label) {
+    const option = new Option(label, id);
+    option.dataset.carId = id;
+    return option;
+}
+
+function setCarOption(id, label) {
+    document.querySelectorAll('select[data-role="car-options"]').forEach((select) => {
+        const option = select.querySelector(`option[data-car-id="${id}"]`);
+        if (option) {
+            option.text = label;
+        } else {
+            select.add(carOption(id, label), select.querySelector('option[data-more]'));
+        }
+    });
+}
+
+function removeCarOption(id) {
+    document.querySelectorAll(`option[data-car-id="${id}"]`).forEach((option) => option.remove());
+}
+
+// Car pickers start with the cars on the first page; the rest (or those
+// matching the search box above them) are fetched a page at a time.
+function carOptionsUrl(select, more) {
+    const url = new URL(document.getElementById('event-dashboard').dataset.carOptionsUrl, window.location.href);
+    const query = select.dataset.query || '';
+    if (query) {
+        url.searchParams.set('q', query);
+    }
+    if (more) {
+        url.searchParams.set('after', select.dataset.after);
+    }
+    return url;
+}
+
+async function loadCarOptions(select, more) {
+    // Only the latest request counts, e.g. while the search is being typed.
+    const request = String(Number(select.dataset.request || 0) + 1);
+    select.dataset.request = request;
+    let data;
+    try {
+        const response = await fetch(carOptionsUrl(select, more), { credentials: 'same-origin' });
+        if (!response.ok) {
+            return;
+        }
+        data = await response.json();
+    } catch (error) {
+        return;    // Keep the options we have; the next focus tries again.
+    }
+    if (select.dataset.request !== request) {
+        return;
+    }
+    // The chosen car stays, whether or not it is among the results.
+    select.querySelectorAll(more ? 'option[data-more]' : 'option[data-car-id], option[data-more]')
+        .forEach((option) => {
+            if (!option.selected || option.dataset.more) {
+                option.remove();
+            }
+        });
+    data.cars.forEach((car) => {
+        if (!select.querySelector(`option[data-car-id="${car.id}"]`)) {
+            select.add(carOption(car.id, car.label));
+        }
+    });
+    if (data.next) {
+        const option = new Option('More cars…', '');
+        option.dataset.more = 'true';
+        select.add(option);
+    }
+    select.dataset.after = data.next || '';
+    select.dataset.loaded = 'true';
+    const search = select.parentElement.querySelector('[data-role="car-search"]');
+    if (search && (data.next || select.dataset.query)) {
+        search.hidden = false;
+    }
+}
+
+function prepareCarPicker(select) {
+    if (select && !('complete' in select.dataset) && !select.dataset.loaded && window.fetch) {
+        loadCarOptions(select, false);
+    }
+}
+
+document.addEventListener('focusin', (focusEvent) => {
+    const form = focusEvent.target.form;
+    if (form) {
+        prepareCarPicker(form.querySelector('select[data-role="car-options"]'));
+    }
+});
+
+document.addEventListener('change', (changeEvent) => {
+    const select = changeEvent.target;
+    if (!select.matches('select[data-role="car-options"]')) {
+        return;
+    }
+    if (select.selectedOptions[0] && select.selectedOptions[0].dataset.more) {
+        select.value = select.dataset.value || '';
+        loadCarOptions(select, true);
+    } else {
+        select.dataset.value = select.value;
+    }
+});
+
+let carSearchTimer = null;
+document.addEventListener('input', (inputEvent) => {
+    const search = inputEvent.target;
+    if (!search.matches('[data-role="car-search"]')) {
+        return;
+    }
+    const select = search.parentElement.querySelector('select[data-role="car-options"]');
+    clearTimeout(carSearchTimer);
+    carSearchTimer = setTimeout(() => {
+        select.dataset.query = search.value.trim();
+        loadCarOptions(select, false);
+    }, 250);
+});
+
+document.addEventListener('keydown', (keyEvent) => {
+    // Enter in a car search box must not submit its form.
+    if (keyEvent.key === 'Enter' && keyEvent.target.matches('[data-role="car-search"]')) {
+        keyEvent.preventDefault();
+    }
+});
+
+function insertCarCard(card, isMotorcycle) {
+    const existing = document.getElementById(card.id);
+    if (existing) {
+        existing.replaceWith(card);
+        return;
+    }
+    const list = document.getElementById('car-list');
+    const firstMotorcycle = list.querySelector('[data-motorcycle="true"]');
+    list.insertBefore(card, isMotorcycle ? null : firstMotorcycle);
+}
+
+// Cards (re-)rendered by the server, plus the cars that are gone.
+function applyCars(data) {
+    const holder = document.createElement('template');
+    data.cars.forEach((car) => {
+        holder.innerHTML = car.html.trim();
+        insertCarCard(holder.content.firstElementChild, car.is_motorcycle);
+        setCarOption(car.id, car.label);
+    });
+    data.removed_cars.forEach((id) => {
+        const card = document.getElementById(`car-${id}`);
+        if (card) {
+            card.remove();
+        }
+        removeCarOption(id);
+    });
+    refreshTotals(data.totals);
+}
+
+function appendFragment(list, html) {
+    const holder = document.createElement('template');
+    holder.innerHTML = html.trim();
+    const element = holder.content.firstElementChild;
+    const existing = document.getElementById(element.id);
+    if (existing) {
+        existing.remove();
+    }
+    list.appendChild(element);
+}
+
+function showMessages(list) {
+    const box = document.getElementById('messages');
+    const kinds = { error: 'error', success: 'success' };
+    box.replaceChildren(...list.map(({ level, text }) => {
+        const alert = document.createElement('div');
+        alert.setAttribute('role', 'alert');
+        alert.className = `alert alert-${kinds[level] || 'info'} alert-soft mb-2`;
+        const span = document.createElement('span');
+        span.textContent = text;
+        alert.appendChild(span);
+        return alert;
+    }));
+    box.hidden = list.length === 0;
+}
+
+// Mutations: submit with fetch and swap in just the fragments that changed.
+document.addEventListener('submit', async (submitEvent) => {
+    const form = submitEvent.target;
+    if (!form.matches('form[data-fragment]') || !window.fetch) {
+        return;
+    }
+    submitEvent.preventDefault();
+    let response;
+    try {
+        response = await fetch(form.action, {
+            method: 'POST',
+            body: new FormData(form),
+            headers: { 'X-Requested-With': 'XMLHttpRequest' },
+            credentials: 'same-origin',
+        });
+    } catch (error) {
+        form.submit();    // Network trouble: fall back to a full page round trip.
+        return;
+    }
+    if (response.status === 429 || response.status === 503) {
+        // Rate-limited or busy: keep the form as typed and say why.
+        showMessages([{ level: 'error', text: await response.text() }]);
+        return;
+    }
+    if (!response.ok) {
+        window.location.reload();
+        return;
+    }
+    const data = await response.json();
+    const unassigned = document.getElementById('unassigned-members');
+    data.unassigned.forEach(({ id, html }) => {
+        const row = unassigned.querySelector(`:scope > #member-${id}`);
+        if (row) {
+            row.remove();
+        }
+        if (html) {
+            appendFragment(unassigned, html);
+        }
+    });
+    applyCars(data);
+    showMessages(data.messages);
+    if (form.id === 'moveForm') {
+        hideMoveModal();
+    } else if (!data.messages.some((message) => message.level === 'error')) {
+        form.reset();
+    }
+});
+
+// Fill a form's pickup/start point from the browser's location.
+document.addEventListener('click', (clickEvent) => {
+    const button = clickEvent.target.closest('[data-locate]');
+    if (!button || !navigator.geolocation) {
+        return;
+    }
+    const form = button.form;
+    const prefix = button.dataset.locate;
+    button.disabled = true;
+    navigator.geolocation.getCurrentPosition((position) => {
+        form.elements[`${prefix}_lat`].value = position.coords.latitude.toFixed(6);
+        form.elements[`${prefix}_lng`].value = position.coords.longitude.toFixed(6);
+        button.disabled = false;
+    }, () => {
+        button.disabled = false;
+    }, { timeout: 10000 });
+});
+
+// Later pages of cars and unassigned members, fetched as the button below
+// each list comes into view (or is clicked). Pages arrive in page order, so
+// each row is appended, replacing any copy a live update put in early.
+(function () {
+    const root = document.getElementById('event-dashboard');
+    if (!root || !window.fetch) {
+        return;
+    }
+    const pages = {
+        cars: {
+            url: root.dataset.carsUrl,
+            apply(data) {
+                const list = document.getElementById('car-list');
+                data.cars.forEach((car) => {
+                    appendFragment(list, car.html);
+                    setCarOption(car.id, car.label);
+                });
+            },
+        },
+        unassigned: {
+            url: root.dataset.unassignedUrl,
+            apply(data) {
+                const list = document.getElementById('unassigned-members');
+                data.members.forEach((member) => appendFragment(list, member.html));
+            },
+        },
+    };
+
+    function nearViewport(button) {
+        return button.getBoundingClientRect().top < window.innerHeight * 2;
+    }
+
+    async function loadMore(button) {
+        if (button.hidden || button.disabled) {
+            return;
+        }
+        const page = pages[button.dataset.more];
+        const url = new URL(page.url, window.location.href);
+        url.searchParams.set('after', button.dataset.after);
+        button.disabled = true;
+        let data;
+        try {
+            const response = await fetch(url, { credentials: 'same-origin' });
+            if (!response.ok) {
+                return;
+            }
+            data = await response.json();
+        } catch (error) {
+            return;    // Leave the button for another try.
+        } finally {
+            button.disabled = false;
+        }
+        page.apply(data);
+        button.dataset.after = data.next || '';
+        button.hidden = !data.next;
+        refreshTotals();
+        if (nearViewport(button)) {
+            loadMore(button);
+        }
+    }
+
+    const buttons = document.querySelectorAll('[data-more]');
+    buttons.forEach((button) => button.addEventListener('click', () => loadMore(button)));
+    if (window.IntersectionObserver) {
+        const observer = new IntersectionObserver((entries) => {
+            entries.forEach((entry) => {
+                if (entry.isIntersecting) {
+                    loadMore(entry.target);
+                }
+            });
+        }, { rootMargin: '0px 0px 100% 0px' });
+        buttons.forEach((button) => observer.observe(button));
+    }
+})();
+
+// Live updates: apply changes made by other viewers in place.
+(function () {
+    const root = document.getElementById('event-dashboard');
+    if (!root || !window.EventSource) {
+        return;
+    }
+    const eventUrl = root.dataset.eventUrl;
+    let version = Number(root.dataset.version);
+    const pendingCars = new Set();
+    let carTimer = null;
+
+    function clone(templateId) {
+        return document.getElementById(templateId).content.firstElementChild.cloneNode(true);
+    }
+
+    function setField(el, name, value) {
+        const field = el.querySelector(`[data-field="${name}"]`);
+        if (field) {
+            field.textContent = value || '';
+        }
+        const box = el.querySelector(`[data-field="${name}-box"]`);
+        if (box) {
+            box.hidden = !value;
+        }
+    }
+
+    function carLabel(car) {
+        return car.driver_name + (car.car_name ? ' - ' + car.car_name : '');
+    }
+
+    function buildMember(member) {
+        const el = clone(member.car_id ? 'car-member-template' : 'unassigned-member-template');
+        el.id = `member-${member.id}`;
+        el.dataset.memberId = member.id;
+        el.dataset.memberName = member.name;
+        setField(el, 'name', member.name);
+        setField(el, 'contact', member.contact);
+        el.querySelector('[data-action="delete-member"]').action = `${eventUrl}member/${member.id}/delete/`;
+        return el;
+    }
+
+    function buildCar(car) {
+        const el = clone(car.is_motorcycle ? 'motorcycle-card-template' : 'car-card-template');
+        el.id = `car-${car.id}`;
+        el.dataset.carId = car.id;
+        setField(el, 'driver_name', car.driver_name);
+        const carName = car.car_name ? car.car_name.charAt(0).toUpperCase() + car.car_name.slice(1) : '';
+        setField(el, 'car_name', carName);
+        el.querySelector('[data-field="car_name"]').hidden = !carName;
+        setField(el, 'notes', car.notes);
+        el.querySelector('[data-action="delete-car"]').action = `${eventUrl}car/${car.id}/delete/`;
+        return el;
+    }
+
+    function refreshCar(card) {
+        if (!card) {
+            return;
+        }
+        const count = card.querySelector('[data-role="members"]').children.length;
+        card.querySelector('[data-role="member-count"]').textContent = count;
+        card.querySelector('[data-role="empty"]').hidden = count > 0;
+        card.querySelector('[data-role="passengers"]').hidden = card.dataset.motorcycle === 'true' && count === 0;
+    }
+
+    function allLoaded(buttonId) {
+        return document.getElementById(buttonId).hidden;
+    }
+
+    // Fetch the current cards of cars that changed but are not on the page
+    // (and the vehicle counts), a page's worth per request.
+    async function fetchCars() {
+        const ids = [...pendingCars];
+        const pageSize = Number(root.dataset.carPageSize);
+        pendingCars.clear();
+        for (let start = 0; start < ids.length; start += pageSize) {
+            const url = new URL(root.dataset.carsUrl, window.location.href);
+            ids.slice(start, start + pageSize).forEach((id) => url.searchParams.append('id', id));
+            try {
+                const response = await fetch(url, { credentials: 'same-origin' });
+                if (response.ok) {
+                    applyCars(await response.json());
+                }
+            } catch (error) {
+                // The card shows up on the next page load.
+            }
+        }
+    }
+
+    function requestCar(id) {
+        pendingCars.add(id);
+        clearTimeout(carTimer);
+        carTimer = setTimeout(fetchCars, 100);
+    }
+
+    // Start the unassigned list over, e.g. after riders of a car that was
+    // never loaded were unassigned without a change of their own.
+    async function reloadUnassigned() {
+        const button = document.getElementById('more-unassigned');
+        try {
+            const response = await fetch(root.dataset.unassignedUrl, { credentials: 'same-origin' });
+            if (!response.ok) {
+                return;
+            }
+            const data = await response.json();
+            const list = document.getElementById('unassigned-members');
+            list.replaceChildren();
+            data.members.forEach((member) => appendFragment(list, member.html));
+            button.dataset.after = data.next || '';
+            button.hidden = !data.next;
+            refreshTotals();
+        } catch (error) {
+            // Keep what is shown.
+        }
+    }
+
+    function placeMember(member) {
+        const existing = document.getElementById(`member-${member.id}`);
+        const oldCard = existing && existing.closest('[data-car-id]');
+        const target = member.car_id
+            ? document.querySelector(`#car-${member.car_id} [data-role="members"]`)
+            : document.getElementById('unassigned-members');
+        if (existing) {
+            existing.remove();
+        }
+        if (target) {
+            target.appendChild(buildMember(member));
+        } else if (member.car_id && allLoaded('more-cars')) {
+            // Every page is in, so its car moved behind the pages read (a
+            // motorcycle that got its first rider): fetch its card.
+            requestCar(member.car_id);
+        }
+        refreshCar(oldCard);
+        refreshCar(document.getElementById(`car-${member.car_id}`));
+    }
+
+    const handlers = {
+        car_saved({ car }) {
+            const card = buildCar(car);
+            const existing = document.getElementById(`car-${car.id}`);
+            if (existing) {
+                card.querySelector('[data-role="members"]').replaceChildren(
+                    ...existing.querySelector('[data-role="members"]').children
+                );
+                existing.replaceWith(card);
+                refreshCar(card);
+            } else {
+                // New, or not on the page yet: the server has its card and the counts.
+                requestCar(car.id);
+            }
+            setCarOption(car.id, carLabel(car));
+        },
+        car_deleted({ car }) {
+            const card = document.getElementById(`car-${car.id}`);
+            requestCar(car.id);    // for the vehicle counts
+            if (!card) {
+                reloadUnassigned();
+            } else {
+                card.querySelectorAll('[data-member-id]').forEach((row) => {
+                    placeMember({
+                        id: row.dataset.memberId,
+                        name: row.dataset.memberName,
+                        contact: row.querySelector('[data-field="contact"]').textContent.trim(),
+                        car_id: null,
+                    });
+                });
+                card.remove();
+            }
+            removeCarOption(car.id);
+        },
+        member_saved({ member }) {
+            placeMember(member);
+        },
+        member_deleted({ member }) {
+            const row = document.getElementById(`member-${member.id}`);
+            if (row) {
+                const card = row.closest('[data-car-id]');
+                row.remove();
+                refreshCar(card);
+            }
+        },
+        event_updated() {
+            window.location.reload();
+        },
+        batch({ changes }) {
+            changes.forEach((change) => handlers[change.kind](change.payload));
+        },
+    };
+
+    const source = new EventSource(`${root.dataset.streamUrl}?after=${version}`);
+    source.addEventListener('change', (message) => {
+        const change = JSON.parse(message.data);
+        if (change.seq <= version) {
+            return;
+        }
+        version = change.seq;
+        (handlers[change.kind] || (() => {}))(change.payload);
+        refreshTotals();
+    });
+    // The log no longer reaches back to our version, or the event is gone.
+    source.addEventListener('reset', () => window.location.reload());
+    source.addEventListener('deleted', () => source.close());
+})();
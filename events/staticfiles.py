@@ -0,0 +1,158 @@
+"""Fingerprinted, precompressed static files served straight from STATIC_ROOT.
+
+``collectstatic`` with ``CompressedManifestStaticFilesStorage`` writes every
+file under a content-hashed name plus ``.gz`` (and, when the optional
+``brotli`` package is installed, ``.br``) variants of the compressible ones.
+``StaticFilesMiddleware`` indexes STATIC_ROOT once per process and answers
+static requests before sessions, CSRF or URL resolution run: hashed names
+are cached by clients for a year as immutable, and the smallest variant the
+client accepts is sent. Under ``runserver`` with DEBUG, Django's own static
+handler still serves the source files.
+
+The purged stylesheet (``css/app.css``) is built from assets/ and committed,
+so pages never depend on a third-party CDN. With DEBUG, and in tests, the
+plain ``StaticFilesStorage`` is used, which needs no manifest.
+"""
+import gzip
+import json
+import mimetypes
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import HttpResponse, HttpResponseNotModified
+
+try:
+    import brotli
+except ImportError:    # gzip only
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico'}
+MIN_SIZE = 256
+# Keep a variant only if it saves at least this fraction of the original.
+MIN_SAVING = 0.05
+IMMUTABLE = 'public, max-age=31536000, immutable'
+SHORT_LIVED = 'public, max-age=60'
+
+
+def _compress(path):
+    """Write the .gz/.br variants of ``path`` that are worth it; return their names."""
+    data = path.read_bytes()
+    written = []
+    variants = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda: brotli.compress(data, quality=11)))
+    for suffix, compress in variants:
+        compressed = compress()
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            path.with_name(path.name + suffix).write_bytes(compressed)
+            written.append(path.name + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also precompresses what it collects."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        root = Path(self.location)
+        for name in sorted(set(paths) | set(self.hashed_files.values())):
+            path = root / name
+            if path.suffix in COMPRESSIBLE and path.is_file() and path.stat().st_size >= MIN_SIZE:
+                for variant in _compress(path):
+                    yield name, str(Path(name).with_name(variant)), True
+
+
+class _StaticFile:
+    __slots__ = ('path', 'content_type', 'cache_control', 'etag', 'variants')
+
+    def __init__(self, path, cache_control):
+        stat = path.stat()
+        self.path = path
+        self.content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'image/svg+xml'):
+            self.content_type += '; charset=utf-8'
+        self.cache_control = cache_control
+        self.etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        # Best first.
+        self.variants = [
+            (encoding, variant)
+            for encoding, variant in (('br', path.with_name(path.name + '.br')), ('gzip', path.with_name(path.name + '.gz')))
+            if variant.is_file()
+        ]
+
+
+def _accepted(header):
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        if params.strip().replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def build_index(root, prefix):
+    """Map URL path -> ``_StaticFile`` for every collected file under ``root``."""
+    root = Path(root)
+    if not root.is_dir():
+        return {}
+    try:
+        manifest = json.loads((root / ManifestStaticFilesStorage.manifest_name).read_text())
+        hashed = set(manifest.get('paths', {}).values())
+    except (OSError, ValueError):
+        hashed = set()
+    index = {}
+    for path in root.rglob('*'):
+        if not path.is_file() or path.suffix in ('.gz', '.br'):
+            continue
+        name = path.relative_to(root).as_posix()
+        index[prefix + name] = _StaticFile(path, IMMUTABLE if name in hashed else SHORT_LIVED)
+    return index
+
+
+class StaticFilesMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        prefix = '/' + settings.STATIC_URL.lstrip('/') if settings.STATIC_URL else None
+        self.index = build_index(settings.STATIC_ROOT, prefix) if prefix and settings.STATIC_ROOT else {}
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        entry = self.index.get(request.path_info)
+        if entry is None:
+            return None
+        accepted = _accepted(request.headers.get('Accept-Encoding', ''))
+        encoding, path = next(((e, p) for e, p in entry.variants if e in accepted), (None, entry.path))
+        # Each encoding is a different representation, so it gets its own ETag.
+        etag = f'{entry.etag[:-1]}-{encoding}"' if encoding else entry.etag
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            body = path.read_bytes()
+            response = HttpResponse(b'' if request.method == 'HEAD' else body, content_type=entry.content_type)
+            response['Content-Length'] = len(body)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        if entry.variants:
+            response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = entry.cache_control
+        response['ETag'] = etag
+        response['X-Content-Type-Options'] = 'nosniff'
+        return response
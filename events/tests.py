@@ -1,3 +1,378 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from events.assignment import BALANCE, FILL, allocate, apply_assignment, plan_assignment
+from events.cache_backends import SQLiteLRUCache
+from events.dashboard import build_dashboard
+from events.forms import MemberUpdateForm
+from events.models import Car, Event, EventChange, EventShard, Member
+from events.profiling import HEADER, ProfilingMiddleware, load
+from events.sharding import EventShardRouter, placement, use_shard
+from events.throttling import AdmissionMiddleware, write_slots
+
+
+class AdmissionTests(TestCase):
+    """Public writes over the rate limit get a 429, and writes beyond the concurrency limit a 503."""
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        limits = override_settings(
+            RATE_LIMIT_DB=Path(scratch.name) / 'ratelimit.sqlite3',
+            RATE_LIMITS={'client': (1, 1), 'event': (0, 0), 'create': (0, 0)},
+        )
+        limits.enable()
+        self.addCleanup(limits.disable)
+        self.event = Event.objects.create(name='Admission')
+        self.url = reverse('add_member', kwargs={'slug': self.event.slug})
+
+    def test_rate_limited(self):
+        self.assertNotIn(self.client.post(self.url, {'name': 'First'}).status_code, (429, 503))
+        response = self.client.post(self.url, {'name': 'Second'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    async def test_rate_limited_async(self):
+        response = await self.async_client.post(self.url, {'name': 'First'})
+        self.assertNotIn(response.status_code, (429, 503))
+        response = await self.async_client.post(self.url, {'name': 'Second'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    @override_settings(RATE_LIMITS={}, WRITE_CONCURRENCY=1, WRITE_QUEUE_TIMEOUT=0.01)
+    def test_overloaded(self):
+        slots = write_slots('default')
+        self.assertTrue(slots.acquire(timeout=1))
+        try:
+            response = self.client.post(self.url, {'name': 'Busy'})
+        finally:
+            slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertNotIn(self.client.post(self.url, {'name': 'Free'}).status_code, (429, 503))
+
+    @override_settings(RATE_LIMITS={}, WRITE_CONCURRENCY=1, WRITE_QUEUE_TIMEOUT=5)
+    async def test_cancelled_wait_takes_no_slot(self):
+        async def view(request):
+            return HttpResponse()
+
+        slots = write_slots('default')
+        self.assertTrue(slots.acquire(timeout=1))
+        request = AsyncRequestFactory().post(self.url, {'name': 'Gone'})
+        waiting = asyncio.ensure_future(AdmissionMiddleware(view)(request))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        slots.release()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        await asyncio.sleep(0.05)
+        self.assertTrue(slots.acquire(blocking=False))
+        slots.release()
+
+
+class SeatCounterTests(TestCase):
+    """``Car.seats_taken`` matches the members in the car, even after saves from stale copies."""
+
+    def setUp(self):
+        self.event = Event.objects.create(name='Seats')
+        self.a, self.b, self.c = (
+            Car.objects.create(event=self.event, driver_name=name, capacity=2) for name in 'ABC'
+        )
+        self.member = Member.objects.create(event=self.event, name='Rider', car=self.a)
+
+    def assertSeatsCounted(self):
+        for car in Car.objects.filter(event=self.event).annotate(members_count=Count('members')):
+            self.assertEqual(car.seats_taken, car.members_count, car.driver_name)
+
+    def test_join_move_and_delete(self):
+        self.assertEqual(Car.objects.get(pk=self.a.pk).seats_taken, 1)
+        self.member.car = self.b
+        self.member.save()
+        self.assertSeatsCounted()
+        self.member.delete()
+        self.assertSeatsCounted()
+
+    def test_competing_stale_moves(self):
+        first, second = Member.objects.get(pk=self.member.pk), Member.objects.get(pk=self.member.pk)
+        MemberUpdateForm({'name': 'Rider', 'car': self.b.pk}, instance=first).save()
+        MemberUpdateForm({'name': 'Rider', 'car': self.c.pk}, instance=second).save()
+        self.assertEqual(Member.objects.get(pk=self.member.pk).car_id, self.c.pk)
+        self.assertSeatsCounted()
+
+    def test_stale_move_back_to_current_car(self):
+        stale = Member.objects.get(pk=self.member.pk)
+        self.member.car = self.b
+        self.member.save()
+        stale.car = self.b
+        stale.save()
+        self.assertSeatsCounted()
+
+    def test_stale_delete_after_move(self):
+        stale = Member.objects.get(pk=self.member.pk)
+        self.member.car = self.b
+        self.member.save()
+        stale.delete()
+        self.assertSeatsCounted()
+
+    def test_stale_edit_keeps_the_move(self):
+        stale = Member.objects.get(pk=self.member.pk)
+        self.member.car = self.b
+        self.member.save()
+        stale.contact = 'phone'
+        stale.save()
+        self.assertEqual(Member.objects.get(pk=self.member.pk).car_id, self.b.pk)
+        self.assertSeatsCounted()
+
+    def test_full_car_save_keeps_seats(self):
+        stale = Car.objects.get(pk=self.a.pk)
+        Member.objects.create(event=self.event, name='Second', car=self.a)
+        stale.notes = 'edited'
+        stale.save()
+        self.assertEqual(Car.objects.get(pk=self.a.pk).notes, 'edited')
+        self.assertSeatsCounted()
+
+
+class RecountSeatsTests(TestCase):
+    """The admin's recount action fixes ``seats_taken`` and tells viewers about it."""
+
+    def test_recount_records_change(self):
+        event = Event.objects.create(name='Recount')
+        car = Car.objects.create(event=event, driver_name='Driver', capacity=4)
+        Member.objects.create(event=event, name='Rider', car=car)
+        Car.objects.filter(pk=car.pk).update(seats_taken=3)
+        version = Event.objects.get(pk=event.pk).version
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.client.post(reverse('admin:events_car_changelist'), {'action': 'recount_seats', ACTION_CHECKBOX_NAME: [car.pk]})
+        self.assertEqual(Car.objects.get(pk=car.pk).seats_taken, 1)
+        self.assertEqual(Event.objects.get(pk=event.pk).version, version + 1)
+        change = EventChange.objects.get(event=event, seq=version + 1)
+        self.assertEqual(change.payload['changes'][0]['payload']['car']['id'], car.pk)
+
+
+@override_settings(RATE_LIMITS={})
+class BatchTests(TestCase):
+    """The batch API applies its seat changes in one update per batch."""
+
+    def setUp(self):
+        self.event = Event.objects.create(name='Batch')
+        self.car = Car.objects.create(event=self.event, driver_name='Driver', capacity=3)
+        self.riders = [Member.objects.create(event=self.event, name=f'Rider {i}', car=self.car) for i in range(3)]
+        self.url = reverse('api_batch', kwargs={'slug': self.event.slug})
+
+    def post(self, operations):
+        return self.client.post(self.url, json.dumps({'operations': operations}), content_type='application/json')
+
+    def test_deletes_release_seats_in_one_update(self):
+        operations = [{'op': 'delete_member', 'member': rider.pk} for rider in self.riders]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post(operations).status_code, 200)
+        car_updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE "events_car"')]
+        self.assertEqual(len(car_updates), 1)
+        self.assertEqual(Car.objects.get(pk=self.car.pk).seats_taken, 0)
+
+    def test_deleted_seat_taken_in_same_batch(self):
+        response = self.post([
+            {'op': 'delete_member', 'member': self.riders[0].pk},
+            {'op': 'add_member', 'name': 'Newcomer', 'car': self.car.pk},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Car.objects.get(pk=self.car.pk).seats_taken, 3)
+
+    def test_full_car_rejects_whole_batch(self):
+        response = self.post([
+            {'op': 'add_member', 'name': 'Early', 'car': None},
+            {'op': 'add_member', 'name': 'Late', 'car': self.car.pk},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Member.objects.filter(name='Early').exists())
+        self.assertEqual(Car.objects.get(pk=self.car.pk).seats_taken, 3)
+
+
+class ProfilingTests(SimpleTestCase):
+    """Overlapping profiled requests both succeed, and only one runs the profiler."""
+
+    async def test_overlapping_async_requests(self):
+        release = asyncio.Event()
+
+        async def view(request):
+            await release.wait()
+            return HttpResponse()
+
+        with tempfile.TemporaryDirectory() as scratch, override_settings(PROFILE_DIR=scratch, PROFILE_SAMPLE_RATE=1):
+            middleware = ProfilingMiddleware(view)
+            requests = [asyncio.ensure_future(middleware(AsyncRequestFactory().get('/'))) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            release.set()
+            responses = await asyncio.gather(*requests)
+            self.assertEqual([response.status_code for response in responses], [200, 200])
+            records = [load(response[f'{HEADER}-Id']) for response in responses]
+            self.assertEqual(sorted(record['profiled'] for record in records), [False, True])
+
+
+class PageTests(TestCase):
+    """Pages render under the test runner and use only the committed stylesheet."""
+
+    def test_home(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '/static/css/app.css')
+        self.assertNotContains(response, 'cdn.jsdelivr.net')
+
+    def test_event_page(self):
+        event = Event.objects.create(name='Page')
+        response = self.client.get(reverse('event_detail', kwargs={'slug': event.slug}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'events/event_detail.js')
+
+
+class SQLiteLRUCacheTests(SimpleTestCase):
+    """Cache hits record their access time at most once per ``ACCESS_RESOLUTION``."""
+
+    def setUp(self):
+        scratch = tempfile.TemporaryDirectory()
+        self.addCleanup(scratch.cleanup)
+        self.cache = SQLiteLRUCache(Path(scratch.name) / 'cache.sqlite3', {'OPTIONS': {'ACCESS_RESOLUTION': 60}})
+        self.cache.set('page', 'html')
+        self.key = self.cache.make_key('page')
+
+    def accessed(self):
+        return self.cache._connection().execute('SELECT accessed FROM cache_entry WHERE key = ?', (self.key,)).fetchone()[0]
+
+    def test_recent_hit_does_not_write(self):
+        stored = self.accessed()
+        changes = self.cache._connection().total_changes
+        self.assertEqual(self.cache.get('page'), 'html')
+        self.assertEqual(self.accessed(), stored)
+        self.assertEqual(self.cache._connection().total_changes, changes)
+
+    def test_stale_hit_is_recorded(self):
+        self.cache._connection().execute('UPDATE cache_entry SET accessed = accessed - 120 WHERE key = ?', (self.key,))
+        stale = self.accessed()
+        self.assertEqual(self.cache.get('page'), 'html')
+        self.assertGreater(self.accessed(), stale + 60)
+
+
+class ConditionalGetTests(TestCase):
+    """Event pages and QR images answer conditional GETs with 304 until the event changes."""
+
+    def setUp(self):
+        self.event = Event.objects.create(name='Conditional')
+        self.url = reverse('event_detail', kwargs={'slug': self.event.slug})
+        self.client.get(self.url)    # sets the CSRF cookie the ETag covers
+
+    def test_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'If-None-Match': etag}).status_code, 304)
+        Member.objects.create(event=self.event, name='Rider')
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_modified(self):
+        changed_at = timezone.now().replace(microsecond=0) - timedelta(minutes=1)
+        Event.objects.filter(pk=self.event.pk).update(changed_at=changed_at)
+        response = self.client.get(self.url)
+        self.assertEqual(response['Last-Modified'], http_date(changed_at.timestamp()))
+        since = {'If-Modified-Since': response['Last-Modified']}
+        self.assertEqual(self.client.get(self.url, headers=since).status_code, 304)
+
+    def test_no_last_modified_within_the_second_of_a_change(self):
+        Event.objects.filter(pk=self.event.pk).update(changed_at=timezone.now())
+        self.assertNotIn('Last-Modified', self.client.get(self.url))
+
+    def test_qr(self):
+        url = reverse('event_qr', kwargs={'slug': self.event.slug})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        self.assertNotEqual(self.client.get(url, {'format': 'svg'})['ETag'], etag)
+        missing = reverse('event_qr', kwargs={'slug': 'missing'})
+        self.assertEqual(self.client.get(missing, headers={'If-None-Match': '*'}).status_code, 404)
+
+
+class DashboardQueryTests(TestCase):
+    """The dashboard snapshot keeps to its two-query budget however big the event."""
+
+    def test_two_queries(self):
+        event = Event.objects.create(name='Dashboard')
+        cars = [Car.objects.create(event=event, driver_name=f'Driver {i}', capacity=3) for i in range(4)]
+        for i in range(10):
+            Member.objects.create(event=event, name=f'Rider {i}', car=cars[i % 4] if i < 8 else None)
+        for limits in ({}, {'car_limit': 2, 'member_limit': 1}):
+            with self.assertNumQueries(2):
+                build_dashboard(event.slug, **limits)
+
+
+class AssignmentTests(TestCase):
+    """Automatic assignment fills free seats, motorcycles last, and keeps the seat counter right."""
+
+    def test_allocate(self):
+        self.assertEqual(list(allocate([1, 3, 2], 4, BALANCE)), [1, 1, 2, 0])
+        self.assertEqual(list(allocate([1, 3, 2], 4, FILL)), [0, 1, 1, 1])
+        self.assertEqual(list(allocate([1, 0], 5, FILL)), [0])
+
+    def test_plan_and_apply(self):
+        event = Event.objects.create(name='Assign')
+        car = Car.objects.create(event=event, driver_name='Car', capacity=2)
+        bike = Car.objects.create(event=event, driver_name='Bike', car_name='Motorcycle')
+        Car.objects.create(event=event, driver_name='Unknown seats')
+        for i in range(4):
+            Member.objects.create(event=event, name=f'Rider {i}')
+        plan = plan_assignment(event, BALANCE)
+        self.assertEqual(Counter(car_id for *_, car_id in plan.assignments), {car.pk: 2, bike.pk: 1})
+        self.assertEqual(plan.unplaced, 1)
+        self.assertFalse(Member.objects.filter(event=event, car__isnull=False).exists())
+
+        version = Event.objects.get(pk=event.pk).version
+        self.assertEqual(apply_assignment(plan), 3)
+        self.assertEqual(Event.objects.get(pk=event.pk).version, version + 1)
+        for row in Car.objects.filter(event=event).annotate(members_count=Count('members')):
+            self.assertEqual(row.seats_taken, row.members_count)
+        # Applying again changes nothing: those members are seated already.
+        self.assertEqual(apply_assignment(plan), 0)
+
+
+@override_settings(EVENT_SHARDS=['default', 'shard1', 'shard2'])
+class ShardRouterTests(SimpleTestCase):
+    """Events go to the shard their slug hashes to, or the current one; the directory stays on default."""
+
+    router = EventShardRouter()
+
+    def test_new_event_goes_where_its_slug_hashes(self):
+        event = Event(name='Sharded', slug='sharded-0001')
+        self.assertEqual(self.router.db_for_write(Event, instance=event), placement(event.slug))
+
+    def test_current_shard(self):
+        with use_shard('shard2'):
+            self.assertEqual(self.router.db_for_read(Car), 'shard2')
+            self.assertEqual(self.router.db_for_write(EventShard), 'default')
+        self.assertIsNone(self.router.db_for_read(get_user_model()))
+
+    def test_adding_a_shard_only_moves_events_onto_it(self):
+        slugs = [f'event-{i}' for i in range(200)]
+        before = {slug: placement(slug) for slug in slugs}
+        with override_settings(EVENT_SHARDS=['default', 'shard1', 'shard2', 'shard3']):
+            after = {slug: placement(slug) for slug in slugs}
+        moved = {slug for slug in slugs if before[slug] != after[slug]}
+        self.assertTrue(moved)
+        self.assertEqual({after[slug] for slug in moved}, {'shard3'})
+
+    def test_allow_migrate(self):
+        self.assertTrue(self.router.allow_migrate('shard1', 'events', 'car'))
+        self.assertFalse(self.router.allow_migrate('shard1', 'events', 'eventshard'))
+        self.assertFalse(self.router.allow_migrate('shard1', 'auth', 'user'))
+        self.assertFalse(self.router.allow_migrate('other', 'events', 'car'))
@@ -0,0 +1,266 @@
+"""Admission control for public writes.
+
+Anyone with an event's link can write to it, so one buggy script or a crowd
+scanning the QR code at once could keep the SQLite writer busy for every
+event. ``AdmissionMiddleware`` guards every public write (any request but
+GET, HEAD and OPTIONS outside the admin) twice:
+
+* Token buckets (``RATE_LIMITS``): one per client address, one per event
+  and, for creating events, a slower one per client. A write takes a token
+  from each bucket that applies; when one is empty it gets a 429 with
+  Retry-After set to when the next token is due. The buckets live in a
+  small SQLite file (``RATE_LIMIT_DB``) shared by every worker process on
+  the host, like the dashboard cache.
+* At most ``WRITE_CONCURRENCY`` writes at once per process and database.
+  Others wait up to ``WRITE_QUEUE_TIMEOUT`` seconds for a turn and then get
+  a 503 with Retry-After, instead of piling up on the database lock until
+  it times out.
+
+Rejections are counted in ``/metrics``. If the bucket file cannot be used,
+writes are let through rather than refused.
+"""
+import asyncio
+import ipaddress
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+from .metrics import count_rejection
+from .sessionless import is_admin_request
+from .sharding import SAFE_METHODS
+
+CLIENT = 'client'
+EVENT = 'event'
+CREATE = 'create'
+# Seconds writers turned away for overload are asked to wait.
+OVERLOAD_RETRY_AFTER = 2
+# Longest pause between an async request's attempts at a write slot.
+SLOT_POLL_INTERVAL = 0.02
+# Seconds between sweeps of full buckets, which carry no information.
+PRUNE_INTERVAL = 60
+
+
+class TokenBuckets:
+    """Token buckets in a SQLite file shared by every process on the host."""
+
+    def __init__(self, path):
+        self._path = Path(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=1, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS bucket ('
+                'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, full_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS bucket_full_at ON bucket (full_at)')
+            self._local.conn = conn
+            self._local.pruned = 0.0
+        return conn
+
+    def take(self, buckets, now=None):
+        """
+        Take a token from each of ``buckets``, ``(key, rate, burst)`` each:
+        a bucket holds up to ``burst`` tokens and refills at ``rate`` a
+        second. Either every bucket has one and all are taken, or none is
+        and this returns the first empty bucket's key and the seconds until
+        it has a token again; ``(None, 0)`` means admitted.
+        """
+        conn = self._connection()
+        now = time.time() if now is None else now
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            levels = []
+            for key, rate, burst in buckets:
+                row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                if tokens < 1:
+                    conn.execute('ROLLBACK')
+                    return key, (1 - tokens) / rate
+                levels.append((key, tokens - 1, now, now + (burst - tokens + 1) / rate))
+            conn.executemany(
+                'INSERT OR REPLACE INTO bucket (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)', levels,
+            )
+            if now - self._local.pruned > PRUNE_INTERVAL:
+                conn.execute('DELETE FROM bucket WHERE full_at <= ?', (now,))
+                self._local.pruned = now
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return None, 0
+
+
+_stores = {}
+_slots = {}
+_registry_lock = threading.Lock()
+
+
+def token_buckets():
+    """The bucket store at ``RATE_LIMIT_DB``, one per path and process."""
+    path = Path(getattr(settings, 'RATE_LIMIT_DB', settings.BASE_DIR / 'data' / 'ratelimit.sqlite3'))
+    with _registry_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = TokenBuckets(path)
+    return store
+
+
+def write_slots(alias):
+    """The semaphore admitting ``WRITE_CONCURRENCY`` writes at once to database ``alias``."""
+    limit = max(getattr(settings, 'WRITE_CONCURRENCY', 4), 1)
+    with _registry_lock:
+        slots = _slots.get((alias, limit))
+        if slots is None:
+            slots = _slots[alias, limit] = threading.BoundedSemaphore(limit)
+    return slots
+
+
+async def acquire_slot(slots, timeout):
+    """
+    Wait up to ``timeout`` seconds for one of ``slots`` without blocking the
+    event loop. Polls rather than waiting on a worker thread: a thread would
+    still take the slot after the request was cancelled, and nothing would
+    give it back.
+    """
+    deadline = time.monotonic() + timeout
+    pause = SLOT_POLL_INTERVAL / 8
+    while not slots.acquire(blocking=False):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(pause, remaining))
+        pause = min(pause * 2, SLOT_POLL_INTERVAL)
+    return True
+
+
+def client_address(request):
+    """
+    The client's address: ``REMOTE_ADDR``, or with ``RATE_LIMIT_PROXIES``
+    proxies in front, the one the outermost proxy added to X-Forwarded-For.
+    IPv6 clients are grouped by /64, the block a single site is handed.
+    """
+    address = request.META.get('REMOTE_ADDR', '')
+    proxies = getattr(settings, 'RATE_LIMIT_PROXIES', 0)
+    if proxies:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            address = forwarded[-proxies]
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address or 'unknown'
+    if ip.version == 6:
+        return str(ipaddress.ip_network(f'{ip}/64', strict=False))
+    return str(ip)
+
+
+def _buckets(request, match):
+    """The ``(key, rate per second, burst)`` of each bucket a write to ``match`` takes from."""
+    limits = getattr(settings, 'RATE_LIMITS', {})
+    client = client_address(request)
+    wanted = [(CLIENT, client)]
+    if match.url_name == 'home':
+        wanted.append((CREATE, client))
+    if match.kwargs.get('slug'):
+        wanted.append((EVENT, match.kwargs['slug']))
+    buckets = []
+    for name, value in wanted:
+        per_minute, burst = limits.get(name, (0, 0))
+        if per_minute > 0 and burst > 0:
+            buckets.append((f'{name}:{value}', per_minute / 60, burst))
+    return buckets
+
+
+class AdmissionMiddleware:
+    """Rate-limit public writes per client and event, and shed writes beyond the concurrency limit."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        match = self._guarded(request)
+        if match is None:
+            return self.get_response(request)
+        refused = self._rate_limit(request, match)
+        if refused:
+            return refused
+        slots = write_slots(getattr(request, 'event_shard', DEFAULT_DB_ALIAS))
+        if not slots.acquire(timeout=getattr(settings, 'WRITE_QUEUE_TIMEOUT', 1)):
+            return self._overloaded(request, match)
+        try:
+            return self.get_response(request)
+        finally:
+            slots.release()
+
+    async def __acall__(self, request):
+        match = self._guarded(request)
+        if match is None:
+            return await self.get_response(request)
+        refused = await sync_to_async(self._rate_limit, thread_sensitive=False)(request, match)
+        if refused:
+            return refused
+        slots = write_slots(getattr(request, 'event_shard', DEFAULT_DB_ALIAS))
+        if not await acquire_slot(slots, getattr(settings, 'WRITE_QUEUE_TIMEOUT', 1)):
+            return self._overloaded(request, match)
+        try:
+            return await self.get_response(request)
+        finally:
+            slots.release()
+
+    def _guarded(self, request):
+        """The URL match of a public write, else None."""
+        if request.method in SAFE_METHODS or is_admin_request(request):
+            return None
+        try:
+            return resolve(request.path_info)
+        except Resolver404:
+            return None
+
+    def _rate_limit(self, request, match):
+        buckets = _buckets(request, match)
+        if not buckets:
+            return None
+        try:
+            key, wait = token_buckets().take(buckets)
+        except sqlite3.Error:
+            return None    # a locked or unwritable bucket file must not stop writes
+        if key is None:
+            return None
+        return self._refuse(
+            request, match, key.split(':', 1)[0], 429, math.ceil(wait),
+            f"Too many requests. Please try again in {math.ceil(wait)} second(s).",
+        )
+
+    def _overloaded(self, request, match):
+        return self._refuse(
+            request, match, 'concurrency', 503, OVERLOAD_RETRY_AFTER,
+            "The site is busy. Please try again in a few seconds.",
+        )
+
+    def _refuse(self, request, match, reason, status, retry_after, text):
+        # The view never runs, so tell the metrics which one was refused.
+        request.resolver_match = match
+        count_rejection(match.url_name or match.view_name, reason)
+        response = HttpResponse(text, status=status, content_type='text/plain')
+        response['Retry-After'] = str(max(retry_after, 1))
+        return response
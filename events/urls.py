@@ -1,13 +1,29 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
     path('event/<slug:slug>/', views.event_detail, name='event_detail'),
     path('event/<slug:slug>/qr/', views.event_qr, name='event_qr'),
+    path('event/<slug:slug>/changes/', views.event_changes, name='event_changes'),
+    path('event/<slug:slug>/stream/', views.event_stream, name='event_stream'),
+    path('event/<slug:slug>/cars/', views.event_cars, name='event_cars'),
+    path('event/<slug:slug>/unassigned/', views.event_unassigned, name='event_unassigned'),
+    path('event/<slug:slug>/car-options/', views.event_car_options, name='event_car_options'),
     path('event/<slug:slug>/add-car/', views.add_car, name='add_car'),
     path('event/<slug:slug>/add-member/', views.add_member, name='add_member'),
     path('event/<slug:slug>/member/<int:member_id>/update/', views.update_member, name='update_member'),
     path('event/<slug:slug>/member/<int:member_id>/delete/', views.delete_member, name='delete_member'),
     path('event/<slug:slug>/car/<int:car_id>/delete/', views.delete_car, name='delete_car'),
+    path('event/<slug:slug>/auto-assign/', views.auto_assign, name='auto_assign'),
+    path('event/<slug:slug>/import/', views.import_data, name='import_data'),
+    path('event/<slug:slug>/export/', views.event_export, name='event_export'),
+    path('api/search/', api.search_events, name='api_search'),
+    path('api/events/<slug:slug>/', api.event_state, name='api_event'),
+    path('api/events/<slug:slug>/search/', api.search_event, name='api_event_search'),
+    path('api/events/<slug:slug>/batch/', api.batch, name='api_batch'),
+    path('api/events/<slug:slug>/cars/', api.create_car, name='api_cars'),
+    path('api/events/<slug:slug>/cars/<int:car_id>/', api.delete_car, name='api_car'),
+    path('api/events/<slug:slug>/members/', api.create_member, name='api_members'),
+    path('api/events/<slug:slug>/members/<int:member_id>/', api.member_detail, name='api_member'),
 ]
\ No newline at end of file
@@ -1,11 +1,34 @@
-from django.shortcuts import render, get_object_or_404, redirect
+import io
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib import messages
-from django.http import HttpResponseRedirect, HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError
+from django.http import (
+    Http404, HttpResponseBadRequest, HttpResponseRedirect, HttpResponse, JsonResponse, StreamingHttpResponse,
+)
+from django.middleware.csrf import get_token
 from django.urls import reverse
-from .models import Event, Car, Member
-from .forms import EventCreateForm, CarCreateForm, MemberCreateForm, MemberUpdateForm
-import qrcode
-from io import BytesIO
+from django.utils.safestring import mark_safe
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .models import Event, Car, CarFull, Member
+from .assignment import apply_assignment, plan_assignment
+from .forms import EventCreateForm, CarCreateForm, MemberCreateForm, MemberUpdateForm, AutoAssignForm, ImportForm
+from .exporting import FORMATS as EXPORT_FORMATS, roster_response
+from .dashboard import CAR_PAGE_SIZE, InvalidCursor
+from .fragments import (
+    car_options_response, car_page_response, cars_response, fragment_response, unassigned_page_response,
+    wants_fragments,
+)
+from .importing import IMPORTERS
+from .caching import CSRF_PLACEHOLDER, render_dashboard
+from .changes import ChangeStream, achanges_since
+from .conditional import (
+    QR_MAX_AGE, aget_event_state, event_etag, event_last_modified, preload_event_state, qr_etag, qr_format,
+)
+from .qr import QR_FORMATS, arender_qr
 
 
 def home(request):
@@ -22,48 +45,42 @@ def home(request):
     return render(request, 'events/home.html', {'form': form})
 
 
-def event_detail(request, slug):
+@cache_control(private=True, no_cache=True)
+@preload_event_state
+@condition(etag_func=event_etag, last_modified_func=event_last_modified)
+async def event_detail(request, slug):
     """Public event dashboard page."""
-    event = get_object_or_404(Event, slug=slug)
-    
-    # Get cars with their members
-    cars_queryset = Car.objects.filter(event=event).prefetch_related('members')
-    
-    # Sort cars: Cars first, then motorcycles with members, then motorcycles without members
-    cars = sorted(
-        cars_queryset,
-        key=lambda car: (
-            0 if (car.car_name or '').lower() != 'motorcycle' else (1 if car.members.count() > 0 else 2)
-        )
-    )
-    
-    # Get unassigned members
-    unassigned_members = Member.objects.filter(event=event, car__isnull=True)
-    
-    # Count cars and motorcycles
-    car_count = sum(1 for car in cars if (car.car_name or '').lower() != 'motorcycle')
-    motorcycle_count = sum(1 for car in cars if (car.car_name or '').lower() == 'motorcycle')
+    event = await aget_event_state(request, slug)
+    event_url = request.build_absolute_uri(reverse('event_detail', kwargs={'slug': slug}))
     
-    # Forms for adding new cars and members
-    car_form = CarCreateForm()
-    member_form = MemberCreateForm(event=event)
+    # The cache backend, template context processors and message storage are sync.
+    return await sync_to_async(_render_event_detail)(request, event, event_url)
+
+
+def _render_event_detail(request, event, event_url):
+    # Everything but the CSRF token (and the flash messages rendered by
+    # base.html) comes from the versioned dashboard cache.
+    dashboard = render_dashboard(event, event_url).replace(CSRF_PLACEHOLDER, get_token(request))
     
     context = {
         'event': event,
-        'cars': cars,
-        'unassigned_members': unassigned_members,
-        'car_count': car_count,
-        'motorcycle_count': motorcycle_count,
-        'car_form': car_form,
-        'member_form': member_form,
+        'dashboard': mark_safe(dashboard),
     }
     
     return render(request, 'events/event_detail.html', context)
 
 
+def _after_mutation(request, event, **changed):
+    """Redirect to the dashboard, or answer fetch callers with the changed fragments."""
+    if wants_fragments(request):
+        return fragment_response(request, event, **changed)
+    return redirect('event_detail', slug=event.slug)
+
+
 def add_car(request, slug):
     """Add a car to an event."""
     event = get_object_or_404(Event, slug=slug)
+    changed = {}
     
     if request.method == 'POST':
         form = CarCreateForm(request.POST)
@@ -71,16 +88,18 @@ def add_car(request, slug):
             car = form.save(commit=False)
             car.event = event
             car.save()
+            changed['cars'] = [car.pk]
             messages.success(request, f'Car "{car}" added successfully!')
         else:
             messages.error(request, 'Please correct the errors below.')
     
-    return redirect('event_detail', slug=slug)
+    return _after_mutation(request, event, **changed)
 
 
 def add_member(request, slug):
     """Add a member to an event."""
     event = get_object_or_404(Event, slug=slug)
+    changed = {}
     
     if request.method == 'POST':
         form = MemberCreateForm(request.POST, event=event)
@@ -91,89 +110,224 @@ def add_member(request, slug):
                 member.save()
                 car_info = f" to {member.car}" if member.car else " as unassigned"
                 messages.success(request, f'Member "{member.name}" added{car_info}!')
-            except Exception as e:
-                if 'UNIQUE constraint failed' in str(e):
-                    messages.error(request, f'A member named "{form.cleaned_data["name"]}" already exists in this event.')
-                else:
-                    messages.error(request, 'An error occurred while adding the member.')
+                changed = {'cars': [member.car_id], 'unassigned': [member.pk]}
+            except CarFull:
+                messages.error(request, f'{form.cleaned_data["car"]} just filled up. Please pick another car.')
+                changed['cars'] = [form.cleaned_data['car'].pk]
+            except IntegrityError:
+                messages.error(request, f'A member named "{form.cleaned_data["name"]}" already exists in this event.')
+        elif 'car' in form.errors:
+            messages.error(request, form.errors['car'][0])
         else:
             messages.error(request, 'Please correct the errors below.')
     
-    return redirect('event_detail', slug=slug)
+    return _after_mutation(request, event, **changed)
 
 
 def update_member(request, slug, member_id):
     """Update a member's car assignment."""
     event = get_object_or_404(Event, slug=slug)
     member = get_object_or_404(Member, id=member_id, event=event)
+    changed = {}
     
     if request.method == 'POST':
+        old_car_id = member.car_id
         form = MemberUpdateForm(request.POST, instance=member, event=event)
         if form.is_valid():
-            old_car = member.car
-            form.save()
             new_car = member.car
-            
-            if old_car != new_car:
-                if new_car:
-                    messages.success(request, f'"{member.name}" moved to {new_car}!')
-                else:
-                    messages.success(request, f'"{member.name}" is now unassigned!')
+            try:
+                form.save()
+            except CarFull:
+                messages.error(request, f'{new_car} just filled up. Please pick another car.')
+                changed['cars'] = [new_car.pk]
+            else:
+                changed = {'cars': [old_car_id, member.car_id], 'unassigned': [member.pk]}
+                if old_car_id != member.car_id:
+                    if new_car:
+                        messages.success(request, f'"{member.name}" moved to {new_car}!')
+                    else:
+                        messages.success(request, f'"{member.name}" is now unassigned!')
+        elif 'car' in form.errors:
+            messages.error(request, form.errors['car'][0])
         else:
             messages.error(request, 'Please correct the errors below.')
     
-    return redirect('event_detail', slug=slug)
+    return _after_mutation(request, event, **changed)
 
 
 def delete_member(request, slug, member_id):
     """Delete a member from an event."""
     event = get_object_or_404(Event, slug=slug)
     member = get_object_or_404(Member, id=member_id, event=event)
+    changed = {}
     
     if request.method == 'POST':
         member_name = member.name
+        changed = {'cars': [member.car_id], 'unassigned': [member.pk]}
         member.delete()
         messages.success(request, f'Member "{member_name}" removed from the event.')
     
-    return redirect('event_detail', slug=slug)
+    return _after_mutation(request, event, **changed)
 
 
 def delete_car(request, slug, car_id):
     """Delete a car from an event."""
     event = get_object_or_404(Event, slug=slug)
     car = get_object_or_404(Car, id=car_id, event=event)
+    changed = {}
     
     if request.method == 'POST':
         car_name = str(car)
+        passengers = list(car.members.values_list('pk', flat=True))
         # Members in this car will be unassigned automatically (SET_NULL)
         car.delete()
+        changed = {'removed_cars': [car_id], 'unassigned': passengers}
         messages.success(request, f'Car "{car_name}" removed from the event. Members were moved to unassigned.')
     
+    return _after_mutation(request, event, **changed)
+
+
+def auto_assign(request, slug):
+    """Seat unassigned members automatically, or preview the result."""
+    event = get_object_or_404(Event, slug=slug)
+    
+    if request.method == 'POST':
+        form = AutoAssignForm(request.POST)
+        if form.is_valid():
+            plan = plan_assignment(event, **form.cleaned_data)
+            if 'preview' in request.POST:
+                messages.info(request, f'Preview: {plan.summary()}')
+            else:
+                try:
+                    applied = apply_assignment(plan)
+                except CarFull:
+                    messages.error(request, 'Some cars filled up while assigning. Please try again.')
+                else:
+                    if applied:
+                        messages.success(request, f'Auto-assigned: {plan.summary()}')
+                    else:
+                        messages.error(request, plan.summary())
+        else:
+            messages.error(request, 'Please correct the errors below.')
+    
     return redirect('event_detail', slug=slug)
 
 
-def event_qr(request, slug):
-    """Generate QR code for the carpool arrangement page (not event poll)."""
+def import_data(request, slug):
+    """Import members or cars in bulk from an uploaded CSV or a pasted list."""
     event = get_object_or_404(Event, slug=slug)
     
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            if upload:
+                # Decoded as it is read, so large files are never held in memory.
+                lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+            else:
+                lines = io.StringIO(form.cleaned_data['text'])
+            try:
+                result = IMPORTERS[form.cleaned_data['kind']](event, lines)
+            except UnicodeDecodeError:
+                messages.error(request, 'The file must be UTF-8 encoded text or CSV.')
+            else:
+                level = messages.success if result.created else messages.warning
+                level(request, result.summary())
+        else:
+            messages.error(request, form.non_field_errors()[0] if form.non_field_errors() else 'Please correct the errors below.')
+    
+    return redirect('event_detail', slug=slug)
+
+
+def _car_ids(request):
+    return [int(value) for value in request.GET.getlist('id') if value.isdigit()][:CAR_PAGE_SIZE]
+
+
+def event_cars(request, slug):
+    """Car cards as JSON: the page after ?after=<cursor>, or the cars ?id=<car id>&id=..."""
+    event = get_object_or_404(Event.objects.only('id', 'slug'), slug=slug)
+    if 'id' in request.GET:
+        return cars_response(request, event, _car_ids(request))
+    try:
+        return car_page_response(request, event, request.GET.get('after'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid page cursor.')
+
+
+def event_unassigned(request, slug):
+    """Unassigned members as JSON, the page after ?after=<cursor>."""
+    event = get_object_or_404(Event.objects.only('id', 'slug'), slug=slug)
+    try:
+        return unassigned_page_response(request, event, request.GET.get('after'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid page cursor.')
+
+
+def event_car_options(request, slug):
+    """Car picker options matching ?q= as JSON, the page after ?after=<cursor>."""
+    event = get_object_or_404(Event.objects.only('id'), slug=slug)
+    try:
+        return car_options_response(event, request.GET.get('q', ''), request.GET.get('after'))
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid page cursor.')
+
+
+@cache_control(public=True, max_age=QR_MAX_AGE, immutable=True)
+@preload_event_state
+@condition(etag_func=qr_etag)
+async def event_qr(request, slug):
+    """Generate QR code for the carpool arrangement page (not event poll)."""
+    await aget_event_state(request, slug)
+    
     # Build the absolute URL for the event
     event_url = request.build_absolute_uri(reverse('event_detail', kwargs={'slug': slug}))
     
-    # Generate QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(event_url)
-    qr.make(fit=True)
+    # PNG by default; ?format=svg skips Pillow and scales for print
+    fmt = qr_format(request)
+    content = await arender_qr(event_url, fmt)
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save to BytesIO buffer
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
+    return HttpResponse(content, content_type=QR_FORMATS[fmt])
+
+
+def _parse_after(value):
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+async def event_changes(request, slug):
+    """Changes to an event after ?after=<seq>, as JSON."""
+    event = await aget_object_or_404(Event.objects.only('id'), slug=slug)
+    version, changes = await achanges_since(event.pk, _parse_after(request.GET.get('after')))
+    return JsonResponse({
+        'version': version,
+        'reset': changes is None,
+        'changes': changes or [],
+    })
+
+
+async def event_stream(request, slug):
+    """Server-Sent Events stream of changes to an event."""
+    event = await aget_object_or_404(Event.objects.only('id'), slug=slug)
+    after = _parse_after(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+    stream = ChangeStream(event.pk, after)
     
-    return HttpResponse(buffer, content_type='image/png')
+    # Under ASGI the stream awaits between polls instead of holding a thread.
+    response = StreamingHttpResponse(
+        aiter(stream) if isinstance(request, ASGIRequest) else iter(stream),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def event_export(request, slug):
+    """Download the event roster: ?format=csv|ndjson, &gzip=1 to compress."""
+    event = get_object_or_404(Event.objects.only('id', 'slug'), slug=slug)
+    fmt = request.GET.get('format', 'csv').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise Http404('Unsupported export format.')
+    compress = request.GET.get('gzip') in ('1', 'true', 'on')
+    return roster_response([event], f'{event.slug}-roster', fmt, compress)